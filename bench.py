@@ -0,0 +1,545 @@
+'''
+Benchmarks for pdfcli.
+
+commands  Generates synthetic PDFs from 10 to 100,000 pages in plain,
+          image-heavy, font-heavy and encrypted variants, then times every
+          subcommand on them in a fresh process and records its peak RSS.
+          The startup time of --help and of a usage error is measured too.
+          Results are written as JSON and compared against a baseline.
+
+              python bench.py commands --sizes 10,1000 --output results.json
+              python bench.py commands --baseline baseline.json --fail-on-regression
+
+crypto    Times the PyPDF2 PdfFileWriter.encrypt path pdfcli used to take
+          against the StreamingPdfWriter pipeline for every algorithm, and
+          the pipeline decrypting the files back.
+
+              python bench.py crypto --pages 50 --stream-size 1000000
+
+memory    Times the Python API on small documents held in memory against
+          the temp file round trip of writing them to disk, running on the
+          paths and reading the output back, with the read and write
+          syscalls each takes on Linux.
+
+              python bench.py memory --pages 1,10,100 --output memory.json
+'''
+import argparse
+import io
+import json
+import os
+import platform
+import py_compile
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+import PyPDF2
+import pdfcli
+import pdfcli_api
+
+PDFCLI_DIR = os.path.dirname(os.path.abspath(__file__))
+# Runs pdfcli like its console script does, from the compiled module. On
+# Linux the peak RSS of a child starts from the RSS of the process it was
+# forked from, so the child reports the high water mark of its own memory,
+# VmHWM, to the file named by BENCH_RSS_FILE as it exits.
+PDFCLI_COMMAND = [sys.executable, '-c', '''
+import atexit, os
+
+def report_rss():
+    with open('/proc/self/status') as status, open(os.environ['BENCH_RSS_FILE'], 'w') as rss:
+        rss.write(next(line.split()[1] for line in status if line.startswith('VmHWM:')))
+
+if os.path.exists('/proc/self/status'):
+    atexit.register(report_rss)
+from pdfcli import cli
+cli(prog_name='pdfcli')
+''']
+KEY = 'benchmark'
+VARIANTS = ('plain', 'images', 'fonts', 'encrypted')
+COMMANDS = ('merge', 'split', 'delete', 'reorder', 'rotate', 'encrypt', 'decrypt', 'info')
+STARTUP = (('help', ['--help']), ('command-help', ['rotate', '--help']), ('usage-error', ['rotate']))
+FONT_POOL = 50
+FONTS_PER_PAGE = 4
+
+
+class PdfGenerator(object):
+    '''
+    Writes a synthetic PDF object by object straight to a file, so documents
+    of any number of pages are generated in constant memory and far faster
+    than through PyPDF2.
+    '''
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._offsets = {}
+        self._position = 0
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def add(self, number, body, data=None):
+        self._offsets[number] = self._position
+        if data is None:
+            self._write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+        else:
+            self._write(b'%d 0 obj\n<< %s /Length %d >>\nstream\n%s\nendstream\nendobj\n'
+                        % (number, body, len(data), data))
+
+    def close(self, root_number):
+        xref_location = self._position
+        size = max(self._offsets) + 1
+        lines = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+        lines.extend(b'%010d 00000 n \n' % self._offsets[number] for number in range(1, size))
+        lines.append(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                     % (size, root_number, xref_location))
+        self._write(b''.join(lines))
+
+    def _write(self, data):
+        self._stream.write(data)
+        self._position += len(data)
+
+
+def generate_pdf(path, pages, variant, image_size=64, font_size=32768):
+    '''
+    Writes a PDF with the given number of pages to path. Every page has its
+    own uncompressed text content stream. 'images' pages also draw their own
+    image_size x image_size noise image, and 'fonts' pages use
+    FONTS_PER_PAGE of FONT_POOL embedded fonts of font_size bytes each.
+    '''
+    rng = random.Random(pages)
+    font_base = 4
+    page_base = font_base + (3 * FONT_POOL if variant == 'fonts' else 0)
+    per_page = 3 if variant == 'images' else 2
+
+    with open(path, 'wb') as pdf_fp:
+        generator = PdfGenerator(pdf_fp)
+        generator.add(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        kids = b' '.join(b'%d 0 R' % (page_base + per_page * i) for i in range(pages))
+        generator.add(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, pages))
+        generator.add(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+        if variant == 'fonts':
+            for i in range(FONT_POOL):
+                number = font_base + 3 * i
+                generator.add(number, b'<< /Type /Font /Subtype /TrueType /BaseFont /Bench%d '
+                                      b'/FontDescriptor %d 0 R >>' % (i, number + 1))
+                generator.add(number + 1, b'<< /Type /FontDescriptor /FontName /Bench%d /Flags 32 '
+                                          b'/FontBBox [0 0 1000 1000] /ItalicAngle 0 /Ascent 800 /Descent -200 '
+                                          b'/CapHeight 700 /StemV 80 /FontFile2 %d 0 R >>' % (i, number + 2))
+                generator.add(number + 2, b'/Length1 %d' % font_size,
+                              bytes(rng.getrandbits(8) for _ in range(font_size)))
+
+        for i in range(pages):
+            number = page_base + per_page * i
+            fonts = b'/F1 3 0 R'
+            xobjects = b''
+            lines = [b'BT /F1 12 Tf 72 %d Td (pdfcli benchmark page %d line %d) Tj ET' % (720 - 14 * line, i, line)
+                     for line in range(40)]
+            if variant == 'fonts':
+                for j in range(FONTS_PER_PAGE):
+                    font = (i + j) % FONT_POOL
+                    fonts += b' /B%d %d 0 R' % (font, font_base + 3 * font)
+                    lines.append(b'BT /B%d 10 Tf 72 %d Td (font %d) Tj ET' % (font, 100 - 12 * j, font))
+            if variant == 'images':
+                xobjects = b' /XObject << /Im0 %d 0 R >>' % (number + 2)
+                lines.append(b'q 200 0 0 200 200 300 cm /Im0 Do Q')
+            generator.add(number, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R '
+                                  b'/Resources << /Font << %s >>%s >> >>' % (number + 1, fonts, xobjects))
+            generator.add(number + 1, b'', b'\n'.join(lines))
+            if variant == 'images':
+                pixels = bytes(rng.getrandbits(8) for _ in range(image_size * image_size * 3))
+                generator.add(number + 2, b'/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB '
+                                          b'/BitsPerComponent 8 /Filter /FlateDecode' % (image_size, image_size),
+                              zlib.compress(pixels, 1))
+        generator.close(1)
+
+
+def encrypt_pdf(source, path, key=KEY):
+    '''
+    Writes source encrypted with rc4-128 to path through the pdfcli pipeline.
+    '''
+    with open(source, 'rb') as pdf_reader_fp, open(path, 'wb') as pdf_writer_fp:
+        pdf_reader = PyPDF2.PdfFileReader(pdf_reader_fp)
+        pdf_writer = pdfcli.StreamingPdfWriter(pdf_writer_fp,
+                                               encryption=pdfcli.StandardSecurityHandler.create(key, 'rc4-128'))
+        for page in pdf_reader.pages:
+            pdf_writer.add_page(page)
+        pdf_writer.close()
+
+
+def benchmark_file(work_dir, pages, variant):
+    '''
+    Returns the path of the synthetic PDF for pages and variant, generating
+    it unless an earlier run left it in work_dir.
+    '''
+    path = os.path.join(work_dir, '%s-%d.pdf' % (variant, pages))
+    if not os.path.exists(path):
+        if variant == 'encrypted':
+            encrypt_pdf(benchmark_file(work_dir, pages, 'plain'), path + '.tmp')
+        else:
+            generate_pdf(path + '.tmp', pages, variant)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def command_args(command, path, pages, out):
+    '''
+    Returns the pdfcli arguments of a benchmark of command on path.
+    '''
+    return {
+        'merge': ['merge', path, path, '--out', out],
+        'split': ['split', path, str(pages // 2), '--out-first', out, '--out-second', out + '.2'],
+        'delete': ['delete', path, 'odd' if pages > 1 else '0', '--out', out],
+        'reorder': ['reorder', path, '--reverse', '--out', out],
+        'rotate': ['rotate', path, 'clockwise', '--out', out],
+        'encrypt': ['encrypt', path, '--key', KEY, '--out', out],
+        'decrypt': ['decrypt', path, '--key', KEY, '--out', out],
+        'info': ['info', '--pages', path],
+    }[command]
+
+
+def run_command(args, timeout, env=None):
+    '''
+    Runs pdfcli with args in a new process and returns its exit code, wall
+    time in seconds and peak RSS in kilobytes.
+    '''
+    env = dict(env or os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [PDFCLI_DIR, env.get('PYTHONPATH')]))
+    rss_fd, env['BENCH_RSS_FILE'] = tempfile.mkstemp(suffix='.rss')
+    os.close(rss_fd)
+    start = time.perf_counter()
+    process = subprocess.Popen(PDFCLI_COMMAND + args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    exit_code = None
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            break
+        if time.perf_counter() - start > timeout:
+            process.kill()
+            pid, status, rusage = os.wait4(process.pid, 0)
+            break
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    # wait4 reaped the process, keep Popen from waiting on it again
+    process.returncode = exit_code
+    with open(env['BENCH_RSS_FILE']) as rss_fp:
+        reported = rss_fp.read()
+    os.remove(env['BENCH_RSS_FILE'])
+    if reported:
+        return exit_code, elapsed, int(reported)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return exit_code, elapsed, rusage.ru_maxrss // (1024 if sys.platform == 'darwin' else 1)
+
+
+def run_startup(runs, timeout):
+    '''
+    Returns the results of starting pdfcli runs times for each of STARTUP,
+    with the median wall time and the largest peak RSS.
+    '''
+    results = []
+    for name, command in STARTUP:
+        timings = [run_command(command, timeout) for _ in range(runs)]
+        elapsed = statistics.median(seconds for _, seconds, _ in timings)
+        max_rss = max(rss for _, _, rss in timings)
+        # Usage errors exit with 2, anything else means pdfcli failed to start.
+        exit_code = max(timings)[0] if name != 'usage-error' else max(timings)[0] - 2
+        results.append({'command': name, 'variant': 'startup', 'pages': 0, 'file_size': 0,
+                        'seconds': round(elapsed, 4), 'max_rss_kb': max_rss, 'exit_code': exit_code})
+        print('  %-12s %10.1f ms %10d KB' % (name, elapsed * 1000, max_rss))
+    return results
+
+
+def run_commands(args):
+    os.makedirs(args.work_dir, exist_ok=True)
+    out = os.path.join(args.work_dir, 'out.pdf')
+    env = dict(os.environ, PDFCLI_KEY=KEY)
+    results = []
+    if args.startup_runs:
+        print('startup, median of %d runs' % args.startup_runs)
+        results.extend(run_startup(args.startup_runs, args.timeout))
+    for variant in args.variants:
+        for pages in args.sizes:
+            if variant in ('images', 'fonts') and pages > args.heavy_max_pages:
+                continue
+            start = time.perf_counter()
+            path = benchmark_file(args.work_dir, pages, variant)
+            print('%s-%d: %d bytes, generated in %.1fs' % (variant, pages, os.path.getsize(path),
+                                                          time.perf_counter() - start))
+            for command in args.commands:
+                if (command == 'decrypt') != (variant == 'encrypted') and command in ('encrypt', 'decrypt'):
+                    continue
+                exit_code, elapsed, max_rss = run_command(command_args(command, path, pages, out), args.timeout,
+                                                          env if variant == 'encrypted' else None)
+                result = {'command': command, 'variant': variant, 'pages': pages, 'file_size': os.path.getsize(path),
+                          'seconds': round(elapsed, 4), 'max_rss_kb': max_rss, 'exit_code': exit_code}
+                results.append(result)
+                print('  %-8s %10.3f s %10d KB%s' % (command, elapsed, max_rss,
+                                                     '' if exit_code == 0 else '  exit code %s' % exit_code))
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pypdf2': PyPDF2.__version__ if hasattr(PyPDF2, '__version__') else None,
+        'cryptography': pdfcli.Cipher is not None,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output_fp:
+            json.dump(report, output_fp, indent=2)
+    regressions = 0
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_fp:
+            regressions = compare(json.load(baseline_fp)['results'], results, args.tolerance)
+    elif args.baseline:
+        with open(args.baseline, 'w') as baseline_fp:
+            json.dump(report, baseline_fp, indent=2)
+        print('Stored the results as baseline %s' % args.baseline)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+def compare(baseline, results, tolerance):
+    '''
+    Prints every result next to the baseline result of the same command,
+    variant and size, and returns the number of results that are slower or
+    use more memory than the baseline by more than tolerance.
+    '''
+    baseline = dict(((result['command'], result['variant'], result['pages']), result) for result in baseline)
+    regressions = 0
+    print('\n%-8s %-10s %8s %10s %10s' % ('command', 'variant', 'pages', 'time', 'rss'))
+    for result in results:
+        before = baseline.get((result['command'], result['variant'], result['pages']))
+        if before is None:
+            continue
+        time_ratio = result['seconds'] / max(before['seconds'], 1e-6)
+        rss_ratio = result['max_rss_kb'] / max(before['max_rss_kb'], 1)
+        regressed = time_ratio > 1 + tolerance or rss_ratio > 1 + tolerance or \
+            (result['exit_code'] != 0 and before['exit_code'] == 0)
+        regressions += regressed
+        print('%-8s %-10s %8d %9.2fx %9.2fx%s' % (result['command'], result['variant'], result['pages'], time_ratio,
+                                                  rss_ratio, '  REGRESSION' if regressed else ''))
+    print('%d regressions beyond %d%%' % (regressions, tolerance * 100))
+    return regressions
+
+
+def synthetic_pdf(pages, stream_size):
+    '''
+    Returns the bytes of a PDF with the given number of pages, each with an
+    uncompressed content stream of about stream_size bytes.
+    '''
+    generator_fp = io.BytesIO()
+    generator = PdfGenerator(generator_fp)
+    generator.add(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    kids = b' '.join(b'%d 0 R' % (3 + 2 * i) for i in range(pages))
+    generator.add(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, pages))
+    line = b'BT /F1 12 Tf 72 720 Td (pdfcli benchmark) Tj ET\n'
+    for i in range(pages):
+        generator.add(3 + 2 * i, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R >>'
+                      % (4 + 2 * i))
+        generator.add(4 + 2 * i, b'', line * (stream_size // len(line) + 1))
+    generator.close(1)
+    return generator_fp.getvalue()
+
+
+def pypdf2_encrypt(data, key):
+    pdf_reader = PyPDF2.PdfFileReader(io.BytesIO(data))
+    pdf_writer = PyPDF2.PdfFileWriter()
+    pdf_writer.appendPagesFromReader(pdf_reader)
+    pdf_writer.encrypt(key)
+    output = io.BytesIO()
+    pdf_writer.write(output)
+    return output.getvalue()
+
+
+def pipeline_encrypt(data, key, algorithm, workers):
+    pdf_reader = PyPDF2.PdfFileReader(io.BytesIO(data))
+    output = io.BytesIO()
+    pdf_writer = pdfcli.StreamingPdfWriter(output, workers=workers,
+                                           encryption=pdfcli.StandardSecurityHandler.create(key, algorithm))
+    for page in pdf_reader.pages:
+        pdf_writer.add_page(page)
+    pdf_writer.close()
+    return output.getvalue()
+
+
+def pipeline_decrypt(data, key, workers):
+    pdf_reader = PyPDF2.PdfFileReader(io.BytesIO(data))
+    security_handler = pdfcli._security_handler(pdf_reader, key)
+    output = io.BytesIO()
+    pdf_writer = pdfcli.StreamingPdfWriter(output, workers=workers)
+    pdf_writer.add_decryption(pdf_reader, security_handler)
+    for page in pdf_reader.flattenedPages:
+        pdf_writer.add_page(page)
+    pdf_writer.close()
+    return output.getvalue()
+
+
+def measure(name, size, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    print('%-28s %8.2f s %10.1f MB/s' % (name, elapsed, size / elapsed / 1e6))
+    return result
+
+
+def run_crypto(args):
+    data = synthetic_pdf(args.pages, args.stream_size)
+    print('%d pages, %d bytes, %d workers, cryptography %s' % (args.pages, len(data), args.workers,
+                                                                'installed' if pdfcli.Cipher else 'missing'))
+    if not args.skip_pypdf2:
+        measure('pypdf2 encrypt rc4-128', len(data), pypdf2_encrypt, data, KEY)
+    algorithms = ['rc4-128'] + (['aes-128', 'aes-256'] if pdfcli.Cipher else [])
+    for algorithm in algorithms:
+        encrypted = measure('pipeline encrypt %s' % algorithm, len(data), pipeline_encrypt, data, KEY, algorithm,
+                            args.workers)
+        measure('pipeline decrypt %s' % algorithm, len(data), pipeline_decrypt, encrypted, KEY, args.workers)
+
+
+MEMORY_OPERATIONS = {
+    'rotate': lambda src, out: pdfcli_api.rotate(src, out=out),
+    'delete': lambda src, out: pdfcli_api.delete(src, '0', out=out),
+    'compress': lambda src, out: pdfcli_api.compress(src, out=out),
+    'merge': lambda src, out: pdfcli_api.merge([src, src], out=out),
+    'encrypt': lambda src, out: pdfcli_api.encrypt(src, KEY, out=out),
+    'decrypt': lambda src, out: pdfcli_api.decrypt(src, KEY, out=out),
+    'info': lambda src, out: pdfcli_api.info(src),
+}
+
+
+def syscalls():
+    '''
+    Returns the read and write syscalls made by this process so far, or
+    None where /proc/self/io is missing.
+    '''
+    try:
+        with open('/proc/self/io') as io_fp:
+            counters = dict(line.split(': ') for line in io_fp.read().splitlines())
+    except OSError:
+        return None
+    return int(counters['syscr']), int(counters['syscw'])
+
+
+def temp_file_round_trip(operation, data, temp_dir):
+    '''
+    Runs operation the way callers without in-memory support had to.
+    '''
+    with tempfile.NamedTemporaryFile(dir=temp_dir, suffix='.pdf', delete=False) as src_fp:
+        src_fp.write(data)
+    out = src_fp.name + '.out.pdf'
+    try:
+        result = operation(src_fp.name, out)
+        if result is None:
+            with open(out, 'rb') as out_fp:
+                result = out_fp.read()
+        return result
+    finally:
+        os.unlink(src_fp.name)
+        if os.path.exists(out):
+            os.unlink(out)
+
+
+def measure_calls(function, runs):
+    '''
+    Returns the mean seconds, read syscalls and write syscalls of a call.
+    '''
+    before = syscalls()
+    start = time.perf_counter()
+    for _ in range(runs):
+        function()
+    elapsed = (time.perf_counter() - start) / runs
+    after = syscalls()
+    if before is None or after is None:
+        return elapsed, None, None
+    # The first read of /proc/self/io is counted in the second.
+    return elapsed, (after[0] - before[0] - 1) / runs, (after[1] - before[1]) / runs
+
+
+def run_memory(args):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for pages in args.pages:
+            plain = synthetic_pdf(pages, args.stream_size)
+            encrypted = pdfcli_api.encrypt(plain, KEY)
+            for name in args.operations:
+                operation = MEMORY_OPERATIONS[name]
+                data = encrypted if name == 'decrypt' else plain
+                # Warm up caches and lazy imports before measuring.
+                operation(data, None)
+                temp_file = measure_calls(lambda: temp_file_round_trip(operation, data, temp_dir), args.runs)
+                memory = measure_calls(lambda: operation(data, None), args.runs)
+                result = {'operation': name, 'pages': pages, 'size': len(data)}
+                for mode, (seconds, reads, writes) in (('temp_file', temp_file), ('memory', memory)):
+                    result.update({mode + '_seconds': seconds, mode + '_read_syscalls': reads,
+                                   mode + '_write_syscalls': writes})
+                results.append(result)
+                print('%-9s %6d pages %9d bytes  temp file %8.2f ms  memory %8.2f ms  %5.1f%% faster%s' % (
+                    name, pages, len(data), temp_file[0] * 1000, memory[0] * 1000,
+                    100 * (1 - memory[0] / temp_file[0]),
+                    '' if temp_file[1] is None else '  syscalls %.1f/%.1f -> %.1f/%.1f' % (
+                        temp_file[1], temp_file[2], memory[1], memory[2])))
+    if args.output:
+        with open(args.output, 'w') as output_fp:
+            json.dump({'python': platform.python_version(), 'runs': args.runs, 'results': results}, output_fp,
+                      indent=2)
+
+
+def comma_list(choices=None, type=str):
+    def parse(value):
+        values = [type(item) for item in value.split(',') if item]
+        if choices is not None and not set(values) <= set(choices):
+            raise argparse.ArgumentTypeError("choose from %s" % ', '.join(choices))
+        return values
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='suite')
+    subparsers.required = True
+
+    commands = subparsers.add_parser('commands', help="Time every subcommand on generated PDFs.")
+    commands.add_argument('--sizes', type=comma_list(type=int), default=[10, 1000, 100000],
+                          help="Comma separated page counts. defaults to 10,1000,100000")
+    commands.add_argument('--variants', type=comma_list(VARIANTS), default=list(VARIANTS))
+    commands.add_argument('--commands', type=comma_list(COMMANDS), default=list(COMMANDS))
+    commands.add_argument('--heavy-max-pages', type=int, default=10000,
+                          help="Largest size generated for the images and fonts variants. defaults to 10000")
+    commands.add_argument('--work-dir', default='.bench', help="Where generated PDFs are kept between runs.")
+    commands.add_argument('--startup-runs', type=int, default=20,
+                          help="Times pdfcli is started for each startup measurement, 0 skips them. defaults to 20")
+    commands.add_argument('--timeout', type=float, default=900, help="Seconds before a command is killed.")
+    commands.add_argument('--output', help="JSON file the results are written to.")
+    commands.add_argument('--baseline', help="JSON results to compare against, created from this run if missing.")
+    commands.add_argument('--tolerance', type=float, default=0.25,
+                          help="Slowdown or memory growth over the baseline reported as a regression. defaults to 0.25")
+    commands.add_argument('--fail-on-regression', action='store_true')
+    commands.set_defaults(function=run_commands)
+
+    crypto = subparsers.add_parser('crypto', help="Compare encryption throughput with plain PyPDF2.")
+    crypto.add_argument('--pages', type=int, default=20)
+    crypto.add_argument('--stream-size', type=int, default=500000, help="Bytes of content stream per page.")
+    crypto.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    crypto.add_argument('--skip-pypdf2', action='store_true', help="Skip the slow PyPDF2 baseline.")
+    crypto.set_defaults(function=run_crypto)
+
+    memory = subparsers.add_parser('memory', help="Compare in-memory API calls with temp file round trips.")
+    memory.add_argument('--pages', type=comma_list(type=int), default=[1, 10, 100],
+                        help="Comma separated page counts. defaults to 1,10,100")
+    memory.add_argument('--stream-size', type=int, default=2000, help="Bytes of content stream per page.")
+    memory.add_argument('--operations', type=comma_list(MEMORY_OPERATIONS), default=list(MEMORY_OPERATIONS))
+    memory.add_argument('--runs', type=int, default=50, help="Calls averaged per measurement. defaults to 50")
+    memory.add_argument('--output', help="JSON file the results are written to.")
+    memory.set_defaults(function=run_memory)
+
+    args = parser.parse_args()
+    # Make sure the commands import pdfcli from up to date bytecode, as an
+    # installed package does, rather than compiling it on every start.
+    py_compile.compile(os.path.join(PDFCLI_DIR, 'pdfcli.py'), doraise=True)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main()
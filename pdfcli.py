@@ -1,170 +1,547 @@
+import codecs
+import collections
+import contextlib
+import functools
+import importlib
+import importlib.util
+import io
+import itertools
+import json
+import mmap
+import os
+import re
+import signal
+import struct
 import sys
+import time
+import zlib
 import click
-import PyPDF2
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class _LazyImport(object):
+    '''
+    Stands in for a module, or for an attribute of one given as
+    'module:attribute', that is only imported once it is first used. It then
+    replaces itself in the globals of pdfcli under name, so later uses go
+    straight to the real object. Further locations are tried in order when
+    a location cannot be imported.
+
+    Most invocations only parse arguments, print help or fail validation,
+    and should not pay for importing PyPDF2, cryptography or the
+    concurrency and networking modules.
+    '''
+
+    def __init__(self, name, *locations):
+        self._name = name
+        self._locations = locations
+
+    def _load(self):
+        for location in self._locations:
+            module_name, _, attribute = location.partition(':')
+            try:
+                obj = importlib.import_module(module_name)
+                if attribute:
+                    obj = getattr(obj, attribute)
+                elif module_name.split('.')[0] == self._name:
+                    # Like import concurrent.futures, bind the top-level package.
+                    obj = sys.modules[self._name]
+                break
+            except (ImportError, AttributeError):
+                if location == self._locations[-1]:
+                    raise
+        if globals().get(self._name) is self:
+            globals()[self._name] = obj
+        return obj
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+
+def _lazy_import(name, *locations):
+    '''
+    Returns a _LazyImport of locations, or None when the package of the
+    first one is not installed, which is looked up without importing it.
+    '''
+    if importlib.util.find_spec(locations[0].partition(':')[0].split('.')[0]) is None:
+        return None
+    return _LazyImport(name, *locations)
+
+
+PyPDF2 = _LazyImport('PyPDF2', 'PyPDF2')
+concurrent = _LazyImport('concurrent', 'concurrent.futures')
+cProfile = _LazyImport('cProfile', 'cProfile')
+csv = _LazyImport('csv', 'csv')
+glob = _LazyImport('glob', 'glob')
+hashlib = _LazyImport('hashlib', 'hashlib')
+pstats = _LazyImport('pstats', 'pstats')
+shutil = _LazyImport('shutil', 'shutil')
+socket = _LazyImport('socket', 'socket')
+socketserver = _LazyImport('socketserver', 'socketserver')
+tempfile = _LazyImport('tempfile', 'tempfile')
+
+Cipher = _lazy_import('Cipher', 'cryptography.hazmat.primitives.ciphers:Cipher')
+algorithms = _lazy_import('algorithms', 'cryptography.hazmat.primitives.ciphers.algorithms')
+modes = _lazy_import('modes', 'cryptography.hazmat.primitives.ciphers.modes')
+ARC4 = _lazy_import('ARC4', 'cryptography.hazmat.decrepit.ciphers.algorithms:ARC4',
+                    'cryptography.hazmat.primitives.ciphers.algorithms:ARC4')
+yaml = _lazy_import('yaml', 'yaml')
+
+# The commands batch can run, filled in from _BATCH_OPERATIONS once the
+# operations are defined.
+_BATCH_COMMANDS = []
+
+
+class Password(click.ParamType):
+    '''
+    A password option that can be repeated. Several passwords given through
+    an environment variable are separated by newlines rather than
+    whitespace, so passwords may contain spaces.
+    '''
+    name = 'password'
+    envvar_list_splitter = '\n'
+
+
+def _key_option(function):
+    '''
+    Adds the repeatable --key option of the commands reading PDFs.
+    '''
+    return click.option('-k', '--key',
+                        multiple=True,
+                        type=Password(),
+                        envvar='PDFCLI_KEY',
+                        help="Password to decrypt PDF with, repeat it to try several in order. Can also be specified "
+                             "as environment variable PDFCLI_KEY, one password per line")(function)
+
+
+def _output_options(linearize=True):
+    '''
+    Returns a decorator adding the options of the commands writing a PDF that
+    _write_options reads: --compress, --xref-stream and, unless the output
+    cannot be linearized, --linearize.
+    '''
+    options = [click.option('--compress',
+                            type=click.IntRange(1, 9),
+                            help="Re-deflate streams of the output at this zlib level, from 1 (fastest) to 9 "
+                                 "(smallest)"),
+               click.option('--xref-stream/--no-xref-stream',
+                            default=False,
+                            help="Pack objects into compressed object streams indexed by a cross-reference stream "
+                                 "(PDF 1.5)")]
+    if linearize:
+        options.append(click.option('--linearize/--no-linearize',
+                                    default=False,
+                                    help="Write a linearized pdf (fast web view) whose first page can be shown "
+                                         "before the rest is downloaded"))
+
+    def decorator(function):
+        # Applied last to first so the options are listed in this order.
+        for option in reversed(options):
+            function = option(function)
+        return function
+    return decorator
 
 
 @click.group()
-def cli():
-    pass
+@click.option('--remote',
+              envvar='PDFCLI_REMOTE',
+              type=click.Path(),
+              help="Socket of a running pdfcli serve daemon to send the command to instead of running it in this "
+                   "process. Can also be specified as environment variable PDFCLI_REMOTE")
+@click.option('--mmap/--no-mmap', 'use_mmap',
+              envvar='PDFCLI_MMAP',
+              default=False,
+              help="Memory-map input PDFs instead of reading them through buffered file objects. Can also be "
+                   "specified as environment variable PDFCLI_MMAP")
+@click.option('--cache/--no-cache',
+              envvar='PDFCLI_CACHE',
+              default=False,
+              help="Keep the parsed structure of input PDFs in an on-disk cache so later commands skip parsing it. "
+                   "Can also be specified as environment variable PDFCLI_CACHE")
+@click.option('--cache-dir',
+              envvar='PDFCLI_CACHE_DIR',
+              type=click.Path(file_okay=False),
+              help="Directory of the parse cache. Can also be specified as environment variable PDFCLI_CACHE_DIR. "
+                   "defaults to ~/.cache/pdfcli")
+@click.option('--cache-size',
+              envvar='PDFCLI_CACHE_SIZE',
+              default=64,
+              type=click.IntRange(min=0),
+              help="Size of the parse cache in megabytes, least recently used entries are evicted beyond it. "
+                   "Can also be specified as environment variable PDFCLI_CACHE_SIZE. defaults to 64")
+@click.option('--stats/--no-stats',
+              envvar='PDFCLI_STATS',
+              default=False,
+              help="Print the time spent parsing, copying pages and writing, the bytes and objects read and written "
+                   "and the peak memory of the command on standard error. Can also be specified as environment "
+                   "variable PDFCLI_STATS")
+@click.option('--stats-format',
+              envvar='PDFCLI_STATS_FORMAT',
+              default='text',
+              type=click.Choice(['text', 'json']),
+              help="Format of the --stats report. Can also be specified as environment variable "
+                   "PDFCLI_STATS_FORMAT. defaults to text")
+@click.option('--profile',
+              envvar='PDFCLI_PROFILE',
+              type=click.Path(dir_okay=False),
+              help="Profile the command with cProfile, write the pstats data to this path and print the most "
+                   "expensive functions on standard error. Can also be specified as environment variable "
+                   "PDFCLI_PROFILE")
+@click.pass_context
+def cli(ctx, remote, use_mmap, cache, cache_dir, cache_size, stats, stats_format, profile):
+    ctx.obj = {'remote': remote,
+               'mmap': use_mmap,
+               'cache': cache,
+               'cache_dir': cache_dir,
+               'cache_size': cache_size}
+    if remote and (stats or profile):
+        # The command runs in the daemon, there would be nothing to measure.
+        raise click.UsageError("--stats and --profile cannot be used with --remote.")
+    if stats:
+        _start_stats(ctx, stats_format)
+    if profile:
+        _start_profile(ctx, profile)
 
 
 @cli.command()
 @click.argument('files',
                 nargs=-1,
-                type=click.Path(exists=True))
+                type=click.Path(exists=True, allow_dash=True))
 @click.option('-o', '--out',
               default='out.pdf',
-              type=click.Path(),
-              help="The path of the output pdf. defaults to out.pdf")
-@click.option('-k', '--key',
-              envvar='PDFCLI_KEY',
-              help="Password to decrypt PDF with. Can also be specified as environment variable PDFCLI_KEY")
-def merge(files, out, key):
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out.pdf")
+@_key_option
+@click.option('--stream/--no-stream',
+              default=False,
+              help="Copy one input at a time straight to the output so memory stays flat however many files are merged")
+@click.option('--dedupe/--no-dedupe',
+              default=False,
+              help="Write identical fonts, images and other streams shared between the inputs only once. "
+                   "Implies --stream")
+@_output_options()
+def merge(files, out, key, stream, dedupe, compress, xref_stream, linearize):
     '''
     Merge a set of PDF files together.
     '''
-    _merge(*files,
-           out=out,
-           key=key)
+    _dispatch('merge',
+              *files,
+              out=out,
+              key=key,
+              stream=stream,
+              dedupe=dedupe,
+              compress=compress,
+              xref_stream=xref_stream,
+              linearize=linearize)
 
 
 @cli.command()
 @click.argument('file',
                 nargs=1,
-                type=click.Path(exists=True))
+                type=click.Path(exists=True, allow_dash=True))
 @click.option('-o', '--out',
               default='out.pdf',
-              type=click.Path(),
-              help="The path of the output pdf. defaults to out.pdf")
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out.pdf")
 @click.option('-d', '--order',
               type=click.STRING,
               help="The reordering of the pdf as a list. For example if you have three pages and you want to place the"
                    "2nd page first, the first page last and the last page second then you would write:"
-                   "pdfcli reorder 2 3 1")
+                   "pdfcli reorder 2 3 1. Ranges such as 10-0, negative indexes, steps such as 0-9:2 and even or odd "
+                   "can be used as well.")
 @click.option('--reverse/--no-reverse', default=False, help="Set to True to reverse the order of the PDFs")
-@click.option('-k', '--key',
-              envvar='PDFCLI_KEY',
-              help="Password to decrypt PDF with. Can also be specified as environment variable PDFCLI_KEY")
-def reorder(file, order, reverse, out, key):
+@_key_option
+@click.option('--incremental/--no-incremental',
+              default=False,
+              help="Append only the changed objects to a copy of the original file as a PDF incremental update")
+@_output_options()
+def reorder(file, order, reverse, out, key, incremental, compress, xref_stream, linearize):
     '''
     Reorder the pages in a PDF.
     '''
-    _reorder(file=file,
-             order=order,
-             reverse=reverse,
-             out=out,
-             key=key)
+    _dispatch('reorder',
+              file=file,
+              order=order,
+              reverse=reverse,
+              out=out,
+              key=key,
+              incremental=incremental,
+              compress=compress,
+              xref_stream=xref_stream,
+              linearize=linearize)
 
 
 @cli.command()
 @click.argument('file',
                 nargs=1,
-                type=click.Path(exists=True))
+                type=click.Path(exists=True, allow_dash=True))
 @click.argument('delete-indexes',
                 type=click.STRING)
 @click.option('-o', '--out',
               default='out.pdf',
-              type=click.Path(),
-              help="The path of the output pdf. defaults to out.pdf")
-@click.option('-k', '--key',
-              envvar='PDFCLI_KEY',
-              help="Password to decrypt PDF with. Can also be specified as environment variable PDFCLI_KEY")
-def delete(file, delete_indexes, out, key):
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out.pdf")
+@_key_option
+@click.option('--incremental/--no-incremental',
+              default=False,
+              help="Append only the changed objects to a copy of the original file as a PDF incremental update")
+@_output_options()
+def delete(file, delete_indexes, out, key, incremental, compress, xref_stream, linearize):
     '''
-    Delete pages in a PDF.
+    Delete pages in a PDF. DELETE_INDEXES is a comma separated list of indexes, ranges such as 10-90000, negative
+    indexes counting from the last page, steps such as 0-9:2, even or odd.
     '''
-    if delete_indexes:
-        try:
-            delete_indexes = delete_indexes.split(",")
-            delete_indexes = [int(num) for num in delete_indexes]
-        except ValueError as e:
-            raise click.BadParameter("delete indexes must be a list of integers representing indexes in PDF.")
-    else:
-        raise click.BadParameter("must specify indexes to delete.")
-
-    _delete(file=file,
-            delete=delete_indexes,
-            out=out,
-            key=key)
+    _dispatch('delete',
+              file=file,
+              delete=_parse_delete_indexes(delete_indexes),
+              out=out,
+              key=key,
+              incremental=incremental,
+              compress=compress,
+              xref_stream=xref_stream,
+              linearize=linearize)
 
 
 @cli.command()
 @click.argument('file',
                 nargs=1,
-                type=click.Path(exists=True))
+                type=click.Path(exists=True, allow_dash=True))
 @click.argument('split-index',
                 nargs=1,
                 default=0,
                 type=click.INT)
 @click.option('--out-first',
               default='out1.pdf',
-              type=click.Path(),
-              help="The path of the output pdf. defaults to out1.pdf")
-@click.option('-k', '--key',
-              envvar='PDFCLI_KEY',
-              help="Password to decrypt PDF with. Can also be specified as environment variable PDFCLI_KEY")
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out1.pdf")
+@_key_option
 @click.option('--out-second',
               default='out2.pdf',
-              type=click.Path(),
-              help="The path of the output pdf. defaults to out2.pdf")
-def split(file, split_index, out_first, out_second, key):
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out2.pdf")
+@click.option('--stream/--no-stream',
+              default=False,
+              help="Write each object to disk as soon as it is copied instead of building the outputs in memory")
+@_output_options()
+def split(file, split_index, out_first, out_second, key, stream, compress, xref_stream, linearize):
     '''Split a PDF file into two.'''
-    _split(file=file,
-           index=split_index,
-           out_first=out_first,
-           out_second=out_second,
-           key=key)
+    _dispatch('split',
+              file=file,
+              index=split_index,
+              out_first=out_first,
+              out_second=out_second,
+              key=key,
+              stream=stream,
+              compress=compress,
+              xref_stream=xref_stream,
+              linearize=linearize)
+
+
+@cli.command()
+@click.argument('file',
+                nargs=1,
+                type=click.Path(exists=True, allow_dash=True))
+@click.option('-n', '--every',
+              type=click.IntRange(min=1),
+              help="Write one output pdf for every N pages.")
+@click.option('-r', '--ranges',
+              type=click.STRING,
+              help="Comma separated page ranges, one output pdf per range. For example 0-9,10-19,20-,even")
+@click.option('-o', '--out',
+              default='out_{}.pdf',
+              type=click.STRING,
+              help="Pattern for the output pdfs where {} is replaced by the number of the chunk. defaults to out_{}.pdf")
+@click.option('-w', '--workers',
+              default=1,
+              type=click.IntRange(min=1),
+              help="Number of worker processes writing outputs in parallel. defaults to 1")
+@click.option('--stream/--no-stream',
+              default=False,
+              help="Write each object to disk as soon as it is copied instead of building the outputs in memory")
+@_key_option
+@_output_options()
+def burst(file, every, ranges, out, workers, stream, key, compress, xref_stream, linearize):
+    '''
+    Split a PDF file into many files. Without --every or --ranges every page is written to its own file.
+    '''
+    _dispatch('burst',
+              file=file,
+              every=every,
+              ranges=ranges,
+              out=out,
+              workers=workers,
+              stream=stream,
+              key=key,
+              compress=compress,
+              xref_stream=xref_stream,
+              linearize=linearize)
 
 
 @cli.command()
 @click.argument('file',
                 nargs=1,
-                type=click.Path(exists=True))
+                type=click.Path(exists=True, allow_dash=True))
 @click.argument('direction',
                 nargs=1,
                 type=click.Choice(['clockwise', 'counter-clockwise']))
-@click.option('-k', '--key',
-              envvar='PDFCLI_KEY',
-              help="Password to decrypt PDF with. Can also be specified as environment variable PDFCLI_KEY")
+@_key_option
 @click.option('-o', '--out',
               default='out.pdf',
-              type=click.Path(),
-              help="The path of the output pdf. defaults to out.pdf")
-def rotate(file, direction, out, key):
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out.pdf")
+@click.option('--incremental/--no-incremental',
+              default=False,
+              help="Append only the changed objects to a copy of the original file as a PDF incremental update")
+@_output_options()
+def rotate(file, direction, out, key, incremental, compress, xref_stream, linearize):
     '''
     Rotate a PDF file clockwise or counter-clockwise.
     '''
-    _rotate(file=file,
-            direction=direction,
-            out=out,
-            key=key)
+    _dispatch('rotate',
+              file=file,
+              direction=direction,
+              out=out,
+              key=key,
+              incremental=incremental,
+              compress=compress,
+              xref_stream=xref_stream,
+              linearize=linearize)
 
 
 @cli.command()
 @click.argument('file',
                 nargs=1,
-                type=click.Path(exists=True))
+                type=click.Path(exists=True, allow_dash=True))
 @click.option('-o', '--out',
               default='out.pdf',
-              type=click.Path(),
-              help="The path of the output pdf. defaults to out.pdf")
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out.pdf")
+@_key_option
+@click.option('-w', '--workers',
+              default=os.cpu_count() or 1,
+              type=click.IntRange(min=1),
+              help="Number of threads used to hash streams. defaults to the number of CPUs")
+@_output_options()
+def optimize(file, out, key, workers, compress, xref_stream, linearize):
+    '''
+    Rewrite a PDF keeping a single copy of identical fonts, images and streams.
+    '''
+    _dispatch('optimize',
+              file=file,
+              out=out,
+              key=key,
+              workers=workers,
+              compress=compress,
+              xref_stream=xref_stream,
+              linearize=linearize)
+
+
+@cli.command()
+@click.argument('file',
+                nargs=1,
+                type=click.Path(exists=True, allow_dash=True))
+@click.option('-o', '--out',
+              default='out.pdf',
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out.pdf")
+@click.option('-l', '--level',
+              default=9,
+              type=click.IntRange(1, 9),
+              help="zlib compression level, from 1 (fastest) to 9 (smallest). defaults to 9")
+@_key_option
+@click.option('-w', '--workers',
+              default=os.cpu_count() or 1,
+              type=click.IntRange(min=1),
+              help="Number of threads compressing streams. defaults to the number of CPUs")
+@click.option('--xref-stream/--no-xref-stream',
+              default=True,
+              help="Pack objects into compressed object streams indexed by a cross-reference stream (PDF 1.5). "
+                   "defaults to on")
+@click.option('--linearize/--no-linearize',
+              default=False,
+              help="Write a linearized pdf (fast web view) whose first page can be shown before the rest is "
+                   "downloaded. Turns off --xref-stream")
+def compress(file, out, level, key, workers, xref_stream, linearize):
+    '''
+    Re-deflate the uncompressed and Flate compressed streams of a PDF.
+    '''
+    _dispatch('compress',
+              file=file,
+              out=out,
+              level=level,
+              key=key,
+              workers=workers,
+              xref_stream=xref_stream,
+              linearize=linearize)
+
+
+@cli.command()
+@click.argument('file',
+                nargs=1,
+                type=click.Path(exists=True, allow_dash=True))
+@click.option('-o', '--out',
+              default='out.pdf',
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out.pdf")
+@_key_option
+def linearize(file, out, key):
+    '''
+    Rewrite a PDF for fast web view, so its first page shows before the whole file is downloaded.
+    '''
+    _dispatch('linearize',
+              file=file,
+              out=out,
+              key=key)
+
+
+@cli.command()
+@click.argument('file',
+                nargs=1,
+                type=click.Path(exists=True, allow_dash=True))
+@click.option('-o', '--out',
+              default='out.pdf',
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out.pdf")
 @click.option('-k', '--key',
               prompt=True,
               hide_input=True,
               confirmation_prompt=True,
               envvar='PDFCLI_KEY',
               help="Password to encrypt pdf with. Can also be specified as environment variable PDFCLI_KEY")
-def encrypt(file, out, key):
+@click.option('-a', '--algorithm',
+              default='rc4-128',
+              type=click.Choice(['rc4-128', 'aes-128', 'aes-256']),
+              help="Encryption algorithm. The AES algorithms need the cryptography package. defaults to rc4-128")
+@click.option('-w', '--workers',
+              default=os.cpu_count() or 1,
+              type=click.IntRange(min=1),
+              help="Number of threads encrypting streams. defaults to the number of CPUs")
+@_output_options(linearize=False)
+def encrypt(file, out, key, algorithm, workers, compress, xref_stream):
     '''
     Encrypts a PDF file given a key.
     '''
-    _encrypt(file=file, out=out, key=key)
+    _dispatch('encrypt',
+              file=file,
+              out=out,
+              key=key,
+              algorithm=algorithm,
+              workers=workers,
+              compress=compress,
+              xref_stream=xref_stream)
 
 
 @cli.command()
 @click.argument('file',
                 nargs=1,
-                type=click.Path(exists=True))
+                type=click.Path(exists=True, allow_dash=True))
 @click.option('-k', '--key',
               prompt=True,
               hide_input=True,
@@ -173,43 +550,257 @@ def encrypt(file, out, key):
               help="Password to decrypt PDF with. Can also be specified as environment variable PDFCLI_KEY")
 @click.option('-o', '--out',
               default='out.pdf',
-              type=click.Path(),
-              help="The path of the output pdf. defaults to out.pdf")
-def decrypt(file, out, key):
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out.pdf")
+@click.option('-w', '--workers',
+              default=os.cpu_count() or 1,
+              type=click.IntRange(min=1),
+              help="Number of threads decrypting streams. defaults to the number of CPUs")
+@_output_options()
+def decrypt(file, out, key, workers, compress, xref_stream, linearize):
     '''
     Decrypts a PDF file given a key.
     '''
-    _decrypt(file=file, out=out, key=key)
+    _dispatch('decrypt',
+              file=file,
+              out=out,
+              key=key,
+              workers=workers,
+              compress=compress,
+              xref_stream=xref_stream,
+              linearize=linearize)
+
+
+@cli.command()
+@click.argument('files',
+                nargs=-1,
+                required=True,
+                type=click.Path(exists=True, allow_dash=True))
+@click.option('-k', '--key',
+              prompt=True,
+              hide_input=True,
+              envvar='PDFCLI_KEY',
+              help="Current password of the PDFs. Can also be specified as environment variable PDFCLI_KEY")
+@click.option('-n', '--new-key',
+              prompt=True,
+              hide_input=True,
+              confirmation_prompt=True,
+              envvar='PDFCLI_NEW_KEY',
+              help="Password to re-encrypt the PDFs with. Can also be specified as environment variable PDFCLI_NEW_KEY")
+@click.option('-a', '--algorithm',
+              type=click.Choice(['rc4-128', 'aes-128', 'aes-256']),
+              help="Encryption algorithm of the outputs. defaults to the algorithm of each input, with 40 bit RC4 "
+                   "raised to rc4-128")
+@click.option('-d', '--out-dir',
+              type=click.Path(file_okay=False),
+              help="Directory the re-encrypted PDFs are written to. By default the PDFs are replaced in place")
+@click.option('-w', '--workers',
+              default=os.cpu_count() or 1,
+              type=click.IntRange(min=1),
+              help="Number of worker processes re-encrypting files. defaults to the number of CPUs")
+def rekey(files, key, new_key, algorithm, out_dir, workers):
+    '''
+    Change the password of encrypted PDF files. Directories are searched for PDF files recursively.
+
+    Every object is decrypted and re-encrypted in a single pass, without writing the plaintext anywhere.
+    '''
+    _dispatch('rekey',
+              *files,
+              key=key,
+              new_key=new_key,
+              algorithm=algorithm,
+              out_dir=out_dir,
+              workers=workers)
 
 
 @cli.command()
 @click.argument('file',
                 nargs=1,
-                type=click.Path(exists=True))
+                type=click.Path(exists=True, allow_dash=True))
+@click.argument('steps',
+                nargs=-1)
+@click.option('-s', '--spec',
+              type=click.Path(exists=True, dir_okay=False),
+              help="JSON or YAML file with a list of steps, run before the STEPS given on the command line. "
+                   "YAML needs the PyYAML package")
+@click.option('-o', '--out',
+              default='out.pdf',
+              type=click.Path(allow_dash=True),
+              help="The path of the output pdf, - for standard output. defaults to out.pdf")
+@_key_option
+@click.option('-n', '--new-key',
+              envvar='PDFCLI_NEW_KEY',
+              help="Password the encrypt step encrypts the output with. Can also be specified as environment "
+                   "variable PDFCLI_NEW_KEY")
+@click.option('-w', '--workers',
+              default=os.cpu_count() or 1,
+              type=click.IntRange(min=1),
+              help="Number of threads compressing, encrypting and hashing streams. defaults to the number of CPUs")
+def run(file, steps, spec, out, key, new_key, workers):
+    '''
+    Run several operations on a PDF, reading it once and writing it once.
+
+    STEPS are NAME or NAME=VALUE and run in order: delete=INDEXES, reorder=INDEXES or reorder=reverse,
+    rotate=clockwise or rotate=counter-clockwise, dedupe, compress=LEVEL, xref-stream, linearize and
+    encrypt=ALGORITHM. Indexes refer to the pages as left by the previous steps.
+    '''
+    _dispatch('run',
+              file=file,
+              steps=list(steps),
+              spec=spec,
+              out=out,
+              key=key,
+              new_key=new_key,
+              workers=workers)
+
+
+@cli.command()
+@click.argument('files',
+                nargs=-1,
+                required=True,
+                type=click.Path(exists=True, allow_dash=True))
+@_key_option
+@click.option('-p', '--pages/--no-pages', 'count_pages',
+              default=False,
+              help="Also print the number of pages.")
+@click.option('-f', '--format', 'output_format',
+              default='text',
+              type=click.Choice(['text', 'json', 'ndjson', 'csv']),
+              help="Output format. json, ndjson and csv print one record per file with its size, PDF version, "
+                   "encryption, page count, page sizes and metadata as soon as it is read. defaults to text")
+@click.option('-w', '--workers',
+              default=1,
+              type=click.IntRange(min=1),
+              help="Number of worker processes reading files in parallel. defaults to 1")
+def info(files, key, count_pages, output_format, workers):
+    '''
+    Retrieves metadata info from PDF files. Directories are searched for PDF files recursively.
+    '''
+    _dispatch('info',
+              *files,
+              key=key,
+              count_pages=count_pages,
+              output_format=output_format,
+              workers=workers)
+
+
+@cli.command()
+@click.argument('sources',
+                nargs=-1,
+                required=True)
+@click.option('-c', '--command', 'operation',
+              type=click.Choice(_BATCH_COMMANDS),
+              help="The operation to run on every PDF matched by a glob or found in a directory.")
+@click.option('-d', '--out-dir',
+              type=click.Path(file_okay=False),
+              help="Directory the outputs of a glob or directory run are written to.")
+@click.option('-p', '--param',
+              multiple=True,
+              help="NAME=VALUE argument passed to the operation, for example -p direction=clockwise. Can be repeated.")
+@click.option('-w', '--workers',
+              default=os.cpu_count() or 1,
+              type=click.IntRange(min=1),
+              help="Number of worker processes. defaults to the number of CPUs")
 @click.option('-k', '--key',
+              multiple=True,
+              type=Password(),
               envvar='PDFCLI_KEY',
-              help="Password to decrypt PDF with. Can also be specified as environment variable PDFCLI_KEY")
-def info(file, key):
+              help="Password to decrypt or encrypt PDFs with, repeat it to try several in order when decrypting. Can "
+                   "also be specified as environment variable PDFCLI_KEY, one password per line")
+def batch(sources, operation, out_dir, param, workers, key):
     '''
-    Retrieves metadata info from PDF file.
+    Run operations over many PDFs on a pool of worker processes.
+
+    SOURCES are globs, directories or JSONL manifests. Each manifest line is an object with a "command" and
+    the arguments of that command, for example {"command": "rotate", "file": "a.pdf", "direction": "clockwise",
+    "out": "b.pdf"}.
     '''
-    _info(file=file, key=key)
+    _batch(*sources,
+           operation=operation,
+           out_dir=out_dir,
+           params=param,
+           workers=workers,
+           key=key)
+
+
+@cli.command()
+@click.option('-s', '--socket', 'socket_path',
+              default=lambda: os.path.join(tempfile.gettempdir(), 'pdfcli.sock'),
+              type=click.Path(),
+              help="Path of the Unix domain socket to listen on. defaults to pdfcli.sock in the temp directory")
+@click.option('-w', '--workers',
+              default=os.cpu_count() or 1,
+              type=click.IntRange(min=1),
+              help="Number of worker processes kept warm. defaults to the number of CPUs")
+def serve(socket_path, workers):
+    '''
+    Run a daemon that executes commands sent with pdfcli --remote.
+    '''
+    _serve(socket_path=socket_path,
+           workers=workers)
 
 
 def _merge(*files, **kwargs):
     decrypt_key = _encr_key_encoding(kwargs['key'])
+    dedupe = kwargs.get('dedupe', False)
+    write_options = _write_options(kwargs)
 
     if len(files) == 0:
         raise click.BadParameter('There were no files provided to merge')
 
-    merger = PyPDF2.merger.PdfFileMerger()
-    for file in files:
-        with open(file, 'rb') as fp:
-            pdf_reader = get_pdf_reader(fp, file, key=decrypt_key)
-            merger.append(pdf_reader)
-
-    merger.write(kwargs['out'])
-    click.echo("Merged files %s into %s" % (files, kwargs['out']))
+    stream = dedupe or any(write_options.values())
+    with contextlib.ExitStack() as stack:
+        readers = []
+        if not stream:
+            merger = PyPDF2.merger.PdfFileMerger()
+            for file in files:
+                fp = stack.enter_context(_open_pdf(file))
+                pdf_reader = get_pdf_reader(fp, file, key=decrypt_key)
+                readers.append(pdf_reader)
+                if pdf_reader.isEncrypted:
+                    # PdfFileMerger parses its inputs again without their
+                    # decryption key, so encrypted inputs are streamed.
+                    stream = True
+                    break
+                with _phase('copy'):
+                    merger.append(pdf_reader)
+            else:
+                with _open_output(kwargs['out']) as pdf_writer_fp, _phase('write'):
+                    merger.write(pdf_writer_fp)
+                _count('objects_written', len(merger.output._objects))
+                _count('pages_written', merger.output.getNumPages())
+        if stream:
+            with _open_output(kwargs['out']) as pdf_writer_fp:
+                pdf_writer = _pdf_writer(pdf_writer_fp, compress=write_options['compress'],
+                                         xref_stream=write_options['xref_stream'],
+                                         linearize=write_options['linearize'])
+                for pdf_reader in _iter_readers(files, decrypt_key, readers):
+                    if dedupe:
+                        pdf_writer.add_digests(pdf_reader, _stream_digests(pdf_reader))
+                    for page in _iter_pages(pdf_reader, range(pdf_reader.getNumPages())):
+                        pdf_writer.add_page(page)
+                    pdf_writer.release(pdf_reader)
+                pdf_writer.close()
+            if dedupe:
+                _echo_status("Removed %s duplicate objects (%s bytes)" % (pdf_writer.deduplicated_objects,
+                                                                           pdf_writer.deduplicated_bytes),
+                             kwargs['out'])
+    _echo_status("Merged files %s into %s" % (files, kwargs['out']), kwargs['out'])
+
+
+def _iter_readers(files, key, readers=()):
+    '''
+    Yields a reader for each of files, starting with the readers already
+    parsed for the first of them. The others are opened one at a time, so
+    their objects can be written as they are copied and their mapping is
+    dropped once they are done.
+    '''
+    for index, file in enumerate(files):
+        if index < len(readers):
+            yield readers[index]
+            continue
+        with _open_pdf(file) as fp:
+            yield get_pdf_reader(fp, file, key=key)
 
 
 def _reorder(*args, **kwargs):
@@ -219,35 +810,34 @@ def _reorder(*args, **kwargs):
     out = kwargs['out']
     decrypt_key = _encr_key_encoding(kwargs['key'])
 
+    _check_incremental(kwargs)
     if not reverse and not order:
         raise click.UsageError("Either the reverse or out switch must be set when using reorder.")
 
     if order:
         try:
-            order = order.split(",")
-            order = [int(num) for num in order]
+            order = PageSelection(order)
         except ValueError as e:
             raise click.BadParameter("order must be a list of integers representing indexes in PDF.")
 
-    with open(file_arg, 'rb') as pdf_fp, open(out, 'wb') as pdf_fp_w:
+    with _open_pdf(file_arg) as pdf_fp, _open_output(out) as pdf_fp_w:
         pdf_reader = get_pdf_reader(pdf_fp, file_arg, key=decrypt_key)
 
-        pdf_writer = PyPDF2.PdfFileWriter()
         num_pages = pdf_reader.getNumPages()
 
-        if order:
-            for index in order:
-                if index > num_pages - 1:
-                    raise click.BadParameter('Indexes start from zero must be less than the number of pages')
-
         if reverse:
-            order = [i for i in range(num_pages - 1, -1, -1)]
+            order = range(num_pages - 1, -1, -1)
+        else:
+            try:
+                order = order.indexes(num_pages)
+            except IndexError:
+                raise click.BadParameter('Indexes start from zero must be less than the number of pages')
 
-        for index in order:
-            pdf_writer.addPage(pdf_reader.getPage(index))
-
-        pdf_writer.write(pdf_fp_w)
-        click.echo("Reordered pages in %s and rewrote file to %s" % (file_arg, out))
+        if kwargs.get('incremental'):
+            _write_incremental(pdf_reader, pdf_fp, _iter_pages(pdf_reader, order), pdf_fp_w)
+        else:
+            _write_pages(_iter_pages(pdf_reader, order), pdf_fp_w, **_write_options(kwargs))
+        _echo_status("Reordered pages in %s and rewrote file to %s" % (file_arg, out), out)
 
 
 def _delete(*args, **kwargs):
@@ -256,22 +846,26 @@ def _delete(*args, **kwargs):
     out = kwargs['out']
     decrypt_key = _encr_key_encoding(kwargs['key'])
 
-    with open(file_arg, 'rb') as pdf_reader_fp:
+    _check_incremental(kwargs)
+
+    with _open_pdf(file_arg) as pdf_reader_fp:
         pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg, key=decrypt_key)
         num_pages = pdf_reader.getNumPages()
 
-        for page in delete_pages:
-            if page > num_pages - 1:
-                raise click.BadParameter('All indexes must be within range of the length of the PDF')
-
-        with open(out, 'wb') as pdf_writer_fp:
-            pdf_writer = PyPDF2.PdfFileWriter()
-            for i in range(num_pages):
-                if i not in delete_pages:
-                    pdf_writer.addPage(pdf_reader.getPage(i))
-
-            pdf_writer.write(pdf_writer_fp)
-            click.echo("Deleted pages %s from %s and created new PDF at %s" % (delete_pages, file_arg, out))
+        if not isinstance(delete_pages, PageSelection):
+            delete_pages = PageSelection(','.join(str(page) for page in delete_pages))
+        try:
+            deleted = delete_pages.mask(num_pages)
+        except IndexError:
+            raise click.BadParameter('All indexes must be within range of the length of the PDF')
+
+        with _open_output(out) as pdf_writer_fp:
+            pages = _iter_pages(pdf_reader, (i for i in range(num_pages) if not deleted[i]))
+            if kwargs.get('incremental'):
+                _write_incremental(pdf_reader, pdf_reader_fp, pages, pdf_writer_fp)
+            else:
+                _write_pages(pages, pdf_writer_fp, **_write_options(kwargs))
+            _echo_status("Deleted pages %s from %s and created new PDF at %s" % (delete_pages, file_arg, out), out)
 
 
 def _split(*args, **kwargs):
@@ -279,28 +873,92 @@ def _split(*args, **kwargs):
     split_index = kwargs['index']
     out_first = kwargs['out_first']
     out_second = kwargs['out_second']
+    write_options = _write_options(kwargs)
     decrypt_key = _encr_key_encoding(kwargs['key'])
 
-    with open(file_arg, 'rb') as pdf_reader_fp, open(out_first, 'wb') as pdf_fp_one, \
-            open(out_second, 'wb') as pdf_fp_two:
-        pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg, key=decrypt_key)
-
-        pdf_writer_one = PyPDF2.PdfFileWriter()
-        pdf_writer_two = PyPDF2.PdfFileWriter()
+    if out_first == out_second == '-':
+        raise click.UsageError("Only one of --out-first and --out-second can be standard output.")
 
+    with _open_pdf(file_arg) as pdf_reader_fp:
+        pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg, key=decrypt_key)
         num_pages = pdf_reader.getNumPages()
 
         if split_index > num_pages - 1:
             raise click.BadParameter('The split index must be less than the number of pages')
 
-        for i in range(num_pages):
-            if i < split_index:
-                pdf_writer_one.addPage(pdf_reader.getPage(i))
-            else:
-                pdf_writer_two.addPage(pdf_reader.getPage(i))
-            pdf_writer_one.write(pdf_fp_one)
-            pdf_writer_two.write(pdf_fp_two)
-        click.echo("Split %s at index %s into %s and %s" % (file_arg, split_index, out_first, out_second))
+        # Each output is built and serialized exactly once, one after the other, so
+        # only a single writer is alive at any time.
+        with _open_output(out_first) as pdf_fp_one:
+            _write_pages(_iter_pages(pdf_reader, range(0, split_index)), pdf_fp_one, **write_options)
+        with _open_output(out_second) as pdf_fp_two:
+            _write_pages(_iter_pages(pdf_reader, range(split_index, num_pages)), pdf_fp_two, **write_options)
+        _echo_status("Split %s at index %s into %s and %s" % (file_arg, split_index, out_first, out_second),
+                     out_first, out_second)
+
+
+def _burst(*args, **kwargs):
+    file_arg = kwargs['file']
+    every = kwargs.get('every')
+    ranges = kwargs.get('ranges')
+    out = kwargs['out']
+    # Worker processes reopen the input, which standard input doesn't allow.
+    workers = 1 if file_arg == '-' else kwargs.get('workers', 1)
+    write_options = _write_options(kwargs)
+    decrypt_key = _encr_key_encoding(kwargs['key'])
+
+    if every and ranges:
+        raise click.UsageError("Only one of --every and --ranges can be set when using burst.")
+    if '{}' not in out:
+        raise click.BadParameter("The output pattern must contain {} to number the output files.")
+
+    with _open_pdf(file_arg) as pdf_reader_fp:
+        pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg, key=decrypt_key)
+        chunks = _burst_chunks(pdf_reader.getNumPages(), every, ranges)
+        outs = [out.format(i) for i in range(len(chunks))]
+
+        if workers == 1:
+            for chunk, chunk_out in zip(chunks, outs):
+                with _open_output(chunk_out) as pdf_writer_fp:
+                    _write_pages(_iter_pages(pdf_reader, chunk), pdf_writer_fp, **write_options)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_write_chunk, file_arg, decrypt_key, chunk, chunk_out, write_options,
+                                           _cli_options())
+                           for chunk, chunk_out in zip(chunks, outs)]
+                for future in futures:
+                    future.result()
+    _echo_status("Split %s into %s files %s" % (file_arg, len(outs), out))
+
+
+def _burst_chunks(num_pages, every=None, ranges=None):
+    '''
+    Returns the list of page ranges, one per output file, for burst.
+    '''
+    if ranges:
+        try:
+            return PageSelection(ranges).ranges(num_pages)
+        except ValueError:
+            raise click.BadParameter("ranges must be a list of indexes or ranges of indexes such as 0-9,10-19.")
+        except IndexError:
+            raise click.BadParameter('All indexes must be within range of the length of the PDF')
+
+    every = every or 1
+    return [range(start, min(start + every, num_pages)) for start in range(0, num_pages, every)]
+
+
+# Readers opened by burst worker processes, so that each worker parses the
+# source once no matter how many chunks it is handed.
+_worker_readers = {}
+
+
+def _write_chunk(file_arg, decrypt_key, chunk, out, write_options, options):
+    with _options_context(options):
+        pdf_reader = _worker_readers.get((file_arg, decrypt_key))
+        if pdf_reader is None:
+            pdf_reader = get_pdf_reader(_open_pdf(file_arg), file_arg, key=decrypt_key)
+            _worker_readers[(file_arg, decrypt_key)] = pdf_reader
+        with _open_output(out) as pdf_writer_fp:
+            _write_pages(_iter_pages(pdf_reader, chunk), pdf_writer_fp, **write_options)
 
 
 def _rotate(*args, **kwargs):
@@ -309,63 +967,1151 @@ def _rotate(*args, **kwargs):
     out = kwargs['out']
     decrypt_key = _encr_key_encoding(kwargs['key'])
 
-    with open(file_arg, 'rb') as pdf_reader_fp, open(out, 'wb') as pdf_writer_fp:
+    _check_incremental(kwargs)
+
+    with _open_pdf(file_arg) as pdf_reader_fp, _open_output(out) as pdf_writer_fp:
         pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg, key=decrypt_key)
 
-        pdf_writer = PyPDF2.PdfFileWriter()
-        num_pages = pdf_reader.getNumPages()
+        pages = [_rotate_page(page, direction) for page in _iter_pages(pdf_reader, range(pdf_reader.getNumPages()))]
+        if kwargs.get('incremental'):
+            _write_incremental(pdf_reader, pdf_reader_fp, pages, pdf_writer_fp, rewrite_pages=True)
+        else:
+            _write_pages(pages, pdf_writer_fp, **_write_options(kwargs))
+        _echo_status("Pages were rotated %s successfully and saved at %s" % (direction, out), out)
 
-        for i in range(num_pages):
-            page = pdf_reader.getPage(i)
-            if direction == "clockwise":
-                page = page.rotateClockwise(90)
-            else:
-                page = page.rotateCounterClockwise(90)
-            pdf_writer.addPage(page)
-        pdf_writer.write(pdf_writer_fp)
-        click.echo("Pages were rotated %s successfully and saved at %s" % (direction, out))
 
+def _rotate_page(page, direction):
+    if direction == "clockwise":
+        return page.rotateClockwise(90)
+    return page.rotateCounterClockwise(90)
 
-def _encrypt(*args, **kwargs):
+
+def _optimize(*args, **kwargs):
     file_arg = kwargs['file']
     out = kwargs['out']
-    encrypt_key = _encr_key_encoding(kwargs['key'])
+    decrypt_key = _encr_key_encoding(kwargs['key'])
 
-    with open(file_arg, 'rb') as pdf_reader_fp, open(out, 'wb') as pdf_writer_fp:
-        pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg)
+    with _open_pdf(file_arg) as pdf_reader_fp, _open_output(out) as pdf_writer_fp:
+        pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg, key=decrypt_key)
 
-        pdf_writer = PyPDF2.PdfFileWriter()
-        pdf_writer.appendPagesFromReader(pdf_reader)
-        pdf_writer.encrypt(encrypt_key)
-        pdf_writer.write(pdf_writer_fp)
-        click.echo("PDF was successfully encrypted and saved at %s" % out)
+        pdf_writer = _pdf_writer(pdf_writer_fp, compress=kwargs.get('compress'), xref_stream=kwargs.get('xref_stream'),
+                                 linearize=kwargs.get('linearize'), workers=kwargs.get('workers'))
+        pdf_writer.add_digests(pdf_reader, _stream_digests(pdf_reader, kwargs.get('workers')))
+        for page in _iter_pages(pdf_reader, range(pdf_reader.getNumPages())):
+            pdf_writer.add_page(page)
+        pdf_writer.close()
+        _echo_status("Removed %s duplicate objects (%s bytes) and saved at %s" % (pdf_writer.deduplicated_objects,
+                                                                                   pdf_writer.deduplicated_bytes,
+                                                                                   out), out)
 
 
-def _decrypt(*args, **kwargs):
+def _compress(*args, **kwargs):
     file_arg = kwargs['file']
     out = kwargs['out']
     decrypt_key = _encr_key_encoding(kwargs['key'])
 
-    with open(file_arg, 'rb') as pdf_reader_fp, open(out, 'wb') as pdf_writer_fp:
+    with _open_pdf(file_arg) as pdf_reader_fp, _open_output(out) as pdf_writer_fp:
         pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg, key=decrypt_key)
 
-        pdf_writer = PyPDF2.PdfFileWriter()
-        pdf_writer.appendPagesFromReader(pdf_reader)
-        pdf_writer.write(pdf_writer_fp)
-        click.echo("PDF was successfully decrypted and saved at %s" % out)
+        linearize = kwargs.get('linearize', False)
+        pdf_writer = _pdf_writer(pdf_writer_fp, compress=kwargs.get('level', 9),
+                                 xref_stream=kwargs.get('xref_stream', True) and not linearize,
+                                 linearize=linearize, workers=kwargs.get('workers'))
+        for page in _iter_pages(pdf_reader, range(pdf_reader.getNumPages())):
+            pdf_writer.add_page(page)
+        pdf_writer.close()
+        _echo_status("Compressed %s from %s to %s bytes and saved at %s" % (file_arg, _input_size(pdf_reader_fp),
+                                                                            pdf_writer_fp.tell(), out), out)
 
 
-def _info(*args, **kwargs):
+def _linearize(*args, **kwargs):
     file_arg = kwargs['file']
+    out = kwargs['out']
     decrypt_key = _encr_key_encoding(kwargs['key'])
-    with open(file_arg, 'rb') as pdf_reader_fp:
+
+    with _open_pdf(file_arg) as pdf_reader_fp, _open_output(out) as pdf_writer_fp:
         pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg, key=decrypt_key)
-        document_info = pdf_reader.getDocumentInfo()
-        for key in document_info.keys():
-            value = str(document_info[key])
+
+        _write_pages(_iter_pages(pdf_reader, range(pdf_reader.getNumPages())), pdf_writer_fp, linearize=True)
+        _echo_status("PDF was successfully linearized and saved at %s" % out, out)
+
+
+def _encrypt(*args, **kwargs):
+    file_arg = kwargs['file']
+    out = kwargs['out']
+    encrypt_key = kwargs['key']
+    if isinstance(encrypt_key, (list, tuple)):
+        raise click.BadParameter("PDFs can only be encrypted with a single key.")
+
+    with _open_pdf(file_arg) as pdf_reader_fp, _open_output(out) as pdf_writer_fp:
+        pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg)
+
+        encryption = StandardSecurityHandler.create(encrypt_key, kwargs.get('algorithm', 'rc4-128'))
+        pdf_writer = StreamingPdfWriter(pdf_writer_fp, compress=kwargs.get('compress'), workers=kwargs.get('workers'),
+                                        object_streams=kwargs.get('xref_stream', False), encryption=encryption)
+        for page in _iter_pages(pdf_reader, range(pdf_reader.getNumPages())):
+            pdf_writer.add_page(page)
+        pdf_writer.close()
+        _echo_status("PDF was successfully encrypted and saved at %s" % out, out)
+
+
+def _decrypt(*args, **kwargs):
+    file_arg = kwargs['file']
+    out = kwargs['out']
+
+    with _open_pdf(file_arg) as pdf_reader_fp, _open_output(out) as pdf_writer_fp:
+        pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg)
+        security_handler = _security_handler(pdf_reader, kwargs['key'])
+
+        pdf_writer = _pdf_writer(pdf_writer_fp, compress=kwargs.get('compress'), xref_stream=kwargs.get('xref_stream'),
+                                 linearize=kwargs.get('linearize'), workers=kwargs.get('workers'))
+        pdf_writer.add_decryption(pdf_reader, security_handler)
+        for page in _iter_pages(pdf_reader, range(len(pdf_reader.flattenedPages))):
+            pdf_writer.add_page(page)
+        pdf_writer.close()
+        _echo_status("PDF was successfully decrypted and saved at %s" % out, out)
+
+
+def _rekey(*files, **kwargs):
+    roots = files or [kwargs['file']]
+    files = _find_pdf_files(roots)
+    out_dir = kwargs.get('out_dir')
+    # Standard input can only be read once, by this process.
+    workers = 1 if '-' in files else kwargs.get('workers', 1)
+    outs = [_out_path(file_arg, roots, out_dir) for file_arg in files]
+    key = kwargs['key']
+    new_key = kwargs['new_key']
+    algorithm = kwargs.get('algorithm')
+
+    start = time.time()
+    if workers == 1 or len(files) == 1:
+        # A single file spreads its streams over threads instead.
+        results = (_rekey_file(file_arg, out, key, new_key, algorithm, workers) for file_arg, out in zip(files, outs))
+        failed = _echo_rekey(files, outs, results)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            count = len(files)
+            results = executor.map(_rekey_file, files, outs, [key] * count, [new_key] * count, [algorithm] * count,
+                                   [1] * count, [_cli_options()] * count)
+            failed = _echo_rekey(files, outs, results)
+
+    _echo_status("Rekeyed %s files in %.2fs: %s succeeded, %s failed" % (len(files), time.time() - start,
+                                                                          len(files) - failed, failed), *outs)
+    if failed:
+        raise click.ClickException("%s of %s files could not be rekeyed" % (failed, len(files)))
+
+
+def _out_path(file_arg, roots, out_dir):
+    '''
+    Returns the output path of file_arg, which keeps its path relative to the
+    directory it was found in under out_dir, or file_arg itself without one.
+    Standard input is always written to standard output.
+    '''
+    if not out_dir or file_arg == '-':
+        return file_arg
+    for root in roots:
+        if os.path.isdir(root) and os.path.commonpath([os.path.abspath(root), os.path.abspath(file_arg)]) == \
+                os.path.abspath(root):
+            return os.path.join(out_dir, os.path.relpath(file_arg, root))
+    return os.path.join(out_dir, os.path.basename(file_arg))
+
+
+def _echo_rekey(files, outs, results):
+    failed = 0
+    for file_arg, out, error in zip(files, outs, results):
+        if error:
+            failed += 1
+            _echo_status("[failed] %s: %s" % (file_arg, error), *outs)
+        else:
+            _echo_status("[ok] %s -> %s" % (file_arg, out), *outs)
+    return failed
+
+
+def _rekey_file(file_arg, out, key, new_key, algorithm=None, workers=1, options=None):
+    '''
+    Decrypts file_arg with key and encrypts it with new_key into out in one
+    streaming pass. The output is written to a temporary file next to out,
+    which only ever holds encrypted objects, and moved over out once
+    complete, so out may be file_arg itself. Standard output and file
+    objects are written to directly. Returns an error message, or None on
+    success.
+    '''
+    in_place = isinstance(out, str) and out != '-'
+    temp_path = None
+    try:
+        with _options_context(options) if options is not None else _nullcontext():
+            if in_place:
+                out_directory = os.path.dirname(os.path.abspath(out))
+                os.makedirs(out_directory, exist_ok=True)
+            with _open_pdf(file_arg) as pdf_reader_fp:
+                pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg)
+                security_handler = _security_handler(pdf_reader, key)
+                encryption = StandardSecurityHandler.create(new_key, algorithm or security_handler.algorithm)
+
+                if not in_place:
+                    output = _open_output(out)
+                else:
+                    temp_fd, temp_path = tempfile.mkstemp(suffix='.pdf', dir=out_directory)
+                    output = os.fdopen(temp_fd, 'wb')
+                with output as pdf_writer_fp:
+                    pdf_writer = StreamingPdfWriter(pdf_writer_fp, workers=workers,
+                                                    object_streams=bool(pdf_reader.xref_objStm), encryption=encryption)
+                    pdf_writer.add_decryption(pdf_reader, security_handler)
+                    for page in _iter_pages(pdf_reader, range(len(pdf_reader.flattenedPages))):
+                        pdf_writer.add_page(page)
+                    pdf_writer.close()
+            if temp_path is not None:
+                # mkstemp creates the file readable by its owner only, keep
+                # the permissions of the file it replaces or is made from.
+                mode_source = out if os.path.exists(out) else file_arg
+                if isinstance(mode_source, str) and os.path.exists(mode_source):
+                    shutil.copymode(mode_source, temp_path)
+                os.replace(temp_path, out)
+                temp_path = None
+                if _STATS is not None:
+                    _STATS.outputs.append(out)
+    except click.ClickException as e:
+        return e.format_message()
+    except Exception as e:
+        return "%s: %s" % (type(e).__name__, e)
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+    return None
+
+
+def _run(*args, **kwargs):
+    file_arg = kwargs['file']
+    out = kwargs['out']
+    steps = (_read_run_spec(kwargs['spec']) if kwargs.get('spec') else []) + list(kwargs.get('steps') or ())
+    if not steps:
+        raise click.UsageError("No steps were given to run.")
+
+    with _open_pdf(file_arg) as pdf_reader_fp:
+        pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg)
+        security_handler = None
+        if pdf_reader.isEncrypted:
+            security_handler = _security_handler(pdf_reader, kwargs.get('key'))
+            num_pages = len(pdf_reader.flattenedPages)
+        else:
+            num_pages = pdf_reader.getNumPages()
+
+        plan = PagePlan(num_pages)
+        for step in steps:
+            plan.apply(*_parse_run_step(step))
+        encryption = None
+        if plan.encrypt:
+            if not kwargs.get('new_key'):
+                raise click.UsageError("The encrypt step needs --new-key or PDFCLI_NEW_KEY to be set.")
+            encryption = StandardSecurityHandler.create(kwargs['new_key'], plan.encrypt)
+
+        with _open_output(out) as pdf_writer_fp:
+            pdf_writer = _pdf_writer(pdf_writer_fp, compress=plan.compress, xref_stream=plan.xref_stream,
+                                     linearize=plan.linearize, workers=kwargs.get('workers'), encryption=encryption)
+            if security_handler is not None:
+                pdf_writer.add_decryption(pdf_reader, security_handler)
+            if plan.dedupe:
+                pdf_writer.add_digests(pdf_reader, _stream_digests(pdf_reader, kwargs.get('workers')))
+            for page in plan.pages(pdf_reader):
+                pdf_writer.add_page(page)
+            pdf_writer.close()
+        _echo_status("Ran %s steps on %s and saved %s pages at %s" % (len(steps), file_arg, len(plan.indexes), out),
+                     out)
+
+
+def _read_run_spec(spec):
+    '''
+    Returns the steps listed in a JSON or YAML spec file, either as a list or
+    under a "steps" key.
+    '''
+    with open(spec, 'rb') as spec_fp:
+        data = spec_fp.read()
+    if spec.lower().endswith(('.yaml', '.yml')):
+        if yaml is None:
+            raise click.UsageError("YAML specs need the PyYAML package, install it with pip install pyyaml.")
+        try:
+            steps = yaml.safe_load(data)
+        except yaml.YAMLError as e:
+            raise click.BadParameter("Spec %s could not be parsed: %s" % (spec, e))
+    else:
+        try:
+            steps = json.loads(data.decode('utf-8'))
+        except ValueError as e:
+            raise click.BadParameter("Spec %s could not be parsed: %s" % (spec, e))
+    if isinstance(steps, dict):
+        steps = steps.get('steps')
+    if not isinstance(steps, list):
+        raise click.BadParameter("Spec %s must contain a list of steps." % spec)
+    return steps
+
+
+def _parse_run_step(step):
+    '''
+    Returns the (name, value) of a step given as NAME, NAME=VALUE or, in
+    specs, a mapping {NAME: VALUE}.
+    '''
+    if isinstance(step, dict) and len(step) == 1:
+        name, value = next(iter(step.items()))
+    elif isinstance(step, str):
+        name, _, value = step.partition('=')
+    else:
+        raise click.BadParameter("Invalid step %r." % (step,))
+    return name.strip().lower().replace('_', '-'), None if value in ('', None) else str(value)
+
+
+def _info(*files, **kwargs):
+    files = _find_pdf_files(files or [kwargs['file']])
+    decrypt_key = _encr_key_encoding(kwargs['key'])
+    count_pages = kwargs.get('count_pages', False)
+    output_format = kwargs.get('output_format', 'text')
+    # Standard input can only be read once, by this process.
+    workers = 1 if '-' in files else kwargs.get('workers', 1)
+
+    if output_format != 'text':
+        _echo_info_records(_info_records(files, decrypt_key, workers), output_format)
+    elif workers == 1 or len(files) == 1:
+        results = (_read_info(file_arg, decrypt_key, count_pages) for file_arg in files)
+        _echo_info(files, results)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            options = _cli_options()
+            results = executor.map(_read_info, files, [decrypt_key] * len(files), [count_pages] * len(files),
+                                   [options] * len(files), chunksize=max(1, len(files) // (workers * 4)))
+            _echo_info(files, results)
+
+
+def _echo_info(files, results):
+    for file_arg, document_info in zip(files, results):
+        if len(files) > 1:
+            click.echo("==> %s <==" % file_arg)
+        for key, value in document_info:
             click.echo("%s: %s" % (_strip_forward_slash(key), value))
 
 
+_INFO_FIELDS = ['file', 'file_size', 'version', 'encrypted', 'pages', 'page_sizes', 'info', 'error']
+
+
+def _find_pdf_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                files.extend(os.path.join(directory, name) for name in sorted(filenames)
+                             if name.lower().endswith('.pdf'))
+        else:
+            files.append(path)
+    return files
+
+
+def _info_records(files, decrypt_key, workers):
+    '''
+    Yields the info record of every file as soon as it has been read.
+    '''
+    if workers == 1:
+        for file_arg in files:
+            yield _read_info_record(file_arg, decrypt_key)
+        return
+
+    options = _cli_options()
+    files = iter(files)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded number of files in flight so crawls over millions of
+        # files don't queue a future per file up front.
+        pending = set()
+        for file_arg in files:
+            pending.add(executor.submit(_read_info_record, file_arg, decrypt_key, options))
+            if len(pending) >= workers * 4:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+
+
+def _echo_info_records(records, output_format):
+    if output_format == 'csv':
+        click.echo(_csv_row(_INFO_FIELDS), nl=False)
+    elif output_format == 'json':
+        click.echo('[')
+
+    for i, record in enumerate(records):
+        if output_format == 'csv':
+            row = dict(record)
+            row['page_sizes'] = ';'.join('%gx%g' % tuple(size) for size in record['page_sizes'] or ())
+            row['info'] = json.dumps(record['info']) if record['info'] is not None else ''
+            click.echo(_csv_row(['' if row[field] is None else row[field] for field in _INFO_FIELDS]), nl=False)
+        elif output_format == 'json':
+            click.echo(('  ' if i == 0 else ', ') + json.dumps(record))
+        else:
+            click.echo(json.dumps(record))
+
+    if output_format == 'json':
+        click.echo(']')
+
+
+def _csv_row(values):
+    row = io.StringIO()
+    csv.writer(row).writerow(values)
+    return row.getvalue()
+
+
+def _read_info_record(file_arg, decrypt_key, options=None):
+    '''
+    Returns a dict describing file_arg with the fields of _INFO_FIELDS. Errors
+    are reported in the record so one bad file doesn't stop a crawl.
+    '''
+    record = dict.fromkeys(_INFO_FIELDS)
+    record['file'] = file_arg
+    try:
+        with _options_context(options) if options is not None else _nullcontext():
+            with _open_pdf(file_arg) as pdf_reader_fp:
+                record['file_size'] = _input_size(pdf_reader_fp)
+                record['version'] = _pdf_version(pdf_reader_fp)
+                with _phase('parse'):
+                    quick_record = _quick_info_record(pdf_reader_fp)
+                if quick_record is not None:
+                    record.update(quick_record)
+                    return record
+
+                pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg, key=decrypt_key)
+                record['encrypted'] = pdf_reader.isEncrypted
+                info_dict = pdf_reader.getDocumentInfo() or {}
+                record['info'] = dict((_strip_forward_slash(key), str(info_dict[key])) for key in info_dict.keys())
+                record['pages'] = pdf_reader.getNumPages()
+                page_sizes = []
+                for page in _iter_pages(pdf_reader, range(record['pages'])):
+                    _add_page_size(page_sizes, page.mediaBox)
+                record['page_sizes'] = page_sizes
+    except click.ClickException as e:
+        record['error'] = e.format_message()
+    except Exception as e:
+        record['error'] = "%s: %s" % (type(e).__name__, e)
+    return record
+
+
+def _quick_info_record(pdf_fp):
+    '''
+    Builds the encryption, page and metadata fields of an info record with a
+    QuickInfoReader, walking the page tree for the page sizes. Returns None
+    when the file needs the full reader instead, which includes page trees
+    that reach a node twice.
+    '''
+    pdf_reader = QuickInfoReader(pdf_fp)
+    try:
+        if not pdf_reader.read() or '/Encrypt' in pdf_reader.trailer:
+            return None
+        info_dict = pdf_reader.trailer['/Info'] if '/Info' in pdf_reader.trailer else {}
+        page_sizes = []
+        num_pages = 0
+        visited = set()
+        stack = [(pdf_reader.trailer['/Root'].raw_get('/Pages'), None)]
+        while stack:
+            node, media_box = stack.pop()
+            if isinstance(node, PyPDF2.generic.IndirectObject):
+                if node.idnum in visited:
+                    return None
+                visited.add(node.idnum)
+                node = node.getObject()
+            media_box = node.get('/MediaBox', media_box)
+            if node.get('/Type') == '/Pages' or '/Kids' in node:
+                stack.extend((kid, media_box) for kid in reversed(node['/Kids']))
+            else:
+                num_pages += 1
+                _add_page_size(page_sizes, media_box.getObject())
+        _count_quick_input(pdf_reader)
+        return {
+            'encrypted': False,
+            'info': dict((_strip_forward_slash(key), str(info_dict[key])) for key in info_dict.keys()),
+            'pages': num_pages,
+            'page_sizes': page_sizes,
+        }
+    except (PyPDF2.utils.PdfReadError, click.BadParameter, LookupError, ValueError, TypeError, AttributeError):
+        return None
+
+
+def _count_quick_input(pdf_reader):
+    '''
+    Counts an input read by a QuickInfoReader the way get_pdf_reader counts
+    the inputs it parses.
+    '''
+    if _STATS is not None:
+        _count('inputs')
+        _count('bytes_read', _input_size(pdf_reader.stream))
+        _count('objects_read', len(pdf_reader._resolved))
+
+
+def _add_page_size(page_sizes, media_box):
+    '''
+    Appends the width and height of media_box to page_sizes unless a page of
+    that size was already seen.
+    '''
+    size = [abs(float(media_box[2]) - float(media_box[0])), abs(float(media_box[3]) - float(media_box[1]))]
+    if size not in page_sizes:
+        page_sizes.append(size)
+
+
+def _pdf_version(pdf_fp):
+    pdf_fp.seek(0)
+    match = re.match(br'%PDF-(\d+\.\d+)', pdf_fp.read(16))
+    pdf_fp.seek(0)
+    return match.group(1).decode('ascii') if match else None
+
+
+def _read_info(file_arg, decrypt_key, count_pages, options=None):
+    '''
+    Returns the document info of file_arg as a list of (key, value) pairs,
+    followed by the page count when count_pages is set.
+    '''
+    with _options_context(options) if options is not None else _nullcontext():
+        with _open_pdf(file_arg) as pdf_reader_fp:
+            with _phase('parse'):
+                document_info = _quick_info(pdf_reader_fp, count_pages)
+            if document_info is not None:
+                return document_info
+
+            pdf_reader = get_pdf_reader(pdf_reader_fp, file_arg, key=decrypt_key)
+            info_dict = pdf_reader.getDocumentInfo() or {}
+            document_info = [(key, str(info_dict[key])) for key in info_dict.keys()]
+            if count_pages:
+                document_info.append(('/Pages', str(pdf_reader.getNumPages())))
+            return document_info
+
+
+def _quick_info(pdf_fp, count_pages=False):
+    '''
+    Reads the document info of an unencrypted PDF with a QuickInfoReader.
+    Returns None when the file needs the full reader instead.
+    '''
+    pdf_reader = QuickInfoReader(pdf_fp)
+    try:
+        if not pdf_reader.read() or '/Encrypt' in pdf_reader.trailer:
+            return None
+        document_info = []
+        if '/Info' in pdf_reader.trailer:
+            info_dict = pdf_reader.trailer['/Info']
+            document_info = [(key, str(info_dict[key])) for key in info_dict.keys()]
+        if count_pages:
+            pages = pdf_reader.trailer['/Root']['/Pages']
+            document_info.append(('/Pages', str(pages['/Count'])))
+        _count_quick_input(pdf_reader)
+        return document_info
+    except (PyPDF2.utils.PdfReadError, click.BadParameter, LookupError, ValueError, TypeError, AttributeError):
+        return None
+
+
+def _batch(*sources, **kwargs):
+    operation = kwargs.get('operation')
+    out_dir = kwargs.get('out_dir')
+    workers = kwargs.get('workers', 1)
+    params = dict(_parse_batch_param(param) for param in kwargs.get('params', ()))
+    if kwargs.get('key'):
+        keys = list(kwargs['key'])
+        params.setdefault('key', keys[0] if len(keys) == 1 else keys)
+
+    jobs = []
+    out_dirs = set([out_dir]) if out_dir else set()
+    for source in sources:
+        if source.endswith('.jsonl'):
+            jobs.extend(_read_batch_manifest(source, params))
+            continue
+
+        if not operation:
+            raise click.UsageError("The --command option must be set to run %s." % source)
+        if operation != 'info' and not out_dir:
+            raise click.UsageError("The --out-dir option must be set to run %s." % operation)
+        roots = [source] if os.path.isdir(source) else sorted(glob.glob(source))
+        if not roots:
+            raise click.BadParameter("No files matched %s." % source)
+        for file_arg in _find_pdf_files(roots):
+            # Files found in subdirectories keep their relative path under out_dir.
+            out = _out_path(file_arg, roots, out_dir)
+            jobs.append(_batch_file_job(operation, file_arg, out, params))
+            if out_dir:
+                out_dirs.add(os.path.dirname(out))
+
+    for directory in sorted(out_dirs):
+        os.makedirs(directory, exist_ok=True)
+
+    start = time.time()
+    failed = 0
+    num_bytes = 0
+    for job, error, elapsed, output in _run_batch_jobs(jobs, workers, _cli_options()):
+        num_bytes += _batch_job_size(job)
+        if error:
+            failed += 1
+            click.echo("[failed] %s %s (%.2fs): %s" % (job['command'], _batch_job_name(job), elapsed, error))
+        else:
+            click.echo("[ok] %s %s (%.2fs)" % (job['command'], _batch_job_name(job), elapsed))
+            if job['command'] == 'info':
+                click.echo(output, nl=False)
+
+    elapsed = max(time.time() - start, 1e-6)
+    click.echo("Ran %s jobs in %.2fs with %s workers: %s succeeded, %s failed, %.1f jobs/s, %.2f MB/s"
+               % (len(jobs), elapsed, workers, len(jobs) - failed, failed, len(jobs) / elapsed,
+                  num_bytes / elapsed / 1e6))
+    if failed:
+        raise click.ClickException("%s of %s jobs failed" % (failed, len(jobs)))
+
+
+def _parse_batch_param(param):
+    name, sep, value = param.partition('=')
+    if not sep:
+        raise click.BadParameter("params must be given as NAME=VALUE, got %s." % param)
+    name = name.replace('-', '_')
+    if name in ('index', 'every', 'workers', 'compress', 'level'):
+        try:
+            value = int(value)
+        except ValueError:
+            raise click.BadParameter("%s must be an integer." % name)
+    elif name in ('reverse', 'stream', 'incremental', 'dedupe', 'xref_stream', 'linearize'):
+        value = value.lower() in ('1', 'true', 'yes')
+    return name, value
+
+
+def _read_batch_manifest(manifest, params):
+    jobs = []
+    with open(manifest) as manifest_fp:
+        for line_number, line in enumerate(manifest_fp, 1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError:
+                raise click.BadParameter("Line %s of %s is not valid JSON." % (line_number, manifest))
+            if not isinstance(job, dict) or job.get('command') not in _BATCH_OPERATIONS:
+                raise click.BadParameter("Line %s of %s must be an object with a known command." % (line_number, manifest))
+            jobs.append(dict(params, **job))
+    return jobs
+
+
+def _batch_file_job(operation, file_arg, out, params):
+    '''
+    Returns the job running operation on file_arg, with its outputs named
+    after out, the path of file_arg under the output directory.
+    '''
+    if operation == 'merge':
+        job = dict(params, command=operation, files=[file_arg])
+    else:
+        job = dict(params, command=operation, file=file_arg)
+    if operation == 'info':
+        return job
+    stem = os.path.splitext(out)[0]
+    if operation == 'rekey':
+        job.setdefault('out_dir', os.path.dirname(out))
+    elif operation == 'split':
+        job.setdefault('out_first', stem + '_1.pdf')
+        job.setdefault('out_second', stem + '_2.pdf')
+    elif operation == 'burst':
+        job.setdefault('out', stem + '_{}.pdf')
+    else:
+        job.setdefault('out', out)
+    return job
+
+
+def _batch_job_name(job):
+    if 'files' in job:
+        return ' '.join(job['files'])
+    return job.get('file', '')
+
+
+def _batch_job_size(job):
+    files = job['files'] if 'files' in job else [job.get('file')]
+    return sum(os.path.getsize(file_arg) for file_arg in files if file_arg and os.path.exists(file_arg))
+
+
+def _run_batch_jobs(jobs, workers, options=None):
+    '''
+    Yields (job, error, elapsed, output) for every job as it completes.
+    '''
+    if workers == 1:
+        for job in jobs:
+            yield (job,) + _run_batch_job(job, options)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = dict((executor.submit(_run_batch_job, job, options), job) for job in jobs)
+        for future in concurrent.futures.as_completed(futures):
+            yield (futures[future],) + future.result()
+
+
+def _run_batch_job(job, options=None):
+    '''
+    Runs a single batch job and returns (error, elapsed, output). The output the
+    operation echoes is captured rather than interleaved with other workers.
+    options are the global cli options the operation runs with.
+    '''
+    kwargs = dict(job)
+    operation = _BATCH_OPERATIONS[kwargs.pop('command')]
+    kwargs.setdefault('key', None)
+
+    start = time.time()
+    output = io.StringIO()
+    error = None
+    try:
+        with _options_context(options), contextlib.redirect_stdout(output):
+            if operation is _delete and not isinstance(kwargs.get('delete'), list):
+                kwargs['delete'] = _parse_delete_indexes(str(kwargs.get('delete') or ''))
+            operation(*kwargs.pop('files', ()), **kwargs)
+    except click.ClickException as e:
+        error = e.format_message()
+    except Exception as e:
+        error = "%s: %s" % (type(e).__name__, e)
+    return error, time.time() - start, output.getvalue()
+
+
+def _serve(*args, **kwargs):
+    socket_path = kwargs['socket_path']
+    workers = kwargs['workers']
+
+    if not hasattr(socketserver, 'UnixStreamServer'):
+        raise click.UsageError("serve requires Unix domain socket support.")
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # Start every worker up front so the first requests don't pay for it.
+        list(executor.map(_warm_worker, range(workers)))
+        server = _make_server(socket_path, executor, _cli_options())
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        click.echo("Serving on %s with %s workers" % (socket_path, workers))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(socket_path)
+
+
+def _warm_worker(i):
+    return i
+
+
+def _make_server(socket_path, executor, options=None):
+    '''
+    Returns a threading Unix domain socket server running batch jobs on
+    executor with the global cli options of the daemon. Every connection
+    carries one request: a JSON job line, as in batch manifests, answered by
+    a JSON line with error, elapsed and output. Global options the client
+    set, under the job's options key, override those of the daemon.
+    '''
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                job = json.loads(self.rfile.readline().decode('utf-8'))
+                if not isinstance(job, dict) or job.get('command') not in _BATCH_OPERATIONS:
+                    raise ValueError("request must be an object with a known command")
+                job_options = job.pop('options', None) or {}
+                if not isinstance(job_options, dict) or not set(job_options) <= set(_REMOTE_OPTIONS):
+                    raise ValueError("options must be an object of %s" % ', '.join(_REMOTE_OPTIONS))
+                job_options = dict(options or {}, **job_options)
+                error, elapsed, output = executor.submit(_run_batch_job, job, job_options).result()
+            except ValueError as e:
+                error, elapsed, output = "Bad request: %s" % e, 0.0, ''
+            response = {'error': error, 'elapsed': elapsed, 'output': output}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+def _dispatch(operation, *files, **kwargs):
+    '''
+    Runs operation in this process, or on the serve daemon when --remote is set.
+    '''
+    remote = _cli_option('remote')
+    if not remote:
+        if files:
+            return _BATCH_OPERATIONS[operation](*files, **kwargs)
+        return _BATCH_OPERATIONS[operation](**kwargs)
+
+    if '-' in files or '-' in [kwargs.get(name) for name in ('file', 'out', 'out_first', 'out_second')]:
+        raise click.UsageError("Standard input and output cannot be used with --remote.")
+    job = dict(kwargs, command=operation)
+    for name, value in kwargs.items():
+        if isinstance(value, PageSelection):
+            job[name] = value.spec
+    job_options = _remote_options()
+    if job_options:
+        job['options'] = job_options
+    if files:
+        job['files'] = [os.path.abspath(file_arg) for file_arg in files]
+    for name in ('file', 'out', 'out_first', 'out_second', 'out_dir', 'spec'):
+        if job.get(name):
+            job[name] = os.path.abspath(job[name])
+    response = _remote_call(remote, job)
+    click.echo(response['output'], nl=False)
+    if response['error']:
+        raise click.ClickException(response['error'])
+
+
+# The global options sent along with a job to the serve daemon, with the
+# names of their cli group parameters.
+_REMOTE_OPTIONS = {'mmap': 'use_mmap', 'cache': 'cache', 'cache_dir': 'cache_dir', 'cache_size': 'cache_size'}
+
+
+def _remote_options():
+    '''
+    Returns the global options that differ from their defaults, so a job
+    sent with --remote runs with them rather than with those of the daemon.
+    '''
+    defaults = dict((param.name, param.default) for param in cli.params)
+    options = dict((name, value) for name, value in _cli_options().items()
+                   if name in _REMOTE_OPTIONS and value != defaults[_REMOTE_OPTIONS[name]])
+    if options.get('cache_dir'):
+        options['cache_dir'] = os.path.abspath(options['cache_dir'])
+    return options
+
+
+def _remote_call(socket_path, job):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except (IOError, OSError) as e:
+        raise click.ClickException("Could not connect to pdfcli daemon at %s: %s" % (socket_path, e))
+    with contextlib.closing(client), client.makefile('rwb') as client_fp:
+        client_fp.write(json.dumps(job).encode('utf-8') + b'\n')
+        client_fp.flush()
+        line = client_fp.readline()
+    if not line:
+        raise click.ClickException("The pdfcli daemon at %s closed the connection" % socket_path)
+    return json.loads(line.decode('utf-8'))
+
+
+@contextlib.contextmanager
+def _nullcontext(enter_result=None):
+    yield enter_result
+
+
+def _cli_options():
+    '''
+    Returns the global options of the cli group that apply to operations run
+    in other processes.
+    '''
+    ctx = click.get_current_context(silent=True)
+    if ctx is None or not ctx.find_root().obj:
+        return {}
+    return dict((name, value) for name, value in ctx.find_root().obj.items() if name != 'remote')
+
+
+def _options_context(options):
+    '''
+    Returns a context that makes options visible to _cli_option while an
+    operation runs outside of a command line invocation.
+    '''
+    return click.Context(cli, obj=dict(options or {}))
+
+
+def _cli_option(name, default=None):
+    '''
+    Returns a global option set on the cli group, or default when running
+    outside of a command line invocation.
+    '''
+    ctx = click.get_current_context(silent=True)
+    if ctx is None or not ctx.find_root().obj:
+        return default
+    return ctx.find_root().obj.get(name, default)
+
+
+class Stats(object):
+    '''
+    What a command spent its time and memory on, collected when the --stats
+    option is set: the wall time of each phase, the bytes of the input and
+    output PDFs, the objects read and written and the peak memory.
+
+    Parsing covers reading the cross-reference tables and trailer of inputs.
+    Copying covers adding pages to a writer, which for the streaming writers
+    includes reading, copying and writing out every object of the page.
+    Writing covers serializing the rest of the output. Work done in worker
+    processes is only reflected in their peak memory.
+    '''
+    PHASES = ('parse', 'copy', 'write')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = collections.OrderedDict((name, 0.0) for name in self.PHASES)
+        self.counters = collections.Counter()
+        self.outputs = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def report(self):
+        '''
+        Returns the collected statistics as a dictionary.
+        '''
+        bytes_written = self.counters['bytes_written'] + sum(os.path.getsize(out) for out in set(self.outputs)
+                                                             if os.path.isfile(out))
+        report = collections.OrderedDict([
+            ('seconds', round(time.perf_counter() - self.started, 6)),
+            ('phases', collections.OrderedDict((name, round(seconds, 6)) for name, seconds in self.phases.items())),
+            ('inputs', self.counters['inputs']),
+            ('bytes_read', self.counters['bytes_read']),
+            ('objects_read', self.counters['objects_read']),
+            ('outputs', len(self.outputs)),
+            ('bytes_written', bytes_written),
+            ('objects_written', self.counters['objects_written']),
+            ('pages_written', self.counters['pages_written']),
+            ('peak_rss_kb', None),
+            ('peak_rss_children_kb', None),
+        ])
+        if resource is not None:
+            # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+            scale = 1024 if sys.platform == 'darwin' else 1
+            report['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+            report['peak_rss_children_kb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+        return report
+
+
+# The Stats of the running command, None unless --stats is set.
+_STATS = None
+
+
+def _start_stats(ctx, stats_format):
+    global _STATS
+    _STATS = Stats()
+
+    def report():
+        global _STATS
+        stats, _STATS = _STATS, None
+        report = stats.report()
+        if stats_format == 'json':
+            click.echo(json.dumps(report), err=True)
+            return
+        lines = ['%-21s %.3fs' % ('total', report.pop('seconds'))]
+        lines.extend('%-21s %.3fs' % (name, seconds) for name, seconds in report.pop('phases').items())
+        lines.extend('%-21s %s' % (name.replace('_', ' '), value) for name, value in report.items()
+                     if value is not None)
+        click.echo('\n'.join(lines), err=True)
+    ctx.call_on_close(report)
+
+
+def _start_profile(ctx, path):
+    profiler = cProfile.Profile()
+
+    def report():
+        profiler.disable()
+        profiler.dump_stats(path)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(25)
+        click.echo(stream.getvalue().strip('\n'), err=True)
+        click.echo("Profile written to %s" % path, err=True)
+    ctx.call_on_close(report)
+    profiler.enable()
+
+
+def _phase(name):
+    '''
+    Returns a context timing the given Stats phase when --stats is set.
+    '''
+    if _STATS is None:
+        return _nullcontext()
+    return _STATS.phase(name)
+
+
+def _timed(name):
+    '''
+    Decorates a function so that its calls are timed as the given Stats phase.
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _STATS is None:
+                return function(*args, **kwargs)
+            with _STATS.phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _count(name, value=1):
+    '''
+    Adds value to the given Stats counter when --stats is set.
+    '''
+    if _STATS is not None:
+        _STATS.counters[name] += value
+
+
+def _parse_delete_indexes(delete_indexes):
+    if delete_indexes:
+        try:
+            return PageSelection(delete_indexes)
+        except ValueError as e:
+            raise click.BadParameter("delete indexes must be a list of integers representing indexes in PDF.")
+    else:
+        raise click.BadParameter("must specify indexes to delete.")
+
+
+class PageSelection(object):
+    '''
+    A selection of page indexes parsed from a comma separated list of terms:
+
+    * ``3``, a single index. Negative indexes count back from the last page.
+    * ``3-7``, an inclusive range. ``7-3`` runs backwards and ``3-`` runs to the last page.
+    * ``0-9:2``, a range taking every second page.
+    * ``even`` and ``odd``, the even (0, 2, 4, ...) and odd (1, 3, 5, ...) indexes.
+
+    Terms are kept as ranges until they are resolved against the number of
+    pages of a document, so selecting pages 10-90000 costs the same as
+    selecting a single page.
+    '''
+    TERM = re.compile(r'^(-?\d+)(?:(-)(-?\d+)?)?(?::(\d+))?$')
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.terms = []
+        for part in spec.split(","):
+            part = part.strip().lower()
+            if part in ('even', 'odd'):
+                self.terms.append((0 if part == 'even' else 1, None, 2, True))
+                continue
+            match = self.TERM.match(part)
+            if not match:
+                raise ValueError("Invalid page selection %r" % part)
+            start, dash, stop, step = match.groups()
+            start = int(start)
+            if not dash:
+                stop = start
+            elif stop is not None:
+                stop = int(stop)
+            step = int(step) if step else 1
+            if step < 1:
+                raise ValueError("Invalid page selection step %r" % part)
+            self.terms.append((start, stop, step, False))
+
+    def __str__(self):
+        return self.spec
+
+    def ranges(self, num_pages):
+        '''
+        Returns one range of indexes per term. Raises IndexError when a term
+        falls outside of a document with num_pages pages.
+        '''
+        ranges = []
+        for start, stop, step, parity in self.terms:
+            if parity:
+                ranges.append(range(start, num_pages, step))
+                continue
+            start = self._resolve(start, num_pages)
+            stop = num_pages - 1 if stop is None else self._resolve(stop, num_pages)
+            if start <= stop:
+                ranges.append(range(start, stop + 1, step))
+            else:
+                ranges.append(range(start, stop - 1, -step))
+        return ranges
+
+    def indexes(self, num_pages):
+        '''
+        Returns an iterator over the selected indexes in selection order,
+        repeating indexes that are selected more than once.
+        '''
+        return itertools.chain.from_iterable(self.ranges(num_pages))
+
+    def mask(self, num_pages):
+        '''
+        Returns a bytearray with one byte per page, set for the selected
+        pages, for constant time membership tests.
+        '''
+        mask = bytearray(num_pages)
+        for indexes in self.ranges(num_pages):
+            if indexes.step < 0:
+                indexes = indexes[::-1]
+            mask[indexes.start:indexes.stop:indexes.step] = b'\x01' * len(indexes)
+        return mask
+
+    @staticmethod
+    def _resolve(index, num_pages):
+        if index < 0:
+            index += num_pages
+        if not 0 <= index < num_pages:
+            raise IndexError("Page index %s is out of range" % index)
+        return index
+
+
+class PagePlan(object):
+    '''
+    The output of a run: the indexes of the pages of the input in output
+    order, the rotation applied to all of them and how the output is written.
+    Steps only edit the plan, the input is read once when its pages are
+    copied to the output.
+    '''
+    STEPS = ('delete', 'reorder', 'rotate', 'dedupe', 'compress', 'xref-stream', 'linearize', 'encrypt')
+
+    def __init__(self, num_pages):
+        self.indexes = list(range(num_pages))
+        self.rotation = 0
+        self.dedupe = False
+        self.compress = None
+        self.xref_stream = False
+        self.linearize = False
+        self.encrypt = None
+
+    def apply(self, name, value=None):
+        '''
+        Applies the step name with its value, as given to the command of the
+        same name.
+        '''
+        if name not in self.STEPS:
+            raise click.BadParameter("Unknown step %s, steps are %s." % (name, ', '.join(self.STEPS)))
+        try:
+            if name == 'delete':
+                deleted = PageSelection(self._required(name, value)).mask(len(self.indexes))
+                self.indexes = [index for position, index in enumerate(self.indexes) if not deleted[position]]
+            elif name == 'reorder':
+                if self._required(name, value) == 'reverse':
+                    self.indexes.reverse()
+                else:
+                    self.indexes = [self.indexes[position]
+                                    for position in PageSelection(value).indexes(len(self.indexes))]
+            elif name == 'rotate':
+                if value not in ('clockwise', 'counter-clockwise'):
+                    raise ValueError("rotate must be clockwise or counter-clockwise")
+                self.rotation = (self.rotation + (90 if value == 'clockwise' else -90)) % 360
+            elif name == 'dedupe':
+                self.dedupe = True
+            elif name == 'compress':
+                self.compress = int(value or 9)
+                if not 1 <= self.compress <= 9:
+                    raise ValueError("compress must be a level from 1 to 9")
+            elif name == 'xref-stream':
+                self.xref_stream = True
+            elif name == 'linearize':
+                self.linearize = True
+            elif name == 'encrypt':
+                if (value or 'rc4-128') not in StandardSecurityHandler.ALGORITHMS:
+                    raise ValueError("encrypt must be one of %s" % ', '.join(StandardSecurityHandler.ALGORITHMS))
+                self.encrypt = value or 'rc4-128'
+        except IndexError:
+            raise click.BadParameter("Step %s: all indexes must be within range of the %s pages left."
+                                     % (name, len(self.indexes)))
+        except ValueError as e:
+            raise click.BadParameter("Step %s: %s." % (name, e))
+
+    def pages(self, pdf_reader):
+        '''
+        Yields the pages of pdf_reader in plan order, rotated.
+        '''
+        if self.rotation:
+            # Pages listed more than once share their page object, rotate it once.
+            for index in set(self.indexes):
+                pdf_reader.getPage(index).rotateClockwise(self.rotation)
+        for index in self.indexes:
+            yield pdf_reader.getPage(index)
+
+    @staticmethod
+    def _required(name, value):
+        if value is None:
+            raise ValueError("%s needs a value" % name)
+        return value
+
+
 def _encr_key_encoding(key):
     '''
     Passes the proper key encoding in Python 2 versus
@@ -382,14 +2128,1821 @@ def _strip_forward_slash(key):
     return key.strip('/')
 
 
+def _iter_pages(pdf_reader, indexes):
+    for index in indexes:
+        yield pdf_reader.getPage(index)
+
+
+def _write_options(kwargs):
+    '''
+    Returns the options of a command that select how _write_pages writes
+    its output.
+    '''
+    return {'stream': kwargs.get('stream', False),
+            'compress': kwargs.get('compress'),
+            'xref_stream': kwargs.get('xref_stream', False),
+            'linearize': kwargs.get('linearize', False)}
+
+
+def _check_incremental(kwargs):
+    if kwargs.get('incremental') and (kwargs.get('compress') or kwargs.get('xref_stream') or kwargs.get('linearize')):
+        raise click.UsageError("--compress, --xref-stream and --linearize cannot be combined with --incremental.")
+
+
+def _pdf_writer(pdf_writer_fp, compress=None, xref_stream=False, linearize=False, workers=None, encryption=None):
+    '''
+    Returns the StreamingPdfWriter, or LinearizedPdfWriter, writing to
+    pdf_writer_fp with the given output options.
+    '''
+    if linearize:
+        if xref_stream:
+            raise click.UsageError("--xref-stream cannot be combined with --linearize.")
+        if encryption is not None:
+            raise click.UsageError("Encrypted PDFs cannot be linearized.")
+        return LinearizedPdfWriter(pdf_writer_fp, compress=compress, workers=workers)
+    return StreamingPdfWriter(pdf_writer_fp, compress=compress, workers=workers, object_streams=xref_stream,
+                              encryption=encryption)
+
+
+def _write_pages(pages, pdf_writer_fp, stream=False, compress=None, xref_stream=False, linearize=False):
+    '''
+    Writes the given pages to pdf_writer_fp, serializing the output exactly
+    once. With stream set the pages are copied through a StreamingPdfWriter
+    so that finished objects are flushed to disk as they are copied. Setting
+    compress to a zlib level re-deflates streams, setting xref_stream packs
+    objects into object streams and setting linearize lays the file out for
+    fast web view, all of which also go through _pdf_writer.
+    '''
+    if stream or compress or xref_stream or linearize:
+        pdf_writer = _pdf_writer(pdf_writer_fp, compress=compress, xref_stream=xref_stream, linearize=linearize)
+        for page in pages:
+            pdf_writer.add_page(page)
+        pdf_writer.close()
+    else:
+        pdf_writer = PyPDF2.PdfFileWriter()
+        with _phase('copy'):
+            for page in pages:
+                pdf_writer.addPage(page)
+        with _phase('write'):
+            pdf_writer.write(pdf_writer_fp)
+        _count('objects_written', len(pdf_writer._objects))
+        _count('pages_written', pdf_writer.getNumPages())
+
+
+@_timed('write')
+def _write_incremental(pdf_reader, pdf_reader_fp, pages, pdf_writer_fp, rewrite_pages=False):
+    '''
+    Writes a copy of the source file followed by a PDF incremental update
+    that replaces the page tree with the given pages. Only the root page
+    tree node, and the page objects that have to change, are appended
+    together with a new cross-reference section chained to the original one.
+    The section is a cross-reference stream when the original one is.
+
+    Pages that already hang off the root page tree node are kept as they are
+    unless rewrite_pages is set, for example when their /Rotate changed.
+    '''
+    generic = PyPDF2.generic
+    if pdf_reader.isEncrypted:
+        raise click.BadParameter("Incremental updates cannot be written for encrypted PDFs.")
+
+    prev_xref = _find_startxref(pdf_reader_fp)
+    pdf_reader_fp.seek(prev_xref)
+    xref_stream = not pdf_reader_fp.read(4).startswith(b'xref')
+    if '/Size' in pdf_reader.trailer:
+        size = original_size = pdf_reader.trailer['/Size']
+    else:
+        # PyPDF2 leaves /Size out of the trailer of cross-reference streams.
+        numbers = [idnum for entries in pdf_reader.xref.values() for idnum in entries]
+        size = original_size = max(numbers + list(pdf_reader.xref_objStm)) + 1
+    root = pdf_reader.trailer['/Root'].getObject()
+    pages_ref = root.raw_get('/Pages')
+    if not isinstance(pages_ref, generic.IndirectObject):
+        raise click.BadParameter("Incremental updates require an indirect page tree.")
+    pages_ref = generic.IndirectObject(pages_ref.idnum, pages_ref.generation, None)
+    old_pages = pdf_reader.getObject(pages_ref)
+
+    updates = {}
+    kids = generic.ArrayObject()
+    used = set()
+    for page in pages:
+        ref = page.indirectRef
+        if ref is None or ref.idnum in used:
+            # A page listed twice needs a second page object.
+            ref = generic.IndirectObject(size, 0, None)
+            size += 1
+        else:
+            ref = generic.IndirectObject(ref.idnum, ref.generation, None)
+        used.add(ref.idnum)
+        parent = page.raw_get('/Parent') if '/Parent' in page else None
+        if rewrite_pages or ref.idnum >= original_size or \
+                not (isinstance(parent, generic.IndirectObject) and parent.idnum == pages_ref.idnum):
+            page_copy = generic.DictionaryObject(page)
+            page_copy[generic.NameObject('/Parent')] = pages_ref
+            updates[(ref.idnum, ref.generation)] = page_copy
+        kids.append(ref)
+
+    new_pages = generic.DictionaryObject()
+    for key in ('/Resources', '/MediaBox', '/CropBox', '/Rotate'):
+        if key in old_pages:
+            new_pages[generic.NameObject(key)] = old_pages.raw_get(key)
+    new_pages[generic.NameObject('/Type')] = generic.NameObject('/Pages')
+    new_pages[generic.NameObject('/Kids')] = kids
+    new_pages[generic.NameObject('/Count')] = generic.NumberObject(len(kids))
+    updates[(pages_ref.idnum, pages_ref.generation)] = new_pages
+
+    if isinstance(pdf_reader_fp, mmap.mmap):
+        pdf_writer_fp.write(memoryview(pdf_reader_fp))
+    elif isinstance(pdf_reader_fp, io.BytesIO):
+        with pdf_reader_fp.getbuffer() as buffer:
+            pdf_writer_fp.write(buffer)
+    else:
+        pdf_reader_fp.seek(0)
+        shutil.copyfileobj(pdf_reader_fp, pdf_writer_fp)
+    pdf_writer_fp.write(b'\n')
+
+    offsets = {}
+    for (idnum, generation), obj in sorted(updates.items()):
+        offsets[idnum] = (pdf_writer_fp.tell(), generation)
+        pdf_writer_fp.write(b'%d %d obj\n' % (idnum, generation) + _serialize(obj) + b'\nendobj\n')
+
+    xref_location = pdf_writer_fp.tell()
+    if xref_stream:
+        offsets[size] = (xref_location, 0)
+        size += 1
+    subsections = []
+    numbers = sorted(offsets)
+    start = 0
+    while start < len(numbers):
+        end = start
+        while end + 1 < len(numbers) and numbers[end + 1] == numbers[end] + 1:
+            end += 1
+        subsections.append(numbers[start:end + 1])
+        start = end + 1
+
+    trailer = generic.DictionaryObject()
+    for key in ('/Root', '/Info', '/ID'):
+        if key in pdf_reader.trailer:
+            trailer[generic.NameObject(key)] = pdf_reader.trailer.raw_get(key)
+    trailer[generic.NameObject('/Size')] = generic.NumberObject(size)
+    trailer[generic.NameObject('/Prev')] = generic.NumberObject(prev_xref)
+
+    if xref_stream:
+        # Updates to a file indexed by cross-reference streams have to be
+        # indexed by one too, listing only the objects of this section.
+        width = max(1, (xref_location.bit_length() + 7) // 8)
+        rows = [b'\x01' + offsets[idnum][0].to_bytes(width, 'big') + offsets[idnum][1].to_bytes(2, 'big')
+                for subsection in subsections for idnum in subsection]
+        xref = generic.StreamObject()
+        xref._data = zlib.compress(b''.join(rows))
+        xref.update(trailer)
+        xref.update({
+            generic.NameObject('/Type'): generic.NameObject('/XRef'),
+            generic.NameObject('/Index'): generic.ArrayObject(
+                [generic.NumberObject(number) for subsection in subsections
+                 for number in (subsection[0], len(subsection))]),
+            generic.NameObject('/W'): generic.ArrayObject(
+                [generic.NumberObject(1), generic.NumberObject(width), generic.NumberObject(2)]),
+            generic.NameObject('/Filter'): generic.NameObject('/FlateDecode'),
+        })
+        pdf_writer_fp.write(b'%d 0 obj\n' % (size - 1) + _serialize(xref) + b'\nendobj\n'
+                            b'startxref\n%d\n%%%%EOF\n' % xref_location)
+        return
+
+    lines = [b'xref\n']
+    for subsection in subsections:
+        lines.append(b'%d %d\n' % (subsection[0], len(subsection)))
+        for idnum in subsection:
+            lines.append(b'%010d %05d n \n' % offsets[idnum])
+    pdf_writer_fp.write(b''.join(lines))
+    pdf_writer_fp.write(b'trailer\n' + _serialize(trailer) + b'\nstartxref\n%d\n%%%%EOF\n' % xref_location)
+
+
+def _find_startxref(pdf_fp):
+    '''
+    Returns the offset of the last cross-reference section of the file.
+    '''
+    pdf_fp.seek(0, os.SEEK_END)
+    pdf_fp.seek(max(pdf_fp.tell() - 1024, 0))
+    tail = pdf_fp.read()
+    position = tail.rfind(b'startxref')
+    try:
+        return int(tail[position + len(b'startxref'):].split()[0])
+    except (IndexError, ValueError):
+        raise click.BadParameter("Could not find the cross-reference table of the PDF.")
+
+
+class QuickInfoReader(object):
+    '''
+    Reads single objects of a PDF through its trailer without parsing the
+    whole cross-reference table. Subsection headers of each xref section
+    are read, and the fixed size entries are only looked up for the
+    objects that are actually resolved, so the trailer, /Info and
+    /Pages /Count cost a handful of seeks whatever the size of the file.
+
+    Only classic cross-reference tables are supported; read() returns None
+    for files using cross-reference streams.
+    '''
+    XREF_ENTRY_SIZE = 20
+    READ_SIZE = 4096
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.trailer = None
+        self._sections = []
+        self._resolved = {}
+
+    def read(self):
+        section = self._read_section(_find_startxref(self.stream))
+        if section is None:
+            return None
+        self._sections.append(section)
+        self.trailer = section[1]
+        return self.trailer
+
+    def getObject(self, indirect_reference):
+        key = (indirect_reference.idnum, indirect_reference.generation)
+        if key not in self._resolved:
+            offset = self._lookup(*key)
+            if offset is None:
+                raise LookupError("Object %s %s not found" % key)
+            self.stream.seek(offset)
+            header = self.stream.read(32)
+            match = re.match(br'\s*(\d+)\s+(\d+)\s+obj', header)
+            if not match or (int(match.group(1)), int(match.group(2))) != key:
+                raise LookupError("Object %s %s not found at its offset" % key)
+            self.stream.seek(offset + match.end())
+            self._skip_whitespace()
+            self._resolved[key] = PyPDF2.generic.readObject(self.stream, self)
+        return self._resolved[key]
+
+    def _lookup(self, idnum, generation):
+        index = 0
+        while True:
+            if index == len(self._sections):
+                prev = self._sections[-1][1].get('/Prev')
+                section = self._read_section(prev) if prev is not None else None
+                if section is None:
+                    return None
+                self._sections.append(section)
+            for start, count, entries in self._sections[index][0]:
+                if start <= idnum < start + count:
+                    self.stream.seek(entries + (idnum - start) * self.XREF_ENTRY_SIZE)
+                    offset, entry_generation, kind = self.stream.read(self.XREF_ENTRY_SIZE).split()[:3]
+                    if kind != b'n' or int(entry_generation) != generation:
+                        return None
+                    return int(offset)
+            index += 1
+
+    def _read_section(self, offset):
+        '''
+        Returns the subsections of the xref table at offset as (first object
+        number, count, offset of the first entry) together with its trailer.
+        '''
+        self.stream.seek(offset)
+        if self.stream.read(4) != b'xref':
+            return None
+        subsections = []
+        while True:
+            self._skip_whitespace()
+            line_start = self.stream.tell()
+            line = self.stream.readline()
+            if line.startswith(b'trailer'):
+                self.stream.seek(line_start + len(b'trailer'))
+                self._skip_whitespace()
+                return subsections, PyPDF2.generic.readObject(self.stream, self)
+            start, count = [int(num) for num in line.split()[:2]]
+            entries = line_start + len(line)
+            subsections.append((start, count, entries))
+            self.stream.seek(entries + count * self.XREF_ENTRY_SIZE)
+
+    def _skip_whitespace(self):
+        PyPDF2.utils.readNonWhitespace(self.stream)
+        self.stream.seek(-1, 1)
+
+
+class StreamingPdfWriter(object):
+    '''
+    Writes pages to a binary file object one indirect object at a time.
+
+    Every object reachable from an added page is copied and written out
+    before the next page is added, and is then dropped from the source
+    reader's object cache. Only the object offsets, the mapping of source
+    references to output object numbers and the page list are kept until
+    close() writes the page tree, the catalog and the cross-reference table.
+
+    With compress set to a zlib level, the streams copied for each page are
+    re-deflated on a pool of worker threads before being written, since
+    zlib releases the GIL while compressing.
+
+    With object_streams set, a PDF 1.5 file is written instead: every object
+    that is not itself a stream is packed, OBJECTS_PER_STREAM at a time, into
+    compressed object streams and the classic cross-reference table is
+    replaced by a binary cross-reference stream.
+
+    With encryption set to a StandardSecurityHandler the output is encrypted
+    with it, and readers registered with add_decryption are decrypted as
+    their objects are copied. Objects are then collected until their streams
+    add up to BATCH_SIZE bytes, and the streams of a batch are decrypted,
+    compressed and encrypted in parallel. The ciphers of the cryptography
+    package release the GIL and run on threads, the pure Python RC4 used
+    without it runs on a pool of worker processes. Batches smaller than
+    PARALLEL_SIZE, as are whole small documents, are processed on the
+    calling thread since starting workers would cost more than it saves, so
+    pools are only started once a batch needs them.
+    '''
+    OBJECTS_PER_STREAM = 100
+    BATCH_SIZE = 16 * 1024 * 1024
+    PARALLEL_SIZE = 1024 * 1024
+
+    def __init__(self, stream, compress=None, workers=None, object_streams=False, encryption=None):
+        self._stream = stream
+        self._compress = compress
+        self._workers = workers
+        self._executor = None
+        self._process_executor = None
+        self._encryption = encryption
+        self._decryptions = {}
+        self._batch = []
+        self._batch_size = 0
+        self._batching = bool(compress or encryption)
+        self._object_streams = object_streams
+        self._packed = []
+        self._packed_locations = {}
+        self._position = 0
+        self._offsets = {}
+        self._next_number = 1
+        self._references = {}
+        self._digests = {}
+        self._digest_numbers = {}
+        self._page_numbers = []
+        self._pages_number = self._reserve()
+        self.deduplicated_objects = 0
+        self.deduplicated_bytes = 0
+        self._write(b'%PDF-1.5\n' if object_streams else b'%PDF-1.3\n')
+        self._write(b'%\xe2\xe3\xcf\xd3\n')
+
+    @_timed('copy')
+    def add_page(self, page):
+        '''
+        Copies page, and every object it references, into the output.
+        '''
+        references = self._references.setdefault(page.pdf, {})
+        number = self._reserve()
+        if page.indirectRef is not None:
+            references.setdefault((page.indirectRef.idnum, page.indirectRef.generation), number)
+
+        pending = collections.deque()
+        page_copy = self._copy(page, references, pending)
+        page_copy[PyPDF2.generic.NameObject('/Parent')] = PyPDF2.generic.IndirectObject(self._pages_number, 0, None)
+        self._page_numbers.append(number)
+
+        objects = [(number, page_copy, self._decryption_key(page.pdf, page.indirectRef))]
+        while pending:
+            number, reference = pending.popleft()
+            obj = self._copy(reference.getObject(), references, pending)
+            objects.append((number, obj, self._decryption_key(reference.pdf, reference)))
+            reference.pdf.resolvedObjects.pop((reference.generation, reference.idnum), None)
+
+        if not self._batching:
+            for number, obj, _ in objects:
+                self._write_object(number, obj)
+            return
+        self._batch.extend(objects)
+        self._batch_size += sum(len(obj._data) for _, obj, _ in objects
+                                if isinstance(obj, PyPDF2.generic.StreamObject))
+        if self._batch_size >= self.BATCH_SIZE:
+            self._flush_batch()
+
+    def add_decryption(self, pdf_reader, security_handler):
+        '''
+        Registers the StandardSecurityHandler of pdf_reader, which must have
+        been opened with _security_handler so that it returns its objects
+        still encrypted. Their strings and streams are decrypted as they are
+        copied.
+        '''
+        self._decryptions[pdf_reader] = security_handler
+        self._batching = True
+
+    def add_digests(self, pdf_reader, digests):
+        '''
+        Registers the stream digests of pdf_reader computed by _stream_digests.
+        A stream whose digest matches one already written, from any reader,
+        is replaced by a reference to that object instead of being copied.
+        '''
+        self._digests[pdf_reader] = digests
+
+    def release(self, pdf_reader):
+        '''
+        Forgets the object mapping kept for pdf_reader. Pages added from it
+        afterwards will have their shared objects copied again.
+        '''
+        self._references.pop(pdf_reader, None)
+        self._digests.pop(pdf_reader, None)
+        self._decryptions.pop(pdf_reader, None)
+
+    @_timed('write')
+    def close(self):
+        '''
+        Writes the page tree, catalog, info dictionary and cross-reference
+        table or stream. The underlying stream is left open.
+        '''
+        generic = PyPDF2.generic
+        self._flush_batch()
+        pages = generic.DictionaryObject({
+            generic.NameObject('/Type'): generic.NameObject('/Pages'),
+            generic.NameObject('/Kids'): generic.ArrayObject(
+                generic.IndirectObject(number, 0, None) for number in self._page_numbers),
+            generic.NameObject('/Count'): generic.NumberObject(len(self._page_numbers)),
+        })
+        self._write_object(self._pages_number, pages)
+
+        root_number = self._reserve()
+        self._write_object(root_number, generic.DictionaryObject({
+            generic.NameObject('/Type'): generic.NameObject('/Catalog'),
+            generic.NameObject('/Pages'): generic.IndirectObject(self._pages_number, 0, None),
+        }))
+        info_number = self._reserve()
+        self._write_object(info_number, generic.DictionaryObject({
+            generic.NameObject('/Producer'): generic.createStringObject('pdfcli'),
+        }))
+
+        if self._object_streams:
+            self._flush_packed()
+        if self._encryption is not None:
+            # The encryption dictionary is neither encrypted nor packed.
+            self._encryption_number = self._reserve()
+            self._offsets[self._encryption_number] = self._position
+            self._write(b'%d 0 obj\n' % self._encryption_number + _serialize(self._encryption.dictionary) +
+                        b'\nendobj\n')
+
+        if self._object_streams:
+            self._write_xref_stream(root_number, info_number)
+        else:
+            self._write_xref_table(root_number, info_number)
+        _count('objects_written', self._next_number - 1)
+        _count('pages_written', len(self._page_numbers))
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self._process_executor is not None:
+            self._process_executor.shutdown()
+
+    def _write_xref_table(self, root_number, info_number):
+        generic = PyPDF2.generic
+        xref_location = self._position
+        size = self._next_number
+        lines = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+        for number in range(1, size):
+            lines.append(b'%010d 00000 n \n' % self._offsets[number])
+        self._write(b''.join(lines))
+
+        trailer = generic.DictionaryObject({
+            generic.NameObject('/Size'): generic.NumberObject(size),
+            generic.NameObject('/Root'): generic.IndirectObject(root_number, 0, None),
+            generic.NameObject('/Info'): generic.IndirectObject(info_number, 0, None),
+        })
+        self._add_encryption(trailer)
+        self._write(b'trailer\n' + _serialize(trailer) + b'\nstartxref\n%d\n%%%%EOF\n' % xref_location)
+
+    def _write_xref_stream(self, root_number, info_number):
+        generic = PyPDF2.generic
+        xref_number = self._reserve()
+        xref_location = self._offsets[xref_number] = self._position
+        size = self._next_number
+
+        # Type 1 entries hold byte offsets and type 2 entries the number of
+        # the object stream and the index within it, so the middle field is
+        # sized for whichever of the two is largest.
+        width = max(1, (max(xref_location, size).bit_length() + 7) // 8)
+        rows = [b'\x00' + bytes(width) + b'\xff\xff']
+        for number in range(1, size):
+            if number in self._offsets:
+                rows.append(b'\x01' + self._offsets[number].to_bytes(width, 'big') + b'\x00\x00')
+            else:
+                stream_number, index = self._packed_locations[number]
+                rows.append(b'\x02' + stream_number.to_bytes(width, 'big') + index.to_bytes(2, 'big'))
+
+        xref = generic.StreamObject()
+        xref._data = zlib.compress(b''.join(rows), self._compress or zlib.Z_DEFAULT_COMPRESSION)
+        xref.update({
+            generic.NameObject('/Type'): generic.NameObject('/XRef'),
+            generic.NameObject('/Size'): generic.NumberObject(size),
+            generic.NameObject('/W'): generic.ArrayObject(
+                [generic.NumberObject(1), generic.NumberObject(width), generic.NumberObject(2)]),
+            generic.NameObject('/Filter'): generic.NameObject('/FlateDecode'),
+            generic.NameObject('/Root'): generic.IndirectObject(root_number, 0, None),
+            generic.NameObject('/Info'): generic.IndirectObject(info_number, 0, None),
+        })
+        self._add_encryption(xref)
+        self._write(b'%d 0 obj\n' % xref_number + _serialize(xref) + b'\nendobj\n')
+        self._write(b'startxref\n%d\n%%%%EOF\n' % xref_location)
+
+    def _flush_packed(self):
+        '''
+        Writes the objects packed so far as one compressed object stream.
+        '''
+        if not self._packed:
+            return
+        generic = PyPDF2.generic
+        stream_number = self._reserve()
+        header = []
+        bodies = []
+        offset = 0
+        for index, (number, data) in enumerate(self._packed):
+            header.append(b'%d %d' % (number, offset))
+            bodies.append(data)
+            offset += len(data) + 1
+            self._packed_locations[number] = (stream_number, index)
+        header = b' '.join(header) + b'\n'
+
+        object_stream = generic.StreamObject()
+        object_stream._data = zlib.compress(header + b'\n'.join(bodies),
+                                            self._compress or zlib.Z_DEFAULT_COMPRESSION)
+        if self._encryption is not None and self._encryption.streams:
+            object_stream._data = _crypt(self._encryption.streams, self._encryption.object_key(stream_number, 0),
+                                         object_stream._data)
+        object_stream.update({
+            generic.NameObject('/Type'): generic.NameObject('/ObjStm'),
+            generic.NameObject('/N'): generic.NumberObject(len(self._packed)),
+            generic.NameObject('/First'): generic.NumberObject(len(header)),
+            generic.NameObject('/Filter'): generic.NameObject('/FlateDecode'),
+        })
+        self._packed = []
+        self._offsets[stream_number] = self._position
+        self._write(b'%d 0 obj\n' % stream_number + _serialize(object_stream) + b'\nendobj\n')
+
+    def _reserve(self):
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def _write(self, data):
+        self._stream.write(data)
+        self._position += len(data)
+
+    def _write_object(self, number, obj):
+        if self._object_streams and not isinstance(obj, PyPDF2.generic.StreamObject):
+            self._packed.append((number, _serialize(obj)))
+            if len(self._packed) == self.OBJECTS_PER_STREAM:
+                self._flush_packed()
+            return
+        if self._encryption is not None and self._encryption.strings:
+            obj = _crypt_strings(obj, self._encryption.strings, self._encryption.object_key(number, 0))
+        self._offsets[number] = self._position
+        self._write(b'%d 0 obj\n' % number + _serialize(obj) + b'\nendobj\n')
+
+    def _add_encryption(self, trailer):
+        if self._encryption is not None:
+            generic = PyPDF2.generic
+            trailer[generic.NameObject('/Encrypt')] = generic.IndirectObject(self._encryption_number, 0, None)
+            trailer[generic.NameObject('/ID')] = generic.ArrayObject(
+                [generic.ByteStringObject(self._encryption.document_id)] * 2)
+
+    def _decryption_key(self, pdf_reader, reference):
+        '''
+        Returns the security handler and object key decrypting the object
+        copied from reference, or None if it is not encrypted. Objects stored
+        in object streams are only encrypted as part of their object stream.
+        '''
+        security_handler = self._decryptions.get(pdf_reader)
+        if security_handler is None or reference is None or reference.idnum in pdf_reader.xref_objStm:
+            return None
+        return security_handler, security_handler.object_key(reference.idnum, reference.generation)
+
+    def _flush_batch(self):
+        '''
+        Decrypts, compresses and encrypts the streams of the batched objects
+        in parallel, one step at a time, then writes the objects in order.
+        '''
+        parallel = self._workers != 1 and self._batch_size >= self.PARALLEL_SIZE
+        batch, self._batch, self._batch_size = self._batch, [], 0
+        objects = []
+        streams = []
+        decrypt_jobs = []
+        for number, obj, decryption in batch:
+            if decryption is not None:
+                security_handler, key = decryption
+                if security_handler.strings:
+                    obj = _crypt_strings(obj, security_handler.strings, key, decrypt=True)
+            objects.append((number, obj))
+            if isinstance(obj, PyPDF2.generic.StreamObject):
+                streams.append((number, obj))
+                if decryption is not None and security_handler.encrypts_stream(obj):
+                    decrypt_jobs.append((obj, (security_handler.streams, key, obj._data, True)))
+        for (obj, _), data in zip(decrypt_jobs, self._crypt_map([job for _, job in decrypt_jobs], parallel)):
+            obj._data = data
+
+        if self._compress:
+            list(self._map(parallel, _deflate_stream, (obj for _, obj in streams), itertools.repeat(self._compress)))
+
+        if self._encryption is not None and self._encryption.streams:
+            jobs = [(self._encryption.streams, self._encryption.object_key(number, 0), obj._data, False)
+                    for number, obj in streams]
+            for (_, obj), data in zip(streams, self._crypt_map(jobs, parallel)):
+                obj._data = data
+
+        for number, obj in objects:
+            self._write_object(number, obj)
+
+    def _map(self, parallel, function, *iterables):
+        '''
+        Maps function over iterables on the pool of worker threads, or on the
+        calling thread unless parallel is set.
+        '''
+        if not parallel:
+            return map(function, *iterables)
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._workers)
+        return self._executor.map(function, *iterables)
+
+    def _crypt_map(self, jobs, parallel):
+        if not jobs:
+            return []
+        if Cipher is not None or not parallel:
+            return self._map(parallel, _crypt_job, jobs)
+        if self._process_executor is None:
+            self._process_executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._workers)
+        return self._process_executor.map(_crypt_job, jobs, chunksize=4)
+
+    def _copy(self, obj, references, pending):
+        generic = PyPDF2.generic
+        if isinstance(obj, generic.IndirectObject):
+            key = (obj.idnum, obj.generation)
+            number = references.get(key)
+            if number is None:
+                digest, size = self._digests.get(obj.pdf, {}).get(key, (None, 0))
+                number = self._digest_numbers.get(digest)
+                if number is not None:
+                    self.deduplicated_objects += 1
+                    self.deduplicated_bytes += size
+                    references[key] = number
+                else:
+                    number = references[key] = self._reserve()
+                    if digest is not None:
+                        self._digest_numbers[digest] = number
+                    pending.append((number, obj))
+            return generic.IndirectObject(number, 0, None)
+        elif isinstance(obj, generic.StreamObject):
+            stream_copy = generic.StreamObject()
+            stream_copy._data = obj._data
+            for key, value in obj.items():
+                if key != '/Length':
+                    stream_copy[key] = self._copy(value, references, pending)
+            return stream_copy
+        elif isinstance(obj, generic.DictionaryObject):
+            # Pages reached through annotations or destinations rather than
+            # through add_page are copied without their parent, which would
+            # otherwise drag the whole source page tree into the output.
+            orphan_page = obj.get('/Type') == '/Page'
+            dict_copy = generic.DictionaryObject()
+            for key, value in obj.items():
+                if not (orphan_page and key == '/Parent'):
+                    dict_copy[key] = self._copy(value, references, pending)
+            return dict_copy
+        elif isinstance(obj, generic.ArrayObject):
+            return generic.ArrayObject(self._copy(value, references, pending) for value in obj)
+        return obj
+
+
+class LinearizedPdfWriter(StreamingPdfWriter):
+    '''
+    Writes pages as a linearized PDF, the "fast web view" layout, so that a
+    viewer can render the first page after fetching the start of the file.
+
+    Pages are copied as with StreamingPdfWriter, but the copies are kept in
+    memory until close(), which renumbers them and lays the file out as
+    described in Annex F of the PDF specification: the linearization
+    dictionary and first page cross-reference table, the catalog, the
+    primary hint stream, the objects of the first page, the objects of
+    every other page in page order, the objects shared between pages and
+    finally the page tree, the info dictionary and the main cross-reference
+    table.
+    '''
+
+    def __init__(self, stream, compress=None, workers=None):
+        super(LinearizedPdfWriter, self).__init__(stream, compress=compress, workers=workers)
+        self._objects = {}
+
+    @_timed('write')
+    def close(self):
+        '''
+        Lays out and writes the whole file. The underlying stream is left
+        open.
+        '''
+        generic = PyPDF2.generic
+        self._flush_batch()
+        objects = self._objects
+        objects[self._pages_number] = generic.DictionaryObject({
+            generic.NameObject('/Type'): generic.NameObject('/Pages'),
+            generic.NameObject('/Kids'): generic.ArrayObject(
+                generic.IndirectObject(number, 0, None) for number in self._page_numbers),
+            generic.NameObject('/Count'): generic.NumberObject(len(self._page_numbers)),
+        })
+        root_number = self._reserve()
+        objects[root_number] = generic.DictionaryObject({
+            generic.NameObject('/Type'): generic.NameObject('/Catalog'),
+            generic.NameObject('/Pages'): generic.IndirectObject(self._pages_number, 0, None),
+        })
+        info_number = self._reserve()
+        objects[info_number] = generic.DictionaryObject({
+            generic.NameObject('/Producer'): generic.createStringObject('pdfcli'),
+        })
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self._process_executor is not None:
+            self._process_executor.shutdown()
+
+        page_objects, users = self._page_objects()
+        first_page = page_objects[0]
+        other_pages = [numbers[:1] + [number for number in numbers[1:] if users[number] == 1]
+                       for numbers in page_objects[1:]]
+        shared = []
+        placed = set(first_page)
+        for numbers in page_objects[1:]:
+            for number in numbers[1:]:
+                if users[number] > 1 and number not in placed:
+                    shared.append(number)
+                    placed.add(number)
+        placed.update(itertools.chain.from_iterable(other_pages))
+        placed.update([root_number, self._pages_number, info_number])
+        remaining = [self._pages_number, info_number] + [number for number in sorted(objects) if number not in placed]
+
+        # Objects after the first page section are numbered from 1 and are
+        # listed in the main cross-reference table. The linearization
+        # dictionary, catalog, hint stream and first page objects follow.
+        main_order = list(itertools.chain(itertools.chain.from_iterable(other_pages), shared, remaining))
+        first_number = len(main_order) + 1
+        renumbered = dict((number, index) for index, number in enumerate(main_order, 1))
+        renumbered[root_number] = first_number + 1
+        renumbered.update((number, index) for index, number in enumerate(first_page, first_number + 3))
+        size = first_number + 3 + len(first_page)
+
+        data = {}
+        for number, obj in objects.items():
+            data[number] = b'%d 0 obj\n' % renumbered[number] + _serialize(_renumber(obj, renumbered)) + b'\nendobj\n'
+        objects.clear()
+        document_id = hashlib.md5(b''.join(data[number] for number in first_page)).hexdigest().encode()
+
+        # The values in the linearization dictionary and first page trailer
+        # are padded to a fixed width so that their length is known before
+        # the offsets they hold are.
+        def linearization(length, hint_offset, hint_length, end_of_first_page, main_xref_entries):
+            return b'%d 0 obj\n<< /Linearized 1 /L %10d /H [ %10d %10d ] /O %d /E %10d /N %d /T %10d >>\nendobj\n' % (
+                first_number, length, hint_offset, hint_length, renumbered[first_page[0]], end_of_first_page,
+                len(self._page_numbers), main_xref_entries)
+
+        def first_page_xref(offsets, main_xref):
+            lines = [b'xref\n%d %d\n' % (first_number, size - first_number)]
+            lines.extend(b'%010d 00000 n \n' % offset for offset in offsets)
+            lines.append(b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R /ID [ <%s> <%s> ] /Prev %10d >>\n'
+                         b'startxref\n0\n%%%%EOF\n' % (size, renumbered[root_number], renumbered[info_number],
+                                                      document_id, document_id, main_xref))
+            return b''.join(lines)
+
+        linearization_offset = self._position
+        first_xref_offset = linearization_offset + len(linearization(0, 0, 0, 0, 0))
+        catalog_offset = first_xref_offset + len(first_page_xref([0] * (size - first_number), 0))
+        hint_offset = catalog_offset + len(data[root_number])
+
+        # The hint tables give offsets as if the hint stream were left out.
+        offsets = {}
+        position = hint_offset
+        for number in itertools.chain(first_page, main_order):
+            offsets[number] = position
+            position += len(data[number])
+        hint = self._hint_stream(page_objects, users, other_pages, shared, offsets,
+                                 dict((number, len(data[number])) for number in offsets), renumbered)
+        hint_data = b'%d 0 obj\n' % (first_number + 2) + _serialize(hint) + b'\nendobj\n'
+        for number in offsets:
+            offsets[number] += len(hint_data)
+
+        main_xref_offset = position + len(hint_data)
+        main_xref = b''.join([b'xref\n0 %d\n' % first_number, b'0000000000 65535 f \n'] +
+                             [b'%010d 00000 n \n' % offsets[number] for number in main_order])
+        main_xref += b'trailer\n<< /Size %d >>\nstartxref\n%d\n%%%%EOF\n' % (first_number, first_xref_offset)
+        end_of_first_page = offsets[first_page[-1]] + len(data[first_page[-1]])
+
+        self._write(linearization(main_xref_offset + len(main_xref), hint_offset, len(hint_data), end_of_first_page,
+                                  main_xref_offset + len(b'xref\n0 %d' % first_number)))
+        self._write(first_page_xref([linearization_offset, catalog_offset, hint_offset] +
+                                    [offsets[number] for number in first_page], main_xref_offset))
+        self._write(data[root_number])
+        self._write(hint_data)
+        for number in itertools.chain(first_page, main_order):
+            self._write(data[number])
+        self._write(main_xref)
+        _count('objects_written', size - 1)
+        _count('pages_written', len(self._page_numbers))
+
+    def _write_object(self, number, obj):
+        self._objects[number] = obj
+
+    def _page_objects(self):
+        '''
+        Returns the numbers of the objects each page needs, page object
+        first, and a Counter of how many pages need each of them. Other pages
+        and the page tree are not followed, so that links between pages do
+        not make their objects shared.
+        '''
+        boundary = set(self._page_numbers)
+        boundary.add(self._pages_number)
+        page_objects = []
+        users = collections.Counter()
+        for number in self._page_numbers:
+            reached = [number]
+            seen = set(reached)
+            queue = collections.deque(reached)
+            while queue:
+                for reference in _references(self._objects[queue.popleft()]):
+                    number = reference.idnum
+                    if number not in seen and number not in boundary and number in self._objects:
+                        seen.add(number)
+                        reached.append(number)
+                        queue.append(number)
+            page_objects.append(reached)
+            users.update(reached[1:])
+        return page_objects, users
+
+    def _hint_stream(self, page_objects, users, other_pages, shared, offsets, lengths, renumbered):
+        '''
+        Builds the primary hint stream, holding the page offset hint table
+        and the shared object hint table. Every object of the first page and
+        every shared object is a shared object group of its own.
+        '''
+        generic = PyPDF2.generic
+        first_page = page_objects[0]
+        groups = first_page + shared
+        group_ids = dict((number, index) for index, number in enumerate(groups))
+        page_counts = [len(first_page)] + [len(numbers) for numbers in other_pages]
+        page_lengths = [sum(lengths[number] for number in numbers) for numbers in [first_page] + other_pages]
+        page_shared = [[]] + [[group_ids[number] for number in numbers[1:] if users[number] > 1]
+                              for numbers in page_objects[1:]]
+
+        least_count = min(page_counts)
+        least_length = min(page_lengths)
+        count_bits = (max(page_counts) - least_count).bit_length()
+        length_bits = (max(page_lengths) - least_length).bit_length()
+        shared_ids = list(itertools.chain.from_iterable(page_shared))
+        shared_count_bits = max(len(ids) for ids in page_shared).bit_length()
+        shared_id_bits = max(shared_ids or [0]).bit_length()
+
+        # Content streams are described as spanning the whole page, as most
+        # writers do.
+        page_table = _BitWriter()
+        page_table.write(least_count, 32)
+        page_table.write(offsets[first_page[0]], 32)
+        page_table.write(count_bits, 16)
+        page_table.write(least_length, 32)
+        page_table.write(length_bits, 16)
+        page_table.write(0, 32)
+        page_table.write(0, 16)
+        page_table.write(least_length, 32)
+        page_table.write(length_bits, 16)
+        page_table.write(shared_count_bits, 16)
+        page_table.write(shared_id_bits, 16)
+        page_table.write(0, 16)
+        page_table.write(1, 16)
+        for count in page_counts:
+            page_table.write(count - least_count, count_bits)
+        page_table.flush()
+        for length in page_lengths:
+            page_table.write(length - least_length, length_bits)
+        page_table.flush()
+        for ids in page_shared:
+            page_table.write(len(ids), shared_count_bits)
+        page_table.flush()
+        for group_id in shared_ids:
+            page_table.write(group_id, shared_id_bits)
+        page_table.flush()
+        for length in page_lengths:
+            page_table.write(length - least_length, length_bits)
+        page_table.flush()
+
+        group_lengths = [lengths[number] for number in groups]
+        least_group = min(group_lengths)
+        group_bits = (max(group_lengths) - least_group).bit_length()
+        shared_table = _BitWriter()
+        shared_table.write(renumbered[shared[0]] if shared else 0, 32)
+        shared_table.write(offsets[shared[0]] if shared else 0, 32)
+        shared_table.write(len(first_page), 32)
+        shared_table.write(len(groups), 32)
+        shared_table.write(0, 16)
+        shared_table.write(least_group, 32)
+        shared_table.write(group_bits, 16)
+        for length in group_lengths:
+            shared_table.write(length - least_group, group_bits)
+        shared_table.flush()
+        for _ in groups:
+            shared_table.write(0, 1)
+        shared_table.flush()
+
+        page_data = page_table.getvalue()
+        hint = generic.StreamObject()
+        hint._data = page_data + shared_table.getvalue()
+        hint[generic.NameObject('/S')] = generic.NumberObject(len(page_data))
+        return hint
+
+
+class _BitWriter(object):
+    '''
+    Packs unsigned integers of any bit width, most significant bit first,
+    as the hint tables of linearized files are.
+    '''
+
+    def __init__(self):
+        self._data = bytearray()
+        self._value = 0
+        self._bits = 0
+
+    def write(self, value, bits):
+        self._value = (self._value << bits) | value
+        self._bits += bits
+        while self._bits >= 8:
+            self._bits -= 8
+            self._data.append(self._value >> self._bits)
+            self._value &= (1 << self._bits) - 1
+
+    def flush(self):
+        '''
+        Pads the last byte with zero bits.
+        '''
+        if self._bits:
+            self.write(0, 8 - self._bits)
+
+    def getvalue(self):
+        self.flush()
+        return bytes(self._data)
+
+
+def _references(obj):
+    '''
+    Yields every indirect reference held by obj, not following them.
+    '''
+    if isinstance(obj, PyPDF2.generic.IndirectObject):
+        yield obj
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            for reference in _references(value):
+                yield reference
+    elif isinstance(obj, list):
+        for value in obj:
+            for reference in _references(value):
+                yield reference
+
+
+def _renumber(obj, numbers):
+    '''
+    Replaces, in place, every indirect reference held by obj with one to the
+    object number numbers maps it to, and returns obj.
+    '''
+    if isinstance(obj, PyPDF2.generic.IndirectObject):
+        return PyPDF2.generic.IndirectObject(numbers[obj.idnum], 0, None)
+    elif isinstance(obj, dict):
+        for key, value in list(obj.items()):
+            obj[key] = _renumber(value, numbers)
+    elif isinstance(obj, list):
+        for index, value in enumerate(obj):
+            obj[index] = _renumber(value, numbers)
+    return obj
+
+
+class StandardSecurityHandler(object):
+    '''
+    The PDF standard security handler: RC4 with 40 to 128 bit keys
+    (revisions 2 and 3), AES-128 (revision 4) and AES-256 (revision 6).
+
+    A handler is opened from the /Encrypt dictionary of a file and a
+    password, or created for a new file. It holds the file key and the
+    ciphers used for strings and streams, 'rc4', 'aes' or None when they are
+    left in the clear. AES needs the cryptography package, RC4 uses it when
+    it is installed and falls back on pure Python otherwise.
+    '''
+    PADDING = (b'\x28\xbf\x4e\x5e\x4e\x75\x8a\x41\x64\x00\x4e\x56\xff\xfa\x01\x08'
+               b'\x2e\x2e\x00\xb6\xd0\x68\x3e\x80\x2f\x0c\xa9\xfe\x64\x53\x69\x7a')
+    ALGORITHMS = ('rc4-128', 'aes-128', 'aes-256')
+
+    def __init__(self, key, revision, strings, streams, encrypt_metadata=True, dictionary=None, document_id=None):
+        self.key = key
+        self.revision = revision
+        self.strings = strings
+        self.streams = streams
+        self.encrypt_metadata = encrypt_metadata
+        self.dictionary = dictionary
+        self.document_id = document_id
+
+    @classmethod
+    def open(cls, encrypt, document_id, password):
+        '''
+        Returns the handler of the /Encrypt dictionary encrypt if password is
+        its user or owner password, None otherwise.
+        '''
+        if encrypt.get('/Filter') != '/Standard':
+            raise NotImplementedError("Only the standard security handler is supported.")
+        version = encrypt.get('/V', 0)
+        revision = encrypt['/R']
+        strings = streams = 'rc4'
+        length = encrypt.get('/Length', 40) // 8 if revision > 2 else 5
+        if version >= 4:
+            strings = cls._crypt_filter(encrypt, '/StrF')
+            streams = cls._crypt_filter(encrypt, '/StmF')
+            length = 32 if version == 5 else 16
+        if 'aes' in (strings, streams) and Cipher is None:
+            raise NotImplementedError("AES encrypted files need the cryptography package.")
+        encrypt_metadata = bool(encrypt.get('/EncryptMetadata', True))
+        owner_entry = encrypt['/O'].original_bytes
+        user_entry = encrypt['/U'].original_bytes
+        if revision >= 5:
+            if not isinstance(password, bytes):
+                password = password.encode('utf-8')
+            password = password[:127]
+            if cls._hash(password, owner_entry[32:40], user_entry[:48], revision) == owner_entry[:32]:
+                key = _aes_raw(cls._hash(password, owner_entry[40:48], user_entry[:48], revision),
+                               encrypt['/OE'].original_bytes, decrypt=True)
+            elif cls._hash(password, user_entry[32:40], b'', revision) == user_entry[:32]:
+                key = _aes_raw(cls._hash(password, user_entry[40:48], b'', revision),
+                               encrypt['/UE'].original_bytes, decrypt=True)
+            else:
+                return None
+            return cls(key, revision, strings, streams, encrypt_metadata)
+
+        if not isinstance(password, bytes):
+            password = password.encode('latin-1', 'replace')
+        p_entry = encrypt['/P']
+        for candidate in (password, cls._owner_to_user(password, owner_entry, revision, length)):
+            key = cls._file_key(candidate, owner_entry, p_entry, document_id, revision, length, encrypt_metadata)
+            compared = 16 if revision >= 3 else 32
+            if cls._user_entry(key, document_id, revision)[:compared] == user_entry[:compared]:
+                return cls(key, revision, strings, streams, encrypt_metadata)
+        return None
+
+    @classmethod
+    def create(cls, password, algorithm='rc4-128'):
+        '''
+        Returns a handler for a new file encrypted with algorithm, one of
+        ALGORITHMS, whose user and owner password are both password.
+        '''
+        generic = PyPDF2.generic
+        if algorithm.startswith('aes') and Cipher is None:
+            raise click.UsageError("AES encryption needs the cryptography package, install it with "
+                                   "pip install cryptography.")
+        document_id = os.urandom(16)
+        p_entry = -1
+        dictionary = generic.DictionaryObject({
+            generic.NameObject('/Filter'): generic.NameObject('/Standard'),
+            generic.NameObject('/P'): generic.NumberObject(p_entry),
+        })
+
+        if algorithm == 'aes-256':
+            password = password.encode('utf-8')[:127]
+            key = os.urandom(32)
+            user_salts = os.urandom(16)
+            user_entry = cls._hash(password, user_salts[:8], b'', 6) + user_salts
+            owner_salts = os.urandom(16)
+            owner_entry = cls._hash(password, owner_salts[:8], user_entry, 6) + owner_salts
+            permissions = struct.pack('<I', p_entry & 0xffffffff) + b'\xff\xff\xff\xffTadb' + os.urandom(4)
+            encryptor = Cipher(algorithms.AES(key), modes.ECB()).encryptor()
+            dictionary.update({
+                generic.NameObject('/V'): generic.NumberObject(5),
+                generic.NameObject('/R'): generic.NumberObject(6),
+                generic.NameObject('/Length'): generic.NumberObject(256),
+                generic.NameObject('/UE'): generic.ByteStringObject(
+                    _aes_raw(cls._hash(password, user_salts[8:], b'', 6), key)),
+                generic.NameObject('/OE'): generic.ByteStringObject(
+                    _aes_raw(cls._hash(password, owner_salts[8:], user_entry, 6), key)),
+                generic.NameObject('/Perms'): generic.ByteStringObject(
+                    encryptor.update(permissions) + encryptor.finalize()),
+            })
+            revision = 6
+        else:
+            password = password.encode('latin-1', 'replace')
+            revision = 4 if algorithm == 'aes-128' else 3
+            owner_key = cls._owner_key(password, revision, 16)
+            owner_entry = _crypt('rc4', owner_key, (password + cls.PADDING)[:32])
+            for i in range(1, 20):
+                owner_entry = _crypt('rc4', bytes(byte ^ i for byte in owner_key), owner_entry)
+            key = cls._file_key(password, owner_entry, p_entry, document_id, revision, 16, True)
+            user_entry = cls._user_entry(key, document_id, revision)
+            dictionary.update({
+                generic.NameObject('/V'): generic.NumberObject(4 if revision == 4 else 2),
+                generic.NameObject('/R'): generic.NumberObject(revision),
+                generic.NameObject('/Length'): generic.NumberObject(128),
+            })
+
+        dictionary[generic.NameObject('/O')] = generic.ByteStringObject(owner_entry)
+        dictionary[generic.NameObject('/U')] = generic.ByteStringObject(user_entry)
+        cipher = 'rc4'
+        if revision >= 4:
+            cipher = 'aes'
+            dictionary.update({
+                generic.NameObject('/CF'): generic.DictionaryObject({
+                    generic.NameObject('/StdCF'): generic.DictionaryObject({
+                        generic.NameObject('/AuthEvent'): generic.NameObject('/DocOpen'),
+                        generic.NameObject('/CFM'): generic.NameObject('/AESV3' if revision == 6 else '/AESV2'),
+                        generic.NameObject('/Length'): generic.NumberObject(len(key)),
+                    }),
+                }),
+                generic.NameObject('/StmF'): generic.NameObject('/StdCF'),
+                generic.NameObject('/StrF'): generic.NameObject('/StdCF'),
+            })
+        return cls(key, revision, cipher, cipher, dictionary=dictionary, document_id=document_id)
+
+    @property
+    def algorithm(self):
+        '''
+        The name in ALGORITHMS closest to this handler, for re-encrypting a
+        file the way it was. 40 bit RC4 is raised to 128 bits.
+        '''
+        if self.revision >= 5:
+            return 'aes-256'
+        if 'aes' in (self.strings, self.streams):
+            return 'aes-128'
+        return 'rc4-128'
+
+    def object_key(self, idnum, generation):
+        '''
+        Returns the key encrypting the strings and streams of an object.
+        '''
+        if self.revision >= 5:
+            return self.key
+        data = self.key + struct.pack('<i', idnum)[:3] + struct.pack('<i', generation)[:2]
+        if 'aes' in (self.strings, self.streams):
+            data += b'sAlT'
+        return hashlib.md5(data).digest()[:min(len(self.key) + 5, 16)]
+
+    def encrypts_stream(self, obj):
+        '''
+        Tells whether the data of the stream obj is encrypted in files
+        using this handler.
+        '''
+        if obj.get('/Type') == '/XRef':
+            return False
+        return self.streams is not None and (self.encrypt_metadata or obj.get('/Type') != '/Metadata')
+
+    @staticmethod
+    def _crypt_filter(encrypt, name):
+        crypt_filter = encrypt.get(name, '/Identity')
+        if crypt_filter == '/Identity':
+            return None
+        method = encrypt['/CF'][crypt_filter].get('/CFM', '/None')
+        if method not in ('/V2', '/AESV2', '/AESV3', '/None'):
+            raise NotImplementedError("Crypt filter method %s is not supported." % method)
+        return {'/V2': 'rc4', '/None': None}.get(method, 'aes')
+
+    @classmethod
+    def _file_key(cls, password, owner_entry, p_entry, document_id, revision, length, encrypt_metadata):
+        data = ((password + cls.PADDING)[:32] + owner_entry[:32] + struct.pack('<I', p_entry & 0xffffffff) +
+                document_id)
+        if revision >= 4 and not encrypt_metadata:
+            data += b'\xff\xff\xff\xff'
+        digest = hashlib.md5(data).digest()
+        if revision >= 3:
+            for _ in range(50):
+                digest = hashlib.md5(digest[:length]).digest()
+        return digest[:length]
+
+    @classmethod
+    def _user_entry(cls, key, document_id, revision):
+        if revision == 2:
+            return _crypt('rc4', key, cls.PADDING)
+        value = _crypt('rc4', key, hashlib.md5(cls.PADDING + document_id).digest())
+        for i in range(1, 20):
+            value = _crypt('rc4', bytes(byte ^ i for byte in key), value)
+        return value + bytes(16)
+
+    @classmethod
+    def _owner_key(cls, password, revision, length):
+        digest = hashlib.md5((password + cls.PADDING)[:32]).digest()
+        if revision >= 3:
+            for _ in range(50):
+                digest = hashlib.md5(digest).digest()
+        return digest[:length]
+
+    @classmethod
+    def _owner_to_user(cls, password, owner_entry, revision, length):
+        owner_key = cls._owner_key(password, revision, length)
+        if revision == 2:
+            return _crypt('rc4', owner_key, owner_entry[:32])
+        value = owner_entry[:32]
+        for i in range(19, -1, -1):
+            value = _crypt('rc4', bytes(byte ^ i for byte in owner_key), value)
+        return value
+
+    @staticmethod
+    def _hash(password, salt, user_entry, revision):
+        # Algorithm 2.B of ISO 32000-2, revision 5 only uses its first step.
+        key = hashlib.sha256(password + salt + user_entry).digest()
+        if revision == 5:
+            return key
+        rounds = 0
+        while True:
+            encryptor = Cipher(algorithms.AES(key[:16]), modes.CBC(key[16:32])).encryptor()
+            encrypted = encryptor.update((password + key + user_entry) * 64) + encryptor.finalize()
+            key = (hashlib.sha256, hashlib.sha384, hashlib.sha512)[sum(encrypted[:16]) % 3](encrypted).digest()
+            rounds += 1
+            if rounds >= 64 and encrypted[-1] <= rounds - 32:
+                return key[:32]
+
+
+def _security_handler(pdf_reader, key):
+    '''
+    Opens the StandardSecurityHandler of pdf_reader with key and switches the
+    reader to returning its objects still encrypted, for a StreamingPdfWriter
+    to decrypt. Object streams are decrypted here, as the objects stored in
+    them are not encrypted on their own.
+    '''
+    if not pdf_reader.isEncrypted:
+        raise click.BadParameter("PDF File is not encrypted.")
+    pdf_reader._override_encryption = True
+    security_handler = _open_security_handler(pdf_reader, key)
+    if security_handler is None:
+        raise click.BadParameter("The key does not decrypt the PDF File.")
+
+    for number in set(number for number, _ in pdf_reader.xref_objStm.values()):
+        object_stream = pdf_reader.getObject(PyPDF2.generic.IndirectObject(number, 0, pdf_reader))
+        if security_handler.encrypts_stream(object_stream):
+            object_stream._data = _crypt(security_handler.streams, security_handler.object_key(number, 0),
+                                         object_stream._data, decrypt=True)
+    # getNumPages would try the empty password and turn decryption back on,
+    # count the pages of the flattened page tree instead.
+    pdf_reader._flatten()
+    return security_handler
+
+
+class SecurityHandlerCache(object):
+    '''
+    The security handlers opened so far, by the /Encrypt dictionary and /ID
+    of their file and the password that was tried, including the passwords
+    that failed. Files sharing a security handler, as files encrypted by the
+    same tool with the same key usually do apart from their /ID, only go
+    through the key derivation once. The password that last opened a file is
+    tried first on the next one.
+    '''
+    MAX_ENTRIES = 4096
+
+    def __init__(self):
+        self._handlers = collections.OrderedDict()
+        self._last_password = None
+
+    def open(self, encrypt, document_id, passwords):
+        '''
+        Returns the StandardSecurityHandler of the /Encrypt dictionary
+        encrypt opened by the first of passwords that works, or None.
+        '''
+        # Revisions 5 and 6 derive the file key without the /ID.
+        fingerprint = (document_id if encrypt.get('/R', 0) < 5 else b'', _serialize(encrypt))
+        if self._last_password in passwords:
+            passwords = [self._last_password] + [password for password in passwords
+                                                 if password != self._last_password]
+        for password in passwords:
+            key = (fingerprint, password)
+            if key in self._handlers:
+                self._handlers.move_to_end(key)
+            else:
+                self._handlers[key] = StandardSecurityHandler.open(encrypt, document_id, password)
+                if len(self._handlers) > self.MAX_ENTRIES:
+                    self._handlers.popitem(last=False)
+            security_handler = self._handlers[key]
+            if security_handler is not None:
+                self._last_password = password
+                return security_handler
+        return None
+
+
+_SECURITY_HANDLER_CACHE = SecurityHandlerCache()
+
+
+def _open_security_handler(pdf_reader, keys):
+    '''
+    Returns the StandardSecurityHandler of the encrypted pdf_reader opened by
+    the first of keys, a password or a list of passwords, that works, or
+    None. Handlers come from _SECURITY_HANDLER_CACHE.
+    '''
+    override_encryption = pdf_reader._override_encryption
+    pdf_reader._override_encryption = True
+    try:
+        trailer = pdf_reader.trailer
+        document_id = trailer['/ID'][0].original_bytes if '/ID' in trailer else b''
+        encrypt = trailer['/Encrypt'].getObject()
+    finally:
+        pdf_reader._override_encryption = override_encryption
+    if keys is None or isinstance(keys, (str, bytes)):
+        keys = [keys or '']
+    try:
+        return _SECURITY_HANDLER_CACHE.open(encrypt, document_id, list(keys))
+    except NotImplementedError as e:
+        raise click.BadParameter(str(e))
+
+
+def _crypt(cipher, key, data, decrypt=False):
+    '''
+    Encrypts, or decrypts, data with key using the 'rc4' or 'aes' cipher.
+    AES data starts with its initialization vector and is padded as PKCS#5.
+    '''
+    if cipher == 'aes':
+        if decrypt:
+            if len(data) < 32 or len(data) % 16:
+                return b''
+            decryptor = Cipher(algorithms.AES(key), modes.CBC(data[:16])).decryptor()
+            data = decryptor.update(data[16:]) + decryptor.finalize()
+            return data[:-data[-1]] if 1 <= data[-1] <= 16 else data
+        initialization_vector = os.urandom(16)
+        padding = 16 - len(data) % 16
+        encryptor = Cipher(algorithms.AES(key), modes.CBC(initialization_vector)).encryptor()
+        return initialization_vector + encryptor.update(data + bytes([padding]) * padding) + encryptor.finalize()
+    if Cipher is not None and ARC4 is not None and len(key) * 8 in ARC4.key_sizes:
+        return Cipher(ARC4(key), mode=None).encryptor().update(data)
+    return _rc4(key, data)
+
+
+def _crypt_job(job):
+    return _crypt(*job)
+
+
+def _aes_raw(key, data, decrypt=False):
+    '''
+    AES-256 in CBC mode with a zero initialization vector and no padding,
+    as used for the /OE and /UE entries.
+    '''
+    cipher = Cipher(algorithms.AES(key), modes.CBC(bytes(16)))
+    context = cipher.decryptor() if decrypt else cipher.encryptor()
+    return context.update(data) + context.finalize()
+
+
+def _rc4(key, data):
+    state = list(range(256))
+    j = 0
+    for i in range(256):
+        j = (j + state[i] + key[i % len(key)]) & 0xff
+        state[i], state[j] = state[j], state[i]
+    output = bytearray(len(data))
+    i = j = 0
+    for index, byte in enumerate(data):
+        i = (i + 1) & 0xff
+        j = (j + state[i]) & 0xff
+        state[i], state[j] = state[j], state[i]
+        output[index] = byte ^ state[(state[i] + state[j]) & 0xff]
+    return bytes(output)
+
+
+def _crypt_strings(obj, cipher, key, decrypt=False):
+    '''
+    Encrypts, or decrypts, every string held by obj in place and returns
+    obj, or the new string if obj is one.
+    '''
+    generic = PyPDF2.generic
+    if isinstance(obj, generic.ByteStringObject):
+        data = _crypt(cipher, key, bytes(obj), decrypt)
+        return generic.createStringObject(data) if decrypt else generic.ByteStringObject(data)
+    elif isinstance(obj, generic.TextStringObject):
+        if obj.autodetect_pdfdocencoding or obj.autodetect_utf16:
+            data = obj.original_bytes
+        else:
+            # Written the way TextStringObject.writeToStream would.
+            try:
+                data = generic.encode_pdfdocencoding(obj)
+            except UnicodeEncodeError:
+                data = codecs.BOM_UTF16_BE + obj.encode('utf-16be')
+        data = _crypt(cipher, key, data, decrypt)
+        return generic.createStringObject(data) if decrypt else generic.ByteStringObject(data)
+    elif isinstance(obj, dict):
+        for name, value in list(obj.items()):
+            obj[name] = _crypt_strings(value, cipher, key, decrypt)
+    elif isinstance(obj, list):
+        for index, value in enumerate(obj):
+            obj[index] = _crypt_strings(value, cipher, key, decrypt)
+    return obj
+
+
+def _deflate_stream(obj, level):
+    '''
+    Re-deflates obj at the given zlib level if it is a stream that is stored
+    uncompressed or with a plain /FlateDecode filter, and returns it. Streams
+    with other filters, predictors or XMP metadata are returned unchanged, as
+    is any stream the new encoding would not make smaller.
+    '''
+    generic = PyPDF2.generic
+    if not isinstance(obj, generic.StreamObject) or '/DecodeParms' in obj or obj.get('/Type') == '/Metadata':
+        return obj
+    filters = obj.get('/Filter')
+    if filters in ('/FlateDecode', ['/FlateDecode']):
+        try:
+            data = zlib.decompress(obj._data)
+        except zlib.error:
+            return obj
+    elif filters is None or filters == []:
+        data = obj._data
+    else:
+        return obj
+    compressed = zlib.compress(data, level)
+    if len(compressed) < len(obj._data):
+        obj._data = compressed
+        obj[generic.NameObject('/Filter')] = generic.NameObject('/FlateDecode')
+    return obj
+
+
+def _stream_digests(pdf_reader, workers=None):
+    '''
+    Returns a dict mapping the (idnum, generation) of every stream object of
+    pdf_reader that can be deduplicated to its (digest, size). Streams are
+    identified by their encoded data and dictionary. References to other
+    streams count by those streams' digests, so an image with an identical
+    /SMask or ICC profile still matches. Streams that reference other kinds
+    of objects are left out.
+
+    Objects are read one at a time and hashed on a thread pool, since
+    hashlib releases the GIL while hashing large buffers.
+    '''
+    generic = PyPDF2.generic
+    streams = {}
+    for generation, table in pdf_reader.xref.items():
+        for idnum in table:
+            key = (generation, idnum)
+            cached = key in pdf_reader.resolvedObjects
+            try:
+                obj = pdf_reader.getObject(generic.IndirectObject(idnum, generation, pdf_reader))
+            except Exception:
+                continue
+            if isinstance(obj, generic.StreamObject) and obj.get('/Type') not in ('/XRef', '/ObjStm'):
+                streams[(idnum, generation)] = obj
+            elif not cached:
+                pdf_reader.resolvedObjects.pop(key, None)
+
+    def canonical(obj, digests):
+        if isinstance(obj, generic.IndirectObject):
+            return generic.ByteStringObject(digests[(obj.idnum, obj.generation)][0])
+        elif isinstance(obj, dict):
+            return generic.DictionaryObject((key, canonical(value, digests)) for key, value in obj.items()
+                                            if key != '/Length')
+        elif isinstance(obj, list):
+            return generic.ArrayObject(canonical(value, digests) for value in obj)
+        return obj
+
+    def digest(header, data):
+        return hashlib.sha256(header + b'\nstream\n' + data).digest(), len(data)
+
+    digests = {}
+    remaining = {}
+    for key, obj in streams.items():
+        remaining[key] = set((reference.idnum, reference.generation) for name, value in obj.items()
+                             if name != '/Length' for reference in _references(value))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        # Streams are hashed in rounds, each round taking the streams whose
+        # referenced streams were all hashed in an earlier round.
+        while remaining:
+            ready = [key for key, refs in remaining.items() if refs.issubset(digests)]
+            if not ready:
+                break
+            futures = dict((key, executor.submit(digest, _serialize(canonical(streams[key], digests)),
+                                                 streams[key]._data))
+                           for key in ready)
+            for key, future in futures.items():
+                digests[key] = future.result()
+                del remaining[key]
+
+    for idnum, generation in streams:
+        pdf_reader.resolvedObjects.pop((generation, idnum), None)
+    return digests
+
+
+def _serialize(obj):
+    buffer = io.BytesIO()
+    obj.writeToStream(buffer, None)
+    return buffer.getvalue()
+
+
+def _open_output(out):
+    '''
+    Opens out for writing, or standard output when it is '-'. Writers only
+    need to know how much they wrote, so standard output is written to as
+    the PDF is serialized rather than buffered until the end. A bytearray is
+    appended to, and a binary file object is written to as it is and left
+    open.
+    '''
+    if isinstance(out, bytearray):
+        return _CountingWriter(out)
+    if not isinstance(out, str):
+        return _nullcontext(out)
+    if _STATS is not None:
+        _STATS.outputs.append(out)
+    if out == '-':
+        return _CountingWriter(click.get_binary_stream('stdout'))
+    return open(out, 'wb')
+
+
+class _CountingWriter(object):
+    '''
+    A binary output stream counting what is written to it, so it can tell()
+    its position without being seekable. It writes to a stream such as
+    standard output, or appends to a bytearray. Closing it only flushes the
+    stream.
+    '''
+    mode = 'wb'
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._write = stream.extend if isinstance(stream, bytearray) else stream.write
+        self._position = 0
+
+    def write(self, data):
+        self._write(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        if not isinstance(self._stream, bytearray):
+            self._stream.flush()
+
+    def close(self):
+        self.flush()
+        _count('bytes_written', self._position)
+        self._position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _input_size(pdf_fp):
+    '''
+    Returns the size of an input opened by _open_pdf.
+    '''
+    if isinstance(pdf_fp, mmap.mmap):
+        return pdf_fp.size()
+    if isinstance(pdf_fp, io.BytesIO):
+        return len(pdf_fp.getbuffer())
+    try:
+        return os.fstat(pdf_fp.fileno()).st_size
+    except (AttributeError, io.UnsupportedOperation):
+        position = pdf_fp.tell()
+        size = pdf_fp.seek(0, io.SEEK_END)
+        pdf_fp.seek(position)
+        return size
+
+
+def _echo_status(message, *outs):
+    '''
+    Echoes a status message, on standard error when one of outs is '-' so
+    it doesn't end up in the middle of the PDF written to standard output.
+    Nothing is echoed when the quiet option is set, as by pdfcli_api.
+    '''
+    if not _cli_option('quiet'):
+        click.echo(message, err='-' in outs)
+
+
+def _open_pdf(file_arg):
+    '''
+    Opens file_arg for reading. With the --mmap option the file is
+    memory-mapped, so the reader's many small seeks and reads are served
+    straight from the page cache, which is shared with every other process
+    reading the same file. '-' reads standard input, which is buffered in
+    memory as readers need to seek to the trailer at the end of the file.
+    bytes, bytearray and memoryview inputs are read from memory, bytes in
+    place and other buffers from a copy. A seekable binary file object is
+    read as it is and left open.
+    '''
+    if isinstance(file_arg, (bytes, bytearray, memoryview)):
+        return _nullcontext(io.BytesIO(file_arg))
+    if not isinstance(file_arg, str):
+        return _nullcontext(file_arg)
+    if file_arg == '-':
+        return io.BytesIO(click.get_binary_stream('stdin').read())
+    pdf_fp = open(file_arg, 'rb')
+    if not _cli_option('mmap'):
+        return pdf_fp
+    with pdf_fp:
+        try:
+            return mmap.mmap(pdf_fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped, let the reader reject them.
+            return open(file_arg, 'rb')
+
+
+@_timed('parse')
 def get_pdf_reader(pdf_fp, file_arg, key=None):
     try:
-        pdf_reader = PyPDF2.PdfFileReader(pdf_fp)
-        if key:
-            pdf_reader.decrypt(key)
+        cache = ParseCache.from_options()
+        fingerprint = cache.fingerprint(pdf_fp, file_arg) if cache else None
+        entry = cache.load(fingerprint) if fingerprint else None
+        if entry:
+            pdf_reader = _cached_pdf_file_reader()(pdf_fp, entry)
+        else:
+            pdf_reader = PyPDF2.PdfFileReader(pdf_fp)
+        if key and pdf_reader.isEncrypted:
+            _decrypt_reader(pdf_reader, key)
+        if fingerprint and not entry:
+            cache.store(fingerprint, pdf_reader)
+        if _STATS is not None:
+            _count('inputs')
+            _count('bytes_read', _input_size(pdf_fp))
+            _count('objects_read', sum(len(table) for table in pdf_reader.xref.values()) +
+                   len(pdf_reader.xref_objStm))
         return pdf_reader
     except PyPDF2.utils.PdfReadError as e:
-        raise click.BadParameter("PDF File could not be recognized %s." % (file_arg))
+        raise click.BadParameter("PDF File could not be recognized %s." % (
+            file_arg if isinstance(file_arg, str) else getattr(file_arg, 'name', 'in memory')))
+
+
+def _decrypt_reader(pdf_reader, key):
+    '''
+    Decrypts pdf_reader with the first of key, a password or a list of
+    passwords, that works. The file key is derived through
+    _SECURITY_HANDLER_CACHE and handed to PyPDF2, which decrypts objects as
+    they are read. PyPDF2 only decrypts RC4, AES files are left to the
+    decrypt and rekey commands.
+    '''
+    security_handler = _open_security_handler(pdf_reader, key)
+    if security_handler is None:
+        raise click.BadParameter("The key does not decrypt the PDF File.")
+    if 'aes' in (security_handler.strings, security_handler.streams):
+        raise click.BadParameter("AES encrypted PDFs can only be read by the decrypt and rekey commands.")
+    pdf_reader._decryption_key = security_handler.key
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_pdf_file_reader():
+    '''
+    Returns the CachedPdfFileReader class, which subclasses
+    PyPDF2.PdfFileReader and so is only defined once PyPDF2 is needed.
+    '''
+    class CachedPdfFileReader(PyPDF2.PdfFileReader):
+        '''
+        A PdfFileReader restored from a ParseCache entry. The cross-reference
+        tables, trailer, page locations and document info come from the entry,
+        so only the objects that are actually used are read from the file.
+        '''
+
+        def __init__(self, stream, entry):
+            self._entry = entry
+            super(CachedPdfFileReader, self).__init__(stream)
+
+        def read(self, stream):
+            entry = self._entry
+            self.xref = dict((int(generation), dict((int(idnum), offset) for idnum, offset in table.items()))
+                             for generation, table in entry['xref'].items())
+            self.xref_objStm = dict((int(idnum), tuple(location)) for idnum, location in entry['xref_objStm'].items())
+            self.xrefIndex = entry['xrefIndex']
+            self.trailer = self._read_cached_object(entry['trailer'])
+
+        def _flatten(self, pages=None, inherit=None, indirectRef=None):
+            if pages is not None or not self._entry.get('pages'):
+                return super(CachedPdfFileReader, self)._flatten(pages, inherit, indirectRef)
+            self.flattenedPages = []
+            for page_ref, inherited in self._read_cached_object(self._entry['pages']):
+                page = page_ref.getObject()
+                for attr, value in inherited.items():
+                    if attr not in page:
+                        page[attr] = value
+                page_obj = PyPDF2.pdf.PageObject(self, page_ref)
+                page_obj.update(page)
+                self.flattenedPages.append(page_obj)
+
+        def getDocumentInfo(self):
+            if not self._entry.get('info'):
+                return super(CachedPdfFileReader, self).getDocumentInfo()
+            document_info = PyPDF2.pdf.DocumentInformation()
+            document_info.update(self._read_cached_object(self._entry['info']))
+            return document_info
+
+        def _read_cached_object(self, data):
+            return PyPDF2.generic.readObject(io.BytesIO(data.encode('latin-1')), self)
+
+    return CachedPdfFileReader
+
+
+class ParseCache(object):
+    '''
+    On-disk cache of the parsed structure of PDF files, one JSON entry per
+    file. Entries are keyed by a fingerprint of the file's size, mtime and the
+    content of its head and tail, where the header, trailer and last
+    cross-reference section live. The least recently used entries are evicted
+    once the cache grows beyond max_size bytes.
+    '''
+    VERSION = 1
+    FINGERPRINT_BYTES = 64 * 1024
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    @classmethod
+    def from_options(cls):
+        '''
+        Returns the cache configured by the global cli options, or None when
+        the cache is disabled.
+        '''
+        if not _cli_option('cache'):
+            return None
+        directory = _cli_option('cache_dir')
+        if not directory:
+            cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+            directory = os.path.join(cache_home, 'pdfcli')
+        return cls(directory, _cli_option('cache_size', 64) * 1024 * 1024)
+
+    def fingerprint(self, pdf_fp, file_arg):
+        if not isinstance(file_arg, str) or not os.path.isfile(file_arg):
+            return None
+        stat = os.stat(file_arg)
+        digest = hashlib.sha256(b'%d:%d:' % (stat.st_size, stat.st_mtime_ns))
+        pdf_fp.seek(0)
+        digest.update(pdf_fp.read(self.FINGERPRINT_BYTES))
+        pdf_fp.seek(max(stat.st_size - self.FINGERPRINT_BYTES, 0))
+        digest.update(pdf_fp.read(self.FINGERPRINT_BYTES))
+        pdf_fp.seek(0)
+        return digest.hexdigest()
+
+    def load(self, fingerprint):
+        path = self._path(fingerprint)
+        try:
+            with open(path) as entry_fp:
+                entry = json.load(entry_fp)
+            os.utime(path)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get('version') != self.VERSION:
+            return None
+        return entry
+
+    def store(self, fingerprint, pdf_reader):
+        generic = PyPDF2.generic
+        entry = {
+            'version': self.VERSION,
+            'xref': pdf_reader.xref,
+            'xref_objStm': pdf_reader.xref_objStm,
+            'xrefIndex': pdf_reader.xrefIndex,
+            'trailer': _serialize(pdf_reader.trailer).decode('latin-1'),
+        }
+        # Page attributes and metadata of encrypted files are decrypted in
+        # memory and must not end up on disk.
+        if not pdf_reader.isEncrypted:
+            try:
+                pages = generic.ArrayObject()
+                for page in _iter_pages(pdf_reader, range(pdf_reader.getNumPages())):
+                    inherited = generic.DictionaryObject()
+                    for attr in ('/Resources', '/MediaBox', '/CropBox', '/Rotate'):
+                        if attr in page:
+                            inherited[generic.NameObject(attr)] = page.raw_get(attr)
+                    pages.append(generic.ArrayObject([page.indirectRef, inherited]))
+                entry['pages'] = _serialize(pages).decode('latin-1')
+                if '/Info' in pdf_reader.trailer:
+                    info = generic.DictionaryObject()
+                    for name, value in pdf_reader.trailer['/Info'].getObject().items():
+                        info[name] = value.getObject()
+                    entry['info'] = _serialize(info).decode('latin-1')
+            except (PyPDF2.utils.PdfReadError, AttributeError, TypeError):
+                pass
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(fingerprint)
+            with open(path + '.tmp', 'w') as entry_fp:
+                json.dump(entry, entry_fp)
+            os.replace(path + '.tmp', path)
+            self.evict()
+        except (IOError, OSError):
+            pass
+
+    def evict(self):
+        '''
+        Removes the least recently used entries until the cache fits in
+        max_size bytes.
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def _path(self, fingerprint):
+        return os.path.join(self.directory, fingerprint + '.json')
+
+
+_BATCH_OPERATIONS = {
+    'burst': _burst,
+    'compress': _compress,
+    'decrypt': _decrypt,
+    'delete': _delete,
+    'encrypt': _encrypt,
+    'info': _info,
+    'linearize': _linearize,
+    'merge': _merge,
+    'optimize': _optimize,
+    'rekey': _rekey,
+    'run': _run,
+    'reorder': _reorder,
+    'rotate': _rotate,
+    'split': _split,
+}
+_BATCH_COMMANDS.extend(sorted(_BATCH_OPERATIONS))
 
 
 if __name__ == '__main__':
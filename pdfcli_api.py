@@ -0,0 +1,447 @@
+'''
+A Python API over the pdfcli commands.
+
+Every function takes its input PDFs as paths, bytes-like objects or binary
+file objects, and writes its output to a path, bytearray or binary file
+object, or returns it as bytes when no output is given. Nothing touches the
+disk when both sides are in memory. Nothing is echoed, failures
+raise PdfcliError with the message the command line would print.
+
+    import pdfcli_api
+
+    data = pdfcli_api.merge(['a.pdf', upload_bytes])
+    first, rest = pdfcli_api.split(data, '0,1-')
+
+Each function has an async variant, merge_async and so on, that runs it on
+an AsyncRunner so CPU-bound work doesn't block the event loop:
+
+    async with pdfcli_api.AsyncRunner(max_concurrency=8) as runner:
+        outputs = await asyncio.gather(*(pdfcli_api.rotate_async(upload, runner=runner) for upload in uploads))
+'''
+import asyncio
+import concurrent.futures
+import io
+import os
+import weakref
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Sequence, Union
+import click
+import pdfcli
+
+__all__ = ['PdfcliError', 'AsyncRunner', 'merge', 'split', 'delete', 'reorder', 'rotate', 'optimize', 'compress',
+           'linearize', 'encrypt', 'decrypt', 'rekey', 'run', 'info', 'merge_async', 'split_async', 'delete_async',
+           'reorder_async', 'rotate_async', 'optimize_async', 'compress_async', 'linearize_async', 'encrypt_async',
+           'decrypt_async', 'rekey_async', 'run_async', 'info_async']
+
+# A path, the bytes of a PDF or a binary file object to read it from.
+Source = Union[str, 'os.PathLike', bytes, bytearray, memoryview, BinaryIO]
+# A path, bytearray or binary file object to write a PDF to, None to return
+# its bytes.
+Destination = Union[None, str, 'os.PathLike', bytearray, BinaryIO]
+# A password, or several to try in order.
+Keys = Union[None, str, Sequence[str]]
+# Page indexes as on the command line, such as '0,2-4,odd', or as integers.
+Pages = Union[str, Iterable[int]]
+
+
+class PdfcliError(Exception):
+    '''
+    Raised when an operation fails, with the message the command line
+    would print.
+    '''
+
+
+def merge(inputs: Sequence[Source], out: Destination = None, key: Keys = None, dedupe: bool = False,
+          compress: Optional[int] = None, xref_stream: bool = False, linearize: bool = False) -> Optional[bytes]:
+    '''
+    Merges inputs into one PDF. dedupe writes streams shared between the
+    inputs only once.
+    '''
+    return _write(out, lambda out: pdfcli._merge(*[_source(src) for src in inputs], out=out, key=key, dedupe=dedupe,
+                                                 stream=True, compress=compress, xref_stream=xref_stream,
+                                                 linearize=linearize))
+
+
+def split(src: Source, ranges: Union[str, Sequence[Pages]], outs: Optional[Sequence[Destination]] = None,
+          key: Keys = None, compress: Optional[int] = None, xref_stream: bool = False,
+          linearize: bool = False) -> List[Optional[bytes]]:
+    '''
+    Splits src into one PDF per range of pages, given as a string of terms
+    such as '0-9,10-19,20-' or as a sequence of page indexes per output.
+    Returns the bytes of every output that has no destination in outs.
+    '''
+    def split_pages(pdf_reader_fp):
+        pdf_reader = pdfcli.get_pdf_reader(pdf_reader_fp, _name(src), key=key)
+        num_pages = pdf_reader.getNumPages()
+        try:
+            if isinstance(ranges, str):
+                chunks = pdfcli.PageSelection(ranges).ranges(num_pages)
+            else:
+                chunks = [pdfcli.PageSelection(_page_terms(pages)).indexes(num_pages) for pages in ranges]
+        except ValueError:
+            raise click.BadParameter("ranges must be a list of indexes or ranges of indexes such as 0-9,10-19.")
+        except IndexError:
+            raise click.BadParameter('All indexes must be within range of the length of the PDF')
+        if outs is not None and len(outs) != len(chunks):
+            raise click.BadParameter("There must be one output per range.")
+
+        results = []
+        for chunk, out in zip(chunks, outs or [None] * len(chunks)):
+            results.append(_write(out, lambda out: pdfcli._write_pages(
+                pdfcli._iter_pages(pdf_reader, chunk), out, stream=True, compress=compress, xref_stream=xref_stream,
+                linearize=linearize)))
+        return results
+
+    def split_source():
+        with pdfcli._open_pdf(_source(src)) as pdf_reader_fp:
+            return split_pages(pdf_reader_fp)
+    return _call(split_source)
+
+
+def delete(src: Source, pages: Pages, out: Destination = None, key: Keys = None, compress: Optional[int] = None,
+           xref_stream: bool = False, linearize: bool = False) -> Optional[bytes]:
+    '''
+    Deletes pages from src.
+    '''
+    try:
+        selection = pdfcli.PageSelection(_page_terms(pages))
+    except ValueError:
+        raise PdfcliError("pages must be a list of indexes or ranges of indexes such as 0,2-4.")
+    return _write(out, lambda out: pdfcli._delete(file=_source(src), delete=selection, out=out, key=key,
+                                                  compress=compress, xref_stream=xref_stream, linearize=linearize))
+
+
+def reorder(src: Source, order: Optional[Pages] = None, reverse: bool = False, out: Destination = None,
+            key: Keys = None, compress: Optional[int] = None, xref_stream: bool = False,
+            linearize: bool = False) -> Optional[bytes]:
+    '''
+    Reorders the pages of src in the given order, or reverses them.
+    '''
+    return _write(out, lambda out: pdfcli._reorder(file=_source(src), order=order and _page_terms(order),
+                                                   reverse=reverse, out=out, key=key, compress=compress,
+                                                   xref_stream=xref_stream, linearize=linearize))
+
+
+def rotate(src: Source, direction: str = 'clockwise', out: Destination = None, key: Keys = None,
+           compress: Optional[int] = None, xref_stream: bool = False, linearize: bool = False) -> Optional[bytes]:
+    '''
+    Rotates every page of src clockwise or counter-clockwise.
+    '''
+    if direction not in ('clockwise', 'counter-clockwise'):
+        raise PdfcliError("direction must be clockwise or counter-clockwise.")
+    return _write(out, lambda out: pdfcli._rotate(file=_source(src), direction=direction, out=out, key=key,
+                                                  compress=compress, xref_stream=xref_stream, linearize=linearize))
+
+
+def optimize(src: Source, out: Destination = None, key: Keys = None, workers: Optional[int] = None,
+             compress: Optional[int] = None, xref_stream: bool = False, linearize: bool = False) -> Optional[bytes]:
+    '''
+    Keeps a single copy of identical streams of src.
+    '''
+    return _write(out, lambda out: pdfcli._optimize(file=_source(src), out=out, key=key, workers=workers,
+                                                    compress=compress, xref_stream=xref_stream, linearize=linearize))
+
+
+def compress(src: Source, out: Destination = None, level: int = 9, key: Keys = None, workers: Optional[int] = None,
+             xref_stream: bool = True, linearize: bool = False) -> Optional[bytes]:
+    '''
+    Re-deflates the streams of src at the given zlib level.
+    '''
+    return _write(out, lambda out: pdfcli._compress(file=_source(src), out=out, level=level, key=key, workers=workers,
+                                                    xref_stream=xref_stream, linearize=linearize))
+
+
+def linearize(src: Source, out: Destination = None, key: Keys = None) -> Optional[bytes]:
+    '''
+    Lays src out for fast web view.
+    '''
+    return _write(out, lambda out: pdfcli._linearize(file=_source(src), out=out, key=key))
+
+
+def encrypt(src: Source, key: str, out: Destination = None, algorithm: str = 'rc4-128',
+            workers: Optional[int] = None, compress: Optional[int] = None,
+            xref_stream: bool = False) -> Optional[bytes]:
+    '''
+    Encrypts src with key, using rc4-128, aes-128 or aes-256.
+    '''
+    if algorithm not in pdfcli.StandardSecurityHandler.ALGORITHMS:
+        raise PdfcliError("algorithm must be one of %s." % ', '.join(pdfcli.StandardSecurityHandler.ALGORITHMS))
+    return _write(out, lambda out: pdfcli._encrypt(file=_source(src), out=out, key=key, algorithm=algorithm,
+                                                   workers=workers, compress=compress, xref_stream=xref_stream))
+
+
+def decrypt(src: Source, key: Keys, out: Destination = None, workers: Optional[int] = None,
+            compress: Optional[int] = None, xref_stream: bool = False, linearize: bool = False) -> Optional[bytes]:
+    '''
+    Decrypts src with the first of key that opens it.
+    '''
+    return _write(out, lambda out: pdfcli._decrypt(file=_source(src), out=out, key=key, workers=workers,
+                                                   compress=compress, xref_stream=xref_stream, linearize=linearize))
+
+
+def rekey(src: Source, key: Keys, new_key: str, out: Destination = None, algorithm: Optional[str] = None,
+          workers: Optional[int] = None) -> Optional[bytes]:
+    '''
+    Re-encrypts src, opened with key, with new_key in one pass. The
+    algorithm of src is kept unless another one is given.
+    '''
+    def rekey_file(out):
+        error = pdfcli._rekey_file(_source(src), out, key, new_key, algorithm=algorithm, workers=workers or 1)
+        if error:
+            raise click.ClickException(error)
+    return _write(out, rekey_file)
+
+
+def run(src: Source, steps: Sequence[Union[str, Dict[str, Any]]], out: Destination = None, key: Keys = None,
+        new_key: Optional[str] = None, workers: Optional[int] = None) -> Optional[bytes]:
+    '''
+    Applies steps, such as 'delete=0,2' or {'rotate': 'clockwise'}, to src
+    with one parse of the input and one write of the output, as the run
+    command does. new_key is the password of an encrypt step.
+    '''
+    return _write(out, lambda out: pdfcli._run(file=_source(src), steps=steps, out=out, key=key, new_key=new_key,
+                                               workers=workers))
+
+
+def info(src: Source, key: Keys = None) -> Dict[str, Any]:
+    '''
+    Returns the version, encryption, page count, page sizes and document
+    info of src, as in the records of info --format json.
+    '''
+    record = _call(pdfcli._read_info_record, _source(src), key)
+    if record['error']:
+        raise PdfcliError(record['error'])
+    del record['error']
+    record['file'] = _name(src)
+    return record
+
+
+class AsyncRunner(object):
+    '''
+    Runs the functions of this module on an executor from asyncio, with at
+    most max_concurrency of them in flight at a time. Others wait for a slot
+    without holding on to a worker. max_concurrency defaults to the number
+    of CPUs.
+
+    Unless another executor is given, a pool of max_concurrency worker
+    processes is started on first use, since the work is CPU-bound. Inputs
+    and outputs sent to worker processes have to be paths or bytes, pass a
+    ThreadPoolExecutor to use file objects, memoryviews or bytearray outputs.
+    '''
+
+    def __init__(self, max_concurrency: Optional[int] = None,
+                 executor: Optional[concurrent.futures.Executor] = None) -> None:
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def run(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        '''
+        Returns the result of function(*args, **kwargs) run on the executor.
+        '''
+        loop = asyncio.get_event_loop()
+        # Semaphores belong to the event loop they are first used on.
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        async with semaphore:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_concurrency)
+            return await loop.run_in_executor(self._executor, _Call(function, args, kwargs))
+
+    def close(self) -> None:
+        '''
+        Shuts down the executor if the runner started it.
+        '''
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def __aenter__(self) -> 'AsyncRunner':
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class _Call(object):
+    '''
+    A function call that can be sent to a worker process, unlike a lambda
+    or functools.partial of keyword arguments on older Pythons.
+    '''
+
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self):
+        return self.function(*self.args, **self.kwargs)
+
+
+_default_runner = None
+
+
+def _runner(runner):
+    global _default_runner
+    if runner is not None:
+        return runner
+    if _default_runner is None:
+        _default_runner = AsyncRunner()
+    return _default_runner
+
+
+async def merge_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs merge on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(merge, *args, **kwargs)
+
+
+async def split_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> List[Optional[bytes]]:
+    '''
+    Runs split on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(split, *args, **kwargs)
+
+
+async def delete_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs delete on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(delete, *args, **kwargs)
+
+
+async def reorder_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs reorder on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(reorder, *args, **kwargs)
+
+
+async def rotate_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs rotate on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(rotate, *args, **kwargs)
+
+
+async def optimize_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs optimize on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(optimize, *args, **kwargs)
+
+
+async def compress_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs compress on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(compress, *args, **kwargs)
+
+
+async def linearize_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs linearize on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(linearize, *args, **kwargs)
+
+
+async def encrypt_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs encrypt on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(encrypt, *args, **kwargs)
+
+
+async def decrypt_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs decrypt on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(decrypt, *args, **kwargs)
+
+
+async def rekey_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs rekey on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(rekey, *args, **kwargs)
+
+
+async def run_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Optional[bytes]:
+    '''
+    Runs run on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(run, *args, **kwargs)
+
+
+async def info_async(*args: Any, runner: Optional[AsyncRunner] = None, **kwargs: Any) -> Dict[str, Any]:
+    '''
+    Runs info on runner, or on a default AsyncRunner.
+    '''
+    return await _runner(runner).run(info, *args, **kwargs)
+
+
+def _call(function, *args, **kwargs):
+    '''
+    Calls a pdfcli helper with status messages turned off, raising its
+    click exceptions as PdfcliError.
+    '''
+    try:
+        with pdfcli._options_context({'quiet': True}):
+            return function(*args, **kwargs)
+    except click.ClickException as e:
+        raise PdfcliError(e.format_message())
+
+
+def _write(out, write):
+    '''
+    Calls write with the path or file object the output goes to, and
+    returns the bytes written when out is None.
+    '''
+    if out is None:
+        buffer = io.BytesIO()
+        _call(write, buffer)
+        return buffer.getvalue()
+    _call(write, _path(out) or out)
+    return None
+
+
+def _source(src):
+    '''
+    Returns src as a path, bytes-like object or seekable binary file object
+    the helpers of pdfcli can read.
+    '''
+    path = _path(src)
+    if path is not None:
+        return path
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return src
+    if hasattr(src, 'read'):
+        if getattr(src, 'seekable', lambda: False)():
+            return src
+        return io.BytesIO(src.read())
+    raise TypeError("Expected a path, bytes or a binary file object, got %s" % type(src).__name__)
+
+
+def _path(obj):
+    if isinstance(obj, str):
+        return obj
+    if hasattr(obj, '__fspath__'):
+        return obj.__fspath__()
+    return None
+
+
+def _name(src):
+    return _path(src) or getattr(src, 'name', None)
+
+
+def _page_terms(pages):
+    '''
+    Returns pages as the comma separated terms PageSelection parses.
+    '''
+    if isinstance(pages, str):
+        return pages
+    if isinstance(pages, int):
+        return str(pages)
+    return ','.join(str(page) for page in pages)
@@ -24,6 +24,10 @@ LICENSE = 'MIT'
 REQUIRED = ['Click>=7.0, <8.0',
             'PyPDF2>=1.26.0,<2.0']
 
+# What packages are optional?
+EXTRAS = {'aes': ['cryptography>=2.0'],
+          'yaml': ['PyYAML>=3.10']}
+
 
 here = os.path.abspath(os.path.dirname(__file__))
 
@@ -77,8 +81,9 @@ class UploadCommand(Command):
 setup(
     name=NAME,
     version=VERSION,
-    py_modules=['pdfcli'],
+    py_modules=['pdfcli', 'pdfcli_api'],
     install_requires=REQUIRED,
+    extras_require=EXTRAS,
     license=LICENSE,
     author=AUTHOR,
     author_email=EMAIL,
@@ -1,8 +1,22 @@
+import asyncio
+import concurrent.futures
+import csv
+import io
+import json
+import mmap
 import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
 import unittest
 import tempfile
+from unittest import mock
 import PyPDF2
 from click.testing import CliRunner
+import pdfcli
+import pdfcli_api
 from pdfcli import cli
 
 TEST_PDF_FOLDER = "test_files"
@@ -68,6 +82,84 @@ class TestCLITool(BasePDFCLITestCase):
         result = self.runner.invoke(cli, ['--help'])
         self.assertEqual(result.exit_code, 0)
 
+    def test_help_skips_heavy_imports(self):
+        code = ("import sys\n"
+                "from pdfcli import cli\n"
+                "try:\n"
+                "    cli(['--help'])\n"
+                "except SystemExit:\n"
+                "    print(sorted(set(sys.modules) & {'PyPDF2', 'cryptography', 'yaml', 'concurrent.futures'}))\n")
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.splitlines()[-1], b'[]')
+
+    def test_lazy_import(self):
+        self.assertIsInstance(pdfcli.PyPDF2.PdfFileReader, type)
+        self.assertIs(pdfcli.PyPDF2, PyPDF2)
+
+
+class TestMmap(BasePDFCLITestCase):
+    def test_open_pdf_mmap(self):
+        with pdfcli._options_context({'mmap': True}):
+            with pdfcli._open_pdf('test_files/PDF1.pdf') as pdf_fp:
+                self.assertIsInstance(pdf_fp, mmap.mmap)
+                self.assertEqual(PyPDF2.PdfFileReader(pdf_fp).getNumPages(), 1)
+
+    def test_merge_mmap(self):
+        result = self.runner.invoke(cli, ['--mmap', 'merge', '--out', 'test_files/out.pdf'] + TEST_PDF_PATHS)
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/out.pdf', 'rb') as file_reader:
+            self.assertEqual(PyPDF2.PdfFileReader(file_reader).getNumPages(), 3)
+
+    def test_rotate_incremental_mmap(self):
+        result = self.runner.invoke(cli, ['--mmap', 'rotate', 'test_files/MultiPagePDF.pdf', 'clockwise',
+                                          '--incremental'])
+        self.assertEqual(result.exit_code, 0)
+        with open('out.pdf', 'rb') as reader_fp:
+            self.assertEqual(PyPDF2.PdfFileReader(reader_fp).getPage(2)['/Rotate'], 90)
+
+    def test_mmap_bad_file(self):
+        result = self.runner.invoke(cli, ['--mmap', 'info', 'test_files/test.txt'])
+        self.assertEqual(result.exit_code, 2)
+
+
+class TestParseCache(BasePDFCLITestCase):
+    def setUp(self):
+        super(TestParseCache, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestParseCache, self).tearDown()
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache_hit_skips_parse(self):
+        args = ['--cache', '--cache-dir', self.cache_dir, 'split', 'test_files/MultiPagePDF.pdf', '1']
+        first = self.runner.invoke(cli, args)
+        self.assertEqual(first.exit_code, 0)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        with mock.patch.object(PyPDF2.PdfFileReader, 'read', autospec=True) as read:
+            second = self.runner.invoke(cli, args)
+        self.assertEqual(second.exit_code, 0)
+        self.assertEqual(read.call_count, 0)
+        self.assertIn('Split test_files/MultiPagePDF.pdf at index 1', second.output)
+
+    def test_cached_reader_pages(self):
+        args = ['--cache', '--cache-dir', self.cache_dir, 'delete', 'test_files/MultiPagePDF.pdf', '0',
+                '--out', 'test_files/out.pdf']
+        self.assertEqual(self.runner.invoke(cli, args).exit_code, 0)
+        self.assertEqual(self.runner.invoke(cli, args).exit_code, 0)
+        with open('test_files/MultiPagePDF.pdf', 'rb') as source_fp, open('test_files/out.pdf', 'rb') as reader_fp:
+            source_pdf = PyPDF2.PdfFileReader(source_fp)
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            self.assertEqual(pdf.getNumPages(), 2)
+            self.assertEqual(pdf.getPage(0).extractText(), source_pdf.getPage(1).extractText())
+
+    def test_cache_eviction(self):
+        cache = pdfcli.ParseCache(self.cache_dir, 0)
+        for path in TEST_PDF_PATHS:
+            with open(path, 'rb') as pdf_fp:
+                cache.store(cache.fingerprint(pdf_fp, path), PyPDF2.PdfFileReader(pdf_fp))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
 
 class TestMerge(BasePDFCLITestCase):
     def test_merge_valid_input(self):
@@ -77,6 +169,93 @@ class TestMerge(BasePDFCLITestCase):
             merged_pdf = PyPDF2.PdfFileReader(file_reader)
             self.assertEqual(merged_pdf.getNumPages(), 3)
 
+    def test_merge_stream(self):
+        result = self.runner.invoke(cli, ['merge', '--stream', '--out', 'test_files/out.pdf',
+                                          'test_files/MultiPagePDF.pdf'] + TEST_PDF_PATHS)
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/out.pdf', 'rb') as file_reader:
+            merged_pdf = PyPDF2.PdfFileReader(file_reader)
+            self.assertEqual(merged_pdf.getNumPages(), 6)
+            with open('test_files/PDF3.pdf', 'rb') as source_reader:
+                source_pdf = PyPDF2.PdfFileReader(source_reader)
+                self.assertEqual(merged_pdf.getPage(5).extractText(), source_pdf.getPage(0).extractText())
+
+    def test_merge_stream_encrypted_input(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/PDF1.pdf', '--key', 'test_key', '--out', 'out1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['merge', '--stream', '--key', 'test_key', '--out', 'test_files/out.pdf',
+                                          'out1.pdf', 'out1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/out.pdf', 'rb') as file_reader:
+            merged_pdf = PyPDF2.PdfFileReader(file_reader)
+            self.assertFalse(merged_pdf.isEncrypted)
+            self.assertEqual(merged_pdf.getNumPages(), 2)
+
+    def test_merge_encrypted_input(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'test_key', '--out',
+                                          'out1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['merge', '--key', 'test_key', '--out', 'test_files/out.pdf',
+                                          'test_files/PDF1.pdf', 'out1.pdf', 'out1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/out.pdf', 'rb') as file_reader:
+            merged_pdf = PyPDF2.PdfFileReader(file_reader)
+            self.assertFalse(merged_pdf.isEncrypted)
+            self.assertEqual(merged_pdf.getNumPages(), 7)
+
+    def test_merge_candidate_keys(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/PDF1.pdf', '--key', 'test_key', '--out', 'out1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        with mock.patch('pdfcli._SECURITY_HANDLER_CACHE', pdfcli.SecurityHandlerCache()), \
+                mock.patch('pdfcli.StandardSecurityHandler.open', wraps=pdfcli.StandardSecurityHandler.open) as opened:
+            result = self.runner.invoke(cli, ['merge', '--stream', '--out', 'test_files/out.pdf', 'out1.pdf',
+                                              'out1.pdf', 'out1.pdf'], env={'PDFCLI_KEY': 'wrong key\ntest_key'})
+        self.assertEqual(result.exit_code, 0)
+        # The wrong key and the right one are each derived once for the three files.
+        self.assertEqual(opened.call_count, 2)
+        with open('test_files/out.pdf', 'rb') as file_reader:
+            self.assertEqual(PyPDF2.PdfFileReader(file_reader).getNumPages(), 3)
+
+    def test_merge_wrong_keys(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/PDF1.pdf', '--key', 'test_key', '--out', 'out1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['merge', '--stream', '--key', 'wrong_key', '--key', 'other_key', '--out',
+                                          'test_files/out.pdf', 'out1.pdf'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('The key does not decrypt the PDF File.', result.output)
+
+    def test_merge_dedupe(self):
+        inputs = ['test_files/MultiPagePDF.pdf'] * 3
+        result = self.runner.invoke(cli, ['merge', '--stream', '--out', 'test_files/out.pdf'] + inputs)
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['merge', '--dedupe', '--out', 'test_files/deduped.pdf'] + inputs)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('duplicate objects', result.output)
+        self.assertLess(os.path.getsize('test_files/deduped.pdf'), os.path.getsize('test_files/out.pdf'))
+        with open('test_files/deduped.pdf', 'rb') as file_reader, open('test_files/out.pdf', 'rb') as out_reader:
+            deduped_pdf = PyPDF2.PdfFileReader(file_reader)
+            merged_pdf = PyPDF2.PdfFileReader(out_reader)
+            self.assertEqual(deduped_pdf.getNumPages(), 9)
+            for index in range(9):
+                self.assertEqual(deduped_pdf.getPage(index).extractText(), merged_pdf.getPage(index).extractText())
+        os.remove('test_files/deduped.pdf')
+
+    def test_merge_xref_stream(self):
+        inputs = ['test_files/MultiPagePDF.pdf'] * 10
+        result = self.runner.invoke(cli, ['merge', '--xref-stream', '--out', 'test_files/out.pdf'] + inputs)
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/out.pdf', 'rb') as file_reader:
+            data = file_reader.read()
+            self.assertTrue(data.startswith(b'%PDF-1.5'))
+            self.assertNotIn(b'\nxref\n', data)
+            file_reader.seek(0)
+            merged_pdf = PyPDF2.PdfFileReader(file_reader)
+            self.assertGreater(len(merged_pdf.xref_objStm), 50)
+            self.assertEqual(merged_pdf.getNumPages(), 30)
+            with open('test_files/MultiPagePDF.pdf', 'rb') as source_reader:
+                source_pdf = PyPDF2.PdfFileReader(source_reader)
+                self.assertEqual(merged_pdf.getPage(29).extractText(), source_pdf.getPage(2).extractText())
+
     def test_merge_invalid_path(self):
         result = self.runner.invoke(cli, ['merge', 'fake_path'])
         self.assertEqual(result.exit_code, 2)
@@ -101,6 +280,16 @@ class TestReorder(BasePDFCLITestCase):
                                           'test_files/out.pdf', '--order', '2,0,1'])
         self.assertEqual(result.exit_code, 0)
 
+    def test_reorder_incremental_duplicated_pages(self):
+        result = self.runner.invoke(cli, ['reorder', 'test_files/MultiPagePDF.pdf', '--out',
+                                          'test_files/out.pdf', '--order', '2,0,2', '--incremental'])
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/MultiPagePDF.pdf', 'rb') as source_fp, open('test_files/out.pdf', 'rb') as reader_fp:
+            source_pdf = PyPDF2.PdfFileReader(source_fp)
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            self.assertEqual([pdf.getPage(i).extractText() for i in range(3)],
+                             [source_pdf.getPage(i).extractText() for i in (2, 0, 2)])
+
     def test_reorder_valid_input_order_indexes_out_of_range(self):
         result = self.runner.invoke(cli, ['reorder', 'test_files/MultiPagePDF.pdf', '--out',
                                           'test_files/out.pdf', '--order', '2,1,0,4,5,6'])
@@ -111,6 +300,16 @@ class TestReorder(BasePDFCLITestCase):
                                           'test_files/out.pdf', '--order', '2,1,0,0,1,2'])
         self.assertEqual(result.exit_code, 0)
 
+    def test_reorder_range(self):
+        result = self.runner.invoke(cli, ['reorder', 'test_files/MultiPagePDF.pdf', '--out',
+                                          'test_files/out.pdf', '--order', '2-0'])
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/MultiPagePDF.pdf', 'rb') as source_fp, open('test_files/out.pdf', 'rb') as reader_fp:
+            source_pdf = PyPDF2.PdfFileReader(source_fp)
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            self.assertEqual([pdf.getPage(i).extractText() for i in range(3)],
+                             [source_pdf.getPage(i).extractText() for i in (2, 1, 0)])
+
     def test_reorder_invalid_input_indexes_not_integers(self):
         result = self.runner.invoke(cli, ['reorder', 'test_files/MultiPagePDF.pdf', '--out',
                                           'test_files/out.pdf', '--order', 'hello,I,am,1'])
@@ -126,6 +325,37 @@ class TestReorder(BasePDFCLITestCase):
         self.assertEqual(result.exit_code, 2)
 
 
+class TestPageSelection(unittest.TestCase):
+    def test_indexes_and_ranges(self):
+        selection = pdfcli.PageSelection('0,2-4,-1,8-6,3-:3')
+        self.assertEqual(list(selection.indexes(10)), [0, 2, 3, 4, 9, 8, 7, 6, 3, 6, 9])
+
+    def test_even_odd(self):
+        self.assertEqual(list(pdfcli.PageSelection('even').indexes(5)), [0, 2, 4])
+        self.assertEqual(list(pdfcli.PageSelection('odd').indexes(5)), [1, 3])
+        self.assertEqual(list(pdfcli.PageSelection('odd').indexes(1)), [])
+
+    def test_mask(self):
+        mask = pdfcli.PageSelection('1-3,9-7,0-9:4').mask(10)
+        self.assertEqual([i for i in range(10) if mask[i]], [0, 1, 2, 3, 4, 7, 8, 9])
+
+    def test_large_range_stays_compact(self):
+        selection = pdfcli.PageSelection('10-90000')
+        self.assertEqual(selection.ranges(100000), [range(10, 90001)])
+        self.assertEqual(sum(selection.mask(100000)), 89991)
+
+    def test_invalid(self):
+        for spec in ('', 'a', '1-2-3', '0-5:0', '1,,2'):
+            with self.assertRaises(ValueError):
+                pdfcli.PageSelection(spec)
+
+    def test_out_of_range(self):
+        with self.assertRaises(IndexError):
+            pdfcli.PageSelection('0-10').ranges(10)
+        with self.assertRaises(IndexError):
+            pdfcli.PageSelection('-11').ranges(10)
+
+
 class TestDelete(BasePDFCLITestCase):
     def test_delete_valid_input(self):
         result = self.runner.invoke(cli, ['delete', 'test_files/MultiPagePDF.pdf', '0', '--out', 'test_files/out.pdf'])
@@ -142,6 +372,22 @@ class TestDelete(BasePDFCLITestCase):
             pdf = PyPDF2.PdfFileReader(file_reader)
             self.assertEqual(pdf.getNumPages(), 1)
 
+    def test_delete_incremental(self):
+        result = self.runner.invoke(cli, ['delete', 'test_files/MultiPagePDF.pdf', '1', '--incremental',
+                                          '--out', 'test_files/out.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/MultiPagePDF.pdf', 'rb') as source_fp, open('test_files/out.pdf', 'rb') as reader_fp:
+            source_pdf = PyPDF2.PdfFileReader(source_fp)
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            self.assertEqual(pdf.getNumPages(), 2)
+            self.assertEqual(pdf.getPage(1).extractText(), source_pdf.getPage(2).extractText())
+
+    def test_delete_range(self):
+        result = self.runner.invoke(cli, ['delete', 'test_files/MultiPagePDF.pdf', '1-', '--out', 'test_files/out.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/out.pdf', 'rb') as file_reader:
+            self.assertEqual(PyPDF2.PdfFileReader(file_reader).getNumPages(), 1)
+
     def test_out_of_index_delete(self):
         result = self.runner.invoke(cli,
                                     ['delete', 'test_files/MultiPagePDF.pdf', '0,5', '--out', 'test_files/out.pdf'])
@@ -181,6 +427,22 @@ class TestSplit(BasePDFCLITestCase):
             num_pages_two = PyPDF2.PdfFileReader(read_fp_two).numPages
             self.assertEqual(num_pages_two, 2)
 
+    def test_split_stream(self):
+        result = self.runner.invoke(cli, ['split', 'test_files/MultiPagePDF.pdf', '2', '--stream'])
+        self.assertEqual(result.exit_code, 0)
+        with open('out1.pdf', 'rb') as read_fp_one, open('out2.pdf', 'rb') as read_fp_two:
+            pdf_one = PyPDF2.PdfFileReader(read_fp_one)
+            self.assertEqual(pdf_one.numPages, 2)
+            self.assertTrue(pdf_one.getPage(1).extractText() is not None)
+            self.assertEqual(PyPDF2.PdfFileReader(read_fp_two).numPages, 1)
+
+    def test_split_writes_each_output_once(self):
+        with mock.patch.object(PyPDF2.PdfFileWriter, 'write', autospec=True,
+                               side_effect=PyPDF2.PdfFileWriter.write) as write:
+            result = self.runner.invoke(cli, ['split', 'test_files/MultiPagePDF.pdf', '1'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(write.call_count, 2)
+
     def test_split_not_integer_split(self):
         result = self.runner.invoke(cli, ['split', 'test_files/MultiPagePDF.pdf', 'asdfasdf'])
         self.assertEqual(result.exit_code, 2)
@@ -194,6 +456,54 @@ class TestSplit(BasePDFCLITestCase):
         self.assertEqual(result.exit_code, 2)
 
 
+class TestBurst(BasePDFCLITestCase):
+    def setUp(self):
+        super(TestBurst, self).setUp()
+        self.out_dir = tempfile.mkdtemp()
+        self.out_pattern = os.path.join(self.out_dir, 'out_{}.pdf')
+
+    def tearDown(self):
+        super(TestBurst, self).tearDown()
+        shutil.rmtree(self.out_dir)
+
+    def _num_pages(self, index):
+        with open(self.out_pattern.format(index), 'rb') as reader_fp:
+            return PyPDF2.PdfFileReader(reader_fp).numPages
+
+    def test_burst_one_file_per_page(self):
+        result = self.runner.invoke(cli, ['burst', 'test_files/MultiPagePDF.pdf', '--out', self.out_pattern])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(sorted(os.listdir(self.out_dir)), ['out_0.pdf', 'out_1.pdf', 'out_2.pdf'])
+        self.assertEqual([self._num_pages(i) for i in range(3)], [1, 1, 1])
+
+    def test_burst_every(self):
+        result = self.runner.invoke(cli, ['burst', 'test_files/MultiPagePDF.pdf', '--every', '2',
+                                          '--out', self.out_pattern])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual([self._num_pages(i) for i in range(2)], [2, 1])
+
+    def test_burst_ranges_parallel(self):
+        result = self.runner.invoke(cli, ['burst', 'test_files/MultiPagePDF.pdf', '--ranges', '0-1,2,0-2',
+                                          '--workers', '2', '--out', self.out_pattern])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual([self._num_pages(i) for i in range(3)], [2, 1, 3])
+
+    def test_burst_even_odd(self):
+        result = self.runner.invoke(cli, ['burst', 'test_files/MultiPagePDF.pdf', '--ranges', 'even,odd',
+                                          '--out', self.out_pattern])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual([self._num_pages(i) for i in range(2)], [2, 1])
+
+    def test_burst_ranges_out_of_range(self):
+        result = self.runner.invoke(cli, ['burst', 'test_files/MultiPagePDF.pdf', '--ranges', '0-5',
+                                          '--out', self.out_pattern])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_burst_bad_pattern(self):
+        result = self.runner.invoke(cli, ['burst', 'test_files/MultiPagePDF.pdf', '--out', 'out.pdf'])
+        self.assertEqual(result.exit_code, 2)
+
+
 class TestRotate(BasePDFCLITestCase):
     def test_rotate_clockwise(self):
         result = self.runner.invoke(cli, ['rotate', 'test_files/MultiPagePDF.pdf', 'clockwise'])
@@ -205,11 +515,158 @@ class TestRotate(BasePDFCLITestCase):
         self.assertEqual(result.exit_code, 0)
         self.assertTrue(os.path.exists('out.pdf'))
 
+    def test_rotate_incremental(self):
+        result = self.runner.invoke(cli, ['rotate', 'test_files/MultiPagePDF.pdf', 'clockwise', '--incremental'])
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/MultiPagePDF.pdf', 'rb') as source_fp, open('out.pdf', 'rb') as reader_fp:
+            source = source_fp.read()
+            self.assertEqual(reader_fp.read(len(source)), source)
+            reader_fp.seek(0)
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            self.assertEqual(pdf.numPages, 3)
+            self.assertEqual([pdf.getPage(i)['/Rotate'] for i in range(3)], [90, 90, 90])
+
+    def test_rotate_incremental_xref_stream(self):
+        result = self.runner.invoke(cli, ['merge', '--xref-stream', '--out', 'out1.pdf', 'test_files/MultiPagePDF.pdf',
+                                          'test_files/PDF1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['rotate', 'out1.pdf', 'clockwise', '--incremental'])
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['reorder', 'out.pdf', '--reverse', '--incremental', '--out', 'out2.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        with open('out2.pdf', 'rb') as reader_fp:
+            tail = reader_fp.read()[-400:]
+            self.assertIn(b'/Type /XRef', tail)
+            self.assertNotIn(b'trailer', tail)
+            reader_fp.seek(0)
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            self.assertEqual(pdf.numPages, 4)
+            self.assertEqual([pdf.getPage(i)['/Rotate'] for i in range(4)], [90, 90, 90, 90])
+
+    def test_rotate_incremental_encrypted(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'test_key',
+                                          '--out', 'out1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['rotate', 'out1.pdf', 'clockwise', '--key', 'test_key', '--incremental'])
+        self.assertEqual(result.exit_code, 2)
+
     def test_rotate_bad_file(self):
         result = self.runner.invoke(cli, ['rotate', 'test_files.test.txt', 'clockwise'])
         self.assertEqual(result.exit_code, 2)
 
 
+class TestCompress(BasePDFCLITestCase):
+    def setUp(self):
+        super(TestCompress, self).setUp()
+        # A three page PDF whose content streams are stored uncompressed.
+        pdf_writer = PyPDF2.PdfFileWriter()
+        for index in range(3):
+            page = pdf_writer.addBlankPage(200, 200)
+            contents = PyPDF2.generic.StreamObject()
+            contents._data = b'0 0 m 200 200 l S\n' * 500 + b'%d 0 0 rg\n' % index
+            page[PyPDF2.generic.NameObject('/Contents')] = pdf_writer._addObject(contents)
+        with open('out1.pdf', 'wb') as pdf_writer_fp:
+            pdf_writer.write(pdf_writer_fp)
+
+    def test_compress(self):
+        result = self.runner.invoke(cli, ['compress', 'out1.pdf', '--level', '6', '--workers', '2'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertLess(os.path.getsize('out.pdf'), os.path.getsize('out1.pdf') / 10)
+        with open('out.pdf', 'rb') as reader_fp:
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            self.assertEqual(pdf.numPages, 3)
+            contents = pdf.getPage(2)['/Contents'].getObject()
+            self.assertEqual(contents['/Filter'], '/FlateDecode')
+            self.assertTrue(contents.getData().endswith(b'2 0 0 rg\n'))
+
+    def test_compress_option(self):
+        result = self.runner.invoke(cli, ['rotate', 'out1.pdf', 'clockwise', '--compress', '1'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertLess(os.path.getsize('out.pdf'), os.path.getsize('out1.pdf') / 10)
+        with open('out.pdf', 'rb') as reader_fp:
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            self.assertEqual([pdf.getPage(i)['/Rotate'] for i in range(3)], [90, 90, 90])
+
+    def test_compress_classic_xref(self):
+        result = self.runner.invoke(cli, ['compress', 'out1.pdf', '--no-xref-stream'])
+        self.assertEqual(result.exit_code, 0)
+        with open('out.pdf', 'rb') as reader_fp:
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            self.assertFalse(pdf.xref_objStm)
+            self.assertEqual(pdf.numPages, 3)
+
+    def test_compress_incremental(self):
+        result = self.runner.invoke(cli, ['rotate', 'out1.pdf', 'clockwise', '--compress', '1', '--incremental'])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_compress_bad_level(self):
+        result = self.runner.invoke(cli, ['compress', 'out1.pdf', '--level', '10'])
+        self.assertEqual(result.exit_code, 2)
+
+
+class TestLinearize(BasePDFCLITestCase):
+    def read_linearization(self, path):
+        with open(path, 'rb') as reader_fp:
+            data = reader_fp.read()
+            reader_fp.seek(0)
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            linearization = PyPDF2.generic.readObject(io.BytesIO(data[data.index(b'<<'):]), pdf)
+            pages = [pdf.getPage(index) for index in range(pdf.numPages)]
+            numbers = [page.indirectRef.idnum for page in pages]
+            return data, linearization, numbers, [page.extractText() for page in pages]
+
+    def test_linearize(self):
+        result = self.runner.invoke(cli, ['linearize', 'test_files/MultiPagePDF.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        data, linearization, numbers, texts = self.read_linearization('out.pdf')
+        self.assertEqual(linearization['/Linearized'], 1)
+        self.assertEqual(linearization['/L'], len(data))
+        self.assertEqual(linearization['/N'], 3)
+        self.assertEqual(linearization['/O'], numbers[0])
+        hint_offset, hint_length = linearization['/H']
+        self.assertTrue(data[hint_offset + hint_length:].startswith(b'%d 0 obj' % linearization['/O']))
+        self.assertTrue(data[linearization['/T']:].startswith(b'\n0000000000 65535 f'))
+        self.assertEqual(linearization['/E'], data.index(b'\n%d 0 obj' % numbers[1]) + 1)
+        with open('test_files/MultiPagePDF.pdf', 'rb') as source_reader:
+            source_pdf = PyPDF2.PdfFileReader(source_reader)
+            self.assertEqual(texts, [source_pdf.getPage(index).extractText() for index in range(3)])
+
+    def test_linearize_option(self):
+        result = self.runner.invoke(cli, ['merge', '--linearize', '--out', 'test_files/out.pdf',
+                                          'test_files/PDF1.pdf', 'test_files/MultiPagePDF.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        data, linearization, numbers, texts = self.read_linearization('test_files/out.pdf')
+        self.assertEqual(linearization['/N'], 4)
+        self.assertEqual(len(texts), 4)
+
+    def test_linearize_xref_stream(self):
+        result = self.runner.invoke(cli, ['rotate', 'test_files/MultiPagePDF.pdf', 'clockwise', '--linearize',
+                                          '--xref-stream'])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_linearize_bad_file(self):
+        result = self.runner.invoke(cli, ['linearize', 'test_files/test.txt'])
+        self.assertEqual(result.exit_code, 2)
+
+
+class TestOptimize(BasePDFCLITestCase):
+    def test_optimize_duplicated_streams(self):
+        result = self.runner.invoke(cli, ['merge', '--stream', '--out', 'out1.pdf'] +
+                                    ['test_files/MultiPagePDF.pdf'] * 2)
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['optimize', 'out1.pdf', '--workers', '2'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertLess(os.path.getsize('out.pdf'), os.path.getsize('out1.pdf'))
+        with open('out.pdf', 'rb') as reader_fp:
+            pdf = PyPDF2.PdfFileReader(reader_fp)
+            self.assertEqual(pdf.numPages, 6)
+            self.assertEqual(pdf.getPage(3).extractText(), pdf.getPage(0).extractText())
+
+    def test_optimize_bad_file(self):
+        result = self.runner.invoke(cli, ['optimize', 'test_files/test.txt'])
+        self.assertEqual(result.exit_code, 2)
+
+
 class TestEncryptDecrypt(BasePDFCLITestCase):
     def test_encrypt(self):
         result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', "test_key"])
@@ -235,6 +692,57 @@ class TestEncryptDecrypt(BasePDFCLITestCase):
         # Cleanup
         os.remove("out2.pdf")
 
+    def test_encrypt_read_by_pypdf2(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'test_key',
+                                          '--workers', '2'])
+        self.assertEqual(result.exit_code, 0)
+        with open('out.pdf', 'rb') as reader_fp, open('test_files/MultiPagePDF.pdf', 'rb') as original_fp:
+            pdf_reader = PyPDF2.PdfFileReader(reader_fp)
+            self.assertTrue(pdf_reader.decrypt('test_key'))
+            original = PyPDF2.PdfFileReader(original_fp)
+            self.assertEqual([page.extractText() for page in pdf_reader.pages],
+                             [page.extractText() for page in original.pages])
+
+    def test_decrypt_wrong_key(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'test_key'])
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['decrypt', 'out.pdf', '--out', 'out2.pdf', '--key', 'wrong_key'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('The key does not decrypt the PDF File', result.output)
+
+    def test_decrypt_without_cryptography(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'test_key'])
+        self.assertEqual(result.exit_code, 0)
+        with mock.patch('pdfcli.Cipher', None):
+            result = self.runner.invoke(cli, ['decrypt', 'out.pdf', '--out', 'out2.pdf', '--key', 'test_key',
+                                              '--workers', '2'])
+        self.assertEqual(result.exit_code, 0)
+        with open('out2.pdf', 'rb') as reader_fp:
+            self.assertEqual(PyPDF2.PdfFileReader(reader_fp).getNumPages(), 3)
+        os.remove('out2.pdf')
+
+    @unittest.skipIf(pdfcli.Cipher is None, "cryptography is not installed")
+    def test_encrypt_decrypt_aes(self):
+        for algorithm in ('aes-128', 'aes-256'):
+            result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'test_key',
+                                              '--algorithm', algorithm, '--xref-stream'])
+            self.assertEqual(result.exit_code, 0)
+            result = self.runner.invoke(cli, ['decrypt', 'out.pdf', '--out', 'out2.pdf', '--key', 'test_key'])
+            self.assertEqual(result.exit_code, 0)
+            with open('out2.pdf', 'rb') as reader_fp, open('test_files/MultiPagePDF.pdf', 'rb') as original_fp:
+                pdf_reader = PyPDF2.PdfFileReader(reader_fp)
+                self.assertFalse(pdf_reader.isEncrypted)
+                original = PyPDF2.PdfFileReader(original_fp)
+                self.assertEqual([page.extractText() for page in pdf_reader.pages],
+                                 [page.extractText() for page in original.pages])
+        os.remove('out2.pdf')
+
+    def test_encrypt_aes_without_cryptography(self):
+        with mock.patch('pdfcli.Cipher', None):
+            result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'test_key',
+                                              '--algorithm', 'aes-256'])
+        self.assertEqual(result.exit_code, 2)
+
     def test_decrypt_bad_file(self):
         result = self.runner.invoke(cli, ['encrypt', 'test_files/test.txt', '--key', "test_key"])
         self.assertEqual(result.exit_code, 2)
@@ -244,11 +752,562 @@ class TestEncryptDecrypt(BasePDFCLITestCase):
         self.assertEqual(result.exit_code, 2)
 
 
+class TestRekey(BasePDFCLITestCase):
+    def setUp(self):
+        super(TestRekey, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, 'sub'))
+        for name in ('a.pdf', os.path.join('sub', 'b.pdf')):
+            result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'old_key',
+                                              '--out', os.path.join(self.directory, name)])
+            self.assertEqual(result.exit_code, 0)
+
+    def tearDown(self):
+        super(TestRekey, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def assertKey(self, path, key):
+        with open(path, 'rb') as reader_fp:
+            pdf_reader = PyPDF2.PdfFileReader(reader_fp)
+            self.assertTrue(pdf_reader.decrypt(key))
+            self.assertEqual(pdf_reader.getNumPages(), 3)
+
+    def test_rekey_in_place(self):
+        path = os.path.join(self.directory, 'a.pdf')
+        result = self.runner.invoke(cli, ['rekey', path], env={'PDFCLI_KEY': 'old_key', 'PDFCLI_NEW_KEY': 'new_key'})
+        self.assertEqual(result.exit_code, 0)
+        self.assertKey(path, 'new_key')
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a.pdf', 'sub'])
+
+    def test_rekey_keeps_permissions(self):
+        path = os.path.join(self.directory, 'a.pdf')
+        os.chmod(path, 0o644)
+        result = self.runner.invoke(cli, ['rekey', path, '--key', 'old_key', '--new-key', 'new_key'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertKey(path, 'new_key')
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+
+    def test_rekey_directory(self):
+        out_dir = os.path.join(self.directory, 'out')
+        result = self.runner.invoke(cli, ['rekey', self.directory, '--out-dir', out_dir, '--workers', '2',
+                                          '--key', 'old_key', '--new-key', 'new_key'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('2 succeeded, 0 failed', result.output)
+        self.assertKey(os.path.join(out_dir, 'a.pdf'), 'new_key')
+        self.assertKey(os.path.join(out_dir, 'sub', 'b.pdf'), 'new_key')
+        self.assertKey(os.path.join(self.directory, 'a.pdf'), 'old_key')
+
+    def test_rekey_wrong_key(self):
+        path = os.path.join(self.directory, 'a.pdf')
+        result = self.runner.invoke(cli, ['rekey', path, '--key', 'wrong_key', '--new-key', 'new_key'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('0 succeeded, 1 failed', result.output)
+        self.assertKey(path, 'old_key')
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a.pdf', 'sub'])
+
+    @unittest.skipIf(pdfcli.Cipher is None, "cryptography is not installed")
+    def test_rekey_algorithm(self):
+        path = os.path.join(self.directory, 'a.pdf')
+        result = self.runner.invoke(cli, ['rekey', path, '--key', 'old_key', '--new-key', 'new_key',
+                                          '--algorithm', 'aes-256'])
+        self.assertEqual(result.exit_code, 0)
+        with open(path, 'rb') as reader_fp:
+            self.assertIn(b'/V 5', reader_fp.read())
+        result = self.runner.invoke(cli, ['decrypt', path, '--key', 'new_key', '--out', 'out.pdf'])
+        self.assertEqual(result.exit_code, 0)
+
+
+class TestRun(BasePDFCLITestCase):
+    def read_texts(self, path):
+        with open(path, 'rb') as reader_fp:
+            pdf_reader = PyPDF2.PdfFileReader(reader_fp)
+            return [(page.get('/Rotate', 0), page.extractText()) for page in pdf_reader.pages]
+
+    def test_run_steps(self):
+        original = self.read_texts('test_files/MultiPagePDF.pdf')
+        with mock.patch('pdfcli.get_pdf_reader', wraps=pdfcli.get_pdf_reader) as get_pdf_reader:
+            result = self.runner.invoke(cli, ['run', 'test_files/MultiPagePDF.pdf', 'delete=0', 'rotate=clockwise',
+                                              'reorder=reverse', 'compress=6'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(get_pdf_reader.call_count, 1)
+        self.assertIn('Ran 4 steps', result.output)
+        self.assertEqual(self.read_texts('out.pdf'), [(90, original[2][1]), (90, original[1][1])])
+
+    def test_run_json_spec(self):
+        with open('spec.json', 'w') as spec_fp:
+            json.dump({'steps': [{'reorder': '2,0'}, 'rotate=counter-clockwise'], 'comment': 'ignored'}, spec_fp)
+        result = self.runner.invoke(cli, ['run', 'test_files/MultiPagePDF.pdf', '--spec', 'spec.json', 'delete=1'])
+        self.assertEqual(result.exit_code, 0)
+        original = self.read_texts('test_files/MultiPagePDF.pdf')
+        self.assertEqual(self.read_texts('out.pdf'), [(270, original[2][1])])
+        os.remove('spec.json')
+
+    @unittest.skipIf(pdfcli.yaml is None, "PyYAML is not installed")
+    def test_run_yaml_spec(self):
+        with open('spec.yaml', 'w') as spec_fp:
+            spec_fp.write("- delete: 0-1\n- xref-stream\n- encrypt: rc4-128\n")
+        result = self.runner.invoke(cli, ['run', 'test_files/MultiPagePDF.pdf', '--spec', 'spec.yaml',
+                                          '--new-key', 'test_key'])
+        self.assertEqual(result.exit_code, 0)
+        with open('out.pdf', 'rb') as reader_fp:
+            pdf_reader = PyPDF2.PdfFileReader(reader_fp)
+            self.assertTrue(pdf_reader.decrypt('test_key'))
+            self.assertEqual(pdf_reader.getNumPages(), 1)
+        os.remove('spec.yaml')
+
+    def test_run_encrypted_input(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'test_key',
+                                          '--out', 'out1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['run', 'out1.pdf', 'delete=odd', '--key', 'test_key'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(len(self.read_texts('out.pdf')), 2)
+
+    def test_run_bad_steps(self):
+        for steps in (['explode'], ['delete=3'], ['rotate=upside-down'], ['encrypt'], ['compress=12'], []):
+            result = self.runner.invoke(cli, ['run', 'test_files/MultiPagePDF.pdf'] + steps)
+            self.assertEqual(result.exit_code, 2, steps)
+
+
+class TestStandardStreams(BasePDFCLITestCase):
+    def setUp(self):
+        super(TestStandardStreams, self).setUp()
+        self.runner = CliRunner(mix_stderr=False)
+        with open('test_files/MultiPagePDF.pdf', 'rb') as pdf_fp:
+            self.pdf_bytes = pdf_fp.read()
+
+    def test_pipeline(self):
+        result = self.runner.invoke(cli, ['delete', '-', '0', '--out', '-'], input=self.pdf_bytes)
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue(result.stdout_bytes.startswith(b'%PDF'))
+        self.assertIn('created new PDF at -', result.stderr)
+        result = self.runner.invoke(cli, ['rotate', '-', 'clockwise', '--out', '-'], input=result.stdout_bytes)
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['encrypt', '-', '--key', 'test_key', '--out', '-'],
+                                    input=result.stdout_bytes)
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['decrypt', '-', '--key', 'test_key', '--out', '-'],
+                                    input=result.stdout_bytes)
+        self.assertEqual(result.exit_code, 0)
+
+        pdf_reader = PyPDF2.PdfFileReader(io.BytesIO(result.stdout_bytes))
+        self.assertEqual(pdf_reader.getNumPages(), 2)
+        self.assertEqual(pdf_reader.getPage(0)['/Rotate'], 90)
+
+    def test_merge_stdin_and_file(self):
+        result = self.runner.invoke(cli, ['merge', '-', 'test_files/PDF1.pdf', '--out', 'out.pdf'],
+                                    input=self.pdf_bytes)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Merged files', result.stdout)
+        with open('out.pdf', 'rb') as reader_fp:
+            self.assertEqual(PyPDF2.PdfFileReader(reader_fp).getNumPages(), 4)
+
+    def test_info_stdin(self):
+        result = self.runner.invoke(cli, ['info', '--format', 'ndjson', '-'], input=self.pdf_bytes)
+        self.assertEqual(result.exit_code, 0)
+        record = json.loads(result.stdout)
+        self.assertEqual(record['file_size'], len(self.pdf_bytes))
+        self.assertEqual(record['pages'], 3)
+
+    def test_split_both_stdout(self):
+        result = self.runner.invoke(cli, ['split', '-', '1', '--out-first', '-', '--out-second', '-'],
+                                    input=self.pdf_bytes)
+        self.assertEqual(result.exit_code, 2)
+
+    def test_incremental_stdout(self):
+        result = self.runner.invoke(cli, ['rotate', 'test_files/MultiPagePDF.pdf', 'clockwise', '--incremental',
+                                          '--out', '-'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue(result.stdout_bytes.startswith(self.pdf_bytes))
+        self.assertEqual(PyPDF2.PdfFileReader(io.BytesIO(result.stdout_bytes)).getPage(0)['/Rotate'], 90)
+
+
+class TestStats(BasePDFCLITestCase):
+    def setUp(self):
+        super(TestStats, self).setUp()
+        self.runner = CliRunner(mix_stderr=False)
+
+    def test_stats_json(self):
+        result = self.runner.invoke(cli, ['--stats', '--stats-format', 'json', 'rotate', 'test_files/MultiPagePDF.pdf',
+                                          'clockwise', '--out', 'out.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        report = json.loads(result.stderr)
+        self.assertEqual(list(report['phases']), ['parse', 'copy', 'write'])
+        self.assertEqual(report['inputs'], 1)
+        self.assertEqual(report['bytes_read'], os.path.getsize('test_files/MultiPagePDF.pdf'))
+        self.assertEqual(report['bytes_written'], os.path.getsize('out.pdf'))
+        self.assertEqual(report['pages_written'], 3)
+        self.assertGreater(report['objects_written'], 3)
+        self.assertIsNone(pdfcli._STATS)
+
+    def test_stats_stdout(self):
+        result = self.runner.invoke(cli, ['--stats', 'delete', 'test_files/MultiPagePDF.pdf', '0', '--out', '-'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue(result.stdout_bytes.startswith(b'%PDF'))
+        self.assertIn('bytes written         %d' % len(result.stdout_bytes), result.stderr)
+        self.assertIn('pages written         2', result.stderr)
+
+    def test_stats_info(self):
+        for args in (['info', '--pages'], ['info', '--format', 'json']):
+            result = self.runner.invoke(cli, ['--stats', '--stats-format', 'json'] + args + TEST_PDF_PATHS[:2])
+            self.assertEqual(result.exit_code, 0)
+            report = json.loads(result.stderr)
+            self.assertEqual(report['inputs'], 2)
+            self.assertEqual(report['bytes_read'], sum(os.path.getsize(path) for path in TEST_PDF_PATHS[:2]))
+            self.assertGreater(report['objects_read'], 0)
+            self.assertGreater(report['phases']['parse'], 0)
+
+    def test_profile(self):
+        profile = os.path.join(tempfile.mkdtemp(), 'pdfcli.prof')
+        result = self.runner.invoke(cli, ['--profile', profile, 'info', 'test_files/PDF1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Profile written to %s' % profile, result.stderr)
+        self.assertIn('Title:', result.stdout)
+        self.assertTrue(os.path.getsize(profile) > 0)
+        shutil.rmtree(os.path.dirname(profile))
+
+
+class TestBatch(BasePDFCLITestCase):
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestBatch, self).tearDown()
+        shutil.rmtree(self.out_dir)
+
+    def test_batch_glob(self):
+        result = self.runner.invoke(cli, ['batch', 'test_files/PDF*.pdf', '--command', 'rotate',
+                                          '-p', 'direction=clockwise', '--out-dir', self.out_dir, '--workers', '2'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(sorted(os.listdir(self.out_dir)), TEST_PDF_FILENAMES)
+        self.assertIn('3 succeeded, 0 failed', result.output)
+
+    def test_batch_directory(self):
+        result = self.runner.invoke(cli, ['batch', 'test_files', '--command', 'delete', '-p', 'delete=2',
+                                          '--out-dir', self.out_dir, '--workers', '1'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('[failed] delete test_files/PDF1.pdf', result.output)
+        with open(os.path.join(self.out_dir, 'MultiPagePDF.pdf'), 'rb') as reader_fp:
+            self.assertEqual(PyPDF2.PdfFileReader(reader_fp).numPages, 2)
+
+    def test_batch_directory_tree(self):
+        source = os.path.join(self.out_dir, 'source')
+        os.makedirs(os.path.join(source, 'sub'))
+        for path in ('a.pdf', os.path.join('sub', 'a.pdf')):
+            shutil.copy('test_files/MultiPagePDF.pdf', os.path.join(source, path))
+        for command in ('compress', 'merge', 'linearize', 'optimize'):
+            out_dir = os.path.join(self.out_dir, command)
+            result = self.runner.invoke(cli, ['batch', source, '--command', command, '--out-dir', out_dir,
+                                              '--workers', '1'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn('2 succeeded, 0 failed', result.output)
+            for path in ('a.pdf', os.path.join('sub', 'a.pdf')):
+                with open(os.path.join(out_dir, path), 'rb') as reader_fp:
+                    self.assertEqual(PyPDF2.PdfFileReader(reader_fp).numPages, 3)
+
+    def test_batch_rekey(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'old_key', '--out',
+                                          os.path.join(self.out_dir, 'a.pdf')])
+        self.assertEqual(result.exit_code, 0)
+        out_dir = os.path.join(self.out_dir, 'rekeyed')
+        result = self.runner.invoke(cli, ['batch', os.path.join(self.out_dir, '*.pdf'), '--command', 'rekey',
+                                          '--key', 'old_key', '-p', 'new_key=new_key', '--out-dir', out_dir])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(os.path.join(out_dir, 'a.pdf'), 'rb') as reader_fp:
+            self.assertTrue(PyPDF2.PdfFileReader(reader_fp).decrypt('new_key'))
+
+    def test_batch_manifest(self):
+        manifest = os.path.join(self.out_dir, 'jobs.jsonl')
+        merged = os.path.join(self.out_dir, 'merged.pdf')
+        reordered = os.path.join(self.out_dir, 'reordered.pdf')
+        with open(manifest, 'w') as manifest_fp:
+            manifest_fp.write(json.dumps({'command': 'merge', 'files': TEST_PDF_PATHS, 'out': merged}) + '\n')
+            manifest_fp.write(json.dumps({'command': 'reorder', 'file': 'test_files/MultiPagePDF.pdf',
+                                          'reverse': True, 'order': None, 'out': reordered}) + '\n')
+        result = self.runner.invoke(cli, ['batch', manifest, '--workers', '1'])
+        self.assertEqual(result.exit_code, 0)
+        with open(merged, 'rb') as reader_fp:
+            self.assertEqual(PyPDF2.PdfFileReader(reader_fp).numPages, 3)
+        self.assertTrue(os.path.exists(reordered))
+
+    def test_batch_missing_out_dir(self):
+        result = self.runner.invoke(cli, ['batch', 'test_files/PDF*.pdf', '--command', 'rotate'])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_batch_no_match(self):
+        result = self.runner.invoke(cli, ['batch', 'test_files/*.nothing', '--command', 'info'])
+        self.assertEqual(result.exit_code, 2)
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), "serve requires Unix domain sockets")
+class TestServe(BasePDFCLITestCase):
+    def setUp(self):
+        super(TestServe, self).setUp()
+        self.socket_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.socket_dir, 'pdfcli.sock')
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+        self.server = pdfcli._make_server(self.socket_path, self.executor)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+
+    def tearDown(self):
+        super(TestServe, self).tearDown()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+        self.executor.shutdown()
+        shutil.rmtree(self.socket_dir)
+
+    def test_remote_rotate(self):
+        result = self.runner.invoke(cli, ['--remote', self.socket_path, 'rotate', 'test_files/MultiPagePDF.pdf',
+                                          'clockwise', '--out', 'test_files/out.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Pages were rotated clockwise successfully', result.output)
+        with open('test_files/out.pdf', 'rb') as reader_fp:
+            self.assertEqual(PyPDF2.PdfFileReader(reader_fp).getPage(0).get('/Rotate'), 90)
+
+    def test_remote_merge(self):
+        result = self.runner.invoke(cli, ['--remote', self.socket_path, 'merge', '--out', 'test_files/out.pdf']
+                                    + TEST_PDF_PATHS)
+        self.assertEqual(result.exit_code, 0)
+        with open('test_files/out.pdf', 'rb') as reader_fp:
+            self.assertEqual(PyPDF2.PdfFileReader(reader_fp).numPages, 3)
+
+    def test_remote_global_options(self):
+        cache_dir = os.path.join(self.socket_dir, 'cache')
+        result = self.runner.invoke(cli, ['--remote', self.socket_path, '--cache', '--cache-dir', cache_dir, 'delete',
+                                          'test_files/MultiPagePDF.pdf', '0', '--out', 'test_files/out.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_remote_bad_options(self):
+        response = pdfcli._remote_call(self.socket_path, {'command': 'info', 'files': ['test_files/PDF1.pdf'],
+                                                          'options': {'remote': 'elsewhere'}})
+        self.assertIn('Bad request', response['error'])
+
+    def test_remote_rekey_out_dir(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'old_key', '--out',
+                                          'out1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        out_dir = os.path.relpath(os.path.join(self.socket_dir, 'rekeyed'))
+        with mock.patch('pdfcli._remote_call', wraps=pdfcli._remote_call) as remote_call:
+            result = self.runner.invoke(cli, ['--remote', self.socket_path, 'rekey', 'out1.pdf', '--key', 'old_key',
+                                              '--new-key', 'new_key', '--out-dir', out_dir])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(remote_call.call_args[0][1]['out_dir'], os.path.abspath(out_dir))
+        with open(os.path.join(out_dir, 'out1.pdf'), 'rb') as reader_fp:
+            self.assertTrue(PyPDF2.PdfFileReader(reader_fp).decrypt('new_key'))
+
+    def test_remote_stats(self):
+        for option in (['--stats'], ['--profile', os.path.join(self.socket_dir, 'pdfcli.prof')]):
+            result = self.runner.invoke(cli, ['--remote', self.socket_path] + option + ['info', 'test_files/PDF1.pdf'])
+            self.assertEqual(result.exit_code, 2)
+            self.assertIn('cannot be used with --remote', result.output)
+
+    def test_remote_error(self):
+        result = self.runner.invoke(cli, ['--remote', self.socket_path, 'split', 'test_files/MultiPagePDF.pdf', '10'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('split index must be less than the number of pages', result.output)
+
+    def test_remote_not_running(self):
+        result = self.runner.invoke(cli, ['--remote', os.path.join(self.socket_dir, 'missing.sock'), 'info',
+                                          'test_files/PDF1.pdf'])
+        self.assertEqual(result.exit_code, 1)
+
+
 class TestInfo(BasePDFCLITestCase):
     def test_info(self):
         result = self.runner.invoke(cli, ['info', 'test_files/MultiPagePDF.pdf'])
         self.assertEqual(result.exit_code, 0)
 
+    def test_info_quick_path_matches_reader(self):
+        for path in TEST_PDF_PATHS + ['test_files/MultiPagePDF.pdf']:
+            with open(path, 'rb') as pdf_fp:
+                pdf_reader = PyPDF2.PdfFileReader(pdf_fp)
+                document_info = pdf_reader.getDocumentInfo()
+                expected = [(key, str(document_info[key])) for key in document_info.keys()]
+                expected.append(('/Pages', str(pdf_reader.getNumPages())))
+                self.assertEqual(pdfcli._quick_info(pdf_fp, count_pages=True), expected)
+
+    def test_info_quick_path_skips_reader(self):
+        with mock.patch.object(PyPDF2.PdfFileReader, 'read', autospec=True) as read:
+            result = self.runner.invoke(cli, ['info', 'test_files/PDF1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(read.call_count, 0)
+        self.assertIn('Title: Microsoft Word - Document1', result.output)
+
+    def test_info_encrypted_falls_back(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'test_key'])
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['info', 'out.pdf', '--pages', '--key', 'test_key'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Pages: 3', result.output)
+
+    def test_info_many_files_parallel(self):
+        result = self.runner.invoke(cli, ['info', '--pages', '--workers', '2'] + TEST_PDF_PATHS)
+        self.assertEqual(result.exit_code, 0)
+        for path in TEST_PDF_PATHS:
+            self.assertIn('==> %s <==' % path, result.output)
+        self.assertEqual(result.output.count('Pages: 1'), 3)
+
+    def test_info_ndjson_directory(self):
+        result = self.runner.invoke(cli, ['info', '--format', 'ndjson', '--workers', '2', 'test_files'])
+        self.assertEqual(result.exit_code, 0)
+        records = dict((record['file'], record) for record in map(json.loads, result.output.splitlines()))
+        self.assertEqual(sorted(records), sorted(TEST_PDF_PATHS + ['test_files/MultiPagePDF.pdf']))
+        record = records['test_files/MultiPagePDF.pdf']
+        self.assertEqual(record['pages'], 3)
+        self.assertEqual(record['page_sizes'], [[612, 792]])
+        self.assertEqual(record['version'], '1.3')
+        self.assertEqual(record['file_size'], os.path.getsize('test_files/MultiPagePDF.pdf'))
+        self.assertFalse(record['encrypted'])
+        self.assertEqual(record['info']['Title'], 'Microsoft Word - Document2')
+
+    def test_info_json_reports_errors(self):
+        result = self.runner.invoke(cli, ['info', '--format', 'json', 'test_files/PDF1.pdf', 'test_files/test.txt'])
+        self.assertEqual(result.exit_code, 0)
+        records = json.loads(result.output)
+        self.assertIsNone(records[0]['error'])
+        self.assertIn('could not be recognized', records[1]['error'])
+
+    def test_info_json_page_tree_cycle(self):
+        objects = [b'<< /Type /Catalog /Pages 2 0 R >>', b'<< /Type /Pages /Kids [3 0 R 2 0 R] /Count 2 >>',
+                   b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>']
+        data = b'%PDF-1.4\n'
+        offsets = []
+        for number, obj in enumerate(objects, 1):
+            offsets.append(len(data))
+            data += b'%d 0 obj\n%s\nendobj\n' % (number, obj)
+        xref = b'xref\n0 4\n0000000000 65535 f \n' + b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+        data += xref + b'trailer\n<< /Size 4 /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % len(data)
+        with open('out.pdf', 'wb') as pdf_fp:
+            pdf_fp.write(data)
+        with open('out.pdf', 'rb') as pdf_fp:
+            self.assertIsNone(pdfcli._quick_info_record(pdf_fp))
+        result = self.runner.invoke(cli, ['info', '--format', 'json', 'out.pdf', 'test_files/PDF1.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        records = json.loads(result.output)
+        self.assertIsNotNone(records[0]['error'])
+        self.assertIsNone(records[1]['error'])
+
+    def test_info_json_encrypted(self):
+        result = self.runner.invoke(cli, ['encrypt', 'test_files/MultiPagePDF.pdf', '--key', 'test_key'])
+        self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(cli, ['info', '--format', 'json', '--key', 'test_key', 'out.pdf'])
+        self.assertEqual(result.exit_code, 0)
+        record = json.loads(result.output)[0]
+        self.assertTrue(record['encrypted'])
+        self.assertEqual(record['pages'], 3)
+
+    def test_info_csv(self):
+        result = self.runner.invoke(cli, ['info', '--format', 'csv'] + TEST_PDF_PATHS)
+        self.assertEqual(result.exit_code, 0)
+        rows = list(csv.DictReader(io.StringIO(result.output)))
+        self.assertEqual([row['file'] for row in rows], TEST_PDF_PATHS)
+        self.assertEqual(rows[0]['page_sizes'], '612x792')
+
+    def test_info_bad_file(self):
+        result = self.runner.invoke(cli, ['info', 'test_files/test.txt'])
+        self.assertEqual(result.exit_code, 2)
+
+
+
+class TestApi(BasePDFCLITestCase):
+    def setUp(self):
+        super(TestApi, self).setUp()
+        with open('test_files/MultiPagePDF.pdf', 'rb') as pdf_fp:
+            self.pdf_bytes = pdf_fp.read()
+
+    def num_pages(self, data):
+        return PyPDF2.PdfFileReader(io.BytesIO(data)).getNumPages()
+
+    def test_merge_sources(self):
+        with open('test_files/PDF1.pdf', 'rb') as pdf_fp:
+            data = pdfcli_api.merge([self.pdf_bytes, 'test_files/PDF2.pdf', pdf_fp, memoryview(self.pdf_bytes)])
+        self.assertEqual(self.num_pages(data), 8)
+
+    def test_split(self):
+        first, second = pdfcli_api.split(self.pdf_bytes, '0,1-2')
+        self.assertEqual(self.num_pages(first), 1)
+        self.assertEqual(self.num_pages(second), 2)
+        reordered, = pdfcli_api.split(self.pdf_bytes, [[2, 0]])
+        self.assertEqual(self.num_pages(reordered), 2)
+
+    def test_outputs(self):
+        self.assertIsNone(pdfcli_api.rotate(self.pdf_bytes, out='out.pdf'))
+        with open('out.pdf', 'rb') as pdf_fp:
+            self.assertEqual(PyPDF2.PdfFileReader(pdf_fp).getPage(0)['/Rotate'], 90)
+        out = io.BytesIO()
+        self.assertIsNone(pdfcli_api.delete(self.pdf_bytes, [0, 1], out=out))
+        self.assertEqual(self.num_pages(out.getvalue()), 1)
+
+    def test_in_memory(self):
+        encrypted = pdfcli_api.encrypt(bytearray(self.pdf_bytes), 'test_key')
+        calls = [(pdfcli_api.merge, [[self.pdf_bytes, bytearray(self.pdf_bytes)]]),
+                 (pdfcli_api.delete, [self.pdf_bytes, '0']), (pdfcli_api.reorder, [self.pdf_bytes, '2,1,0']),
+                 (pdfcli_api.rotate, [self.pdf_bytes]), (pdfcli_api.optimize, [self.pdf_bytes]),
+                 (pdfcli_api.compress, [self.pdf_bytes]), (pdfcli_api.linearize, [self.pdf_bytes]),
+                 (pdfcli_api.decrypt, [encrypted, 'test_key']), (pdfcli_api.rekey, [encrypted, 'test_key', 'new']),
+                 (pdfcli_api.run, [self.pdf_bytes, ['rotate=clockwise']])]
+        with mock.patch('tempfile.NamedTemporaryFile') as named_temporary_file, \
+                mock.patch('tempfile.mkstemp') as mkstemp:
+            for function, args in calls:
+                view = memoryview(bytes(args[0])) if isinstance(args[0], bytes) else args[0]
+                out = bytearray()
+                self.assertIsNone(function(view, *args[1:], out=out))
+                pages = pdfcli_api.info(out, key=['test_key', 'new'])['pages']
+                self.assertEqual(pages, pdfcli_api.info(function(*args), key=['test_key', 'new'])['pages'])
+        named_temporary_file.assert_not_called()
+        mkstemp.assert_not_called()
+
+    def test_encrypt_decrypt(self):
+        encrypted = pdfcli_api.encrypt(self.pdf_bytes, 'test_key')
+        self.assertTrue(pdfcli_api.info(encrypted, key='test_key')['encrypted'])
+        rekeyed = pdfcli_api.rekey(encrypted, 'test_key', 'new_key')
+        decrypted = pdfcli_api.decrypt(rekeyed, ['test_key', 'new_key'])
+        self.assertFalse(pdfcli_api.info(decrypted)['encrypted'])
+        self.assertEqual(self.num_pages(decrypted), 3)
+
+    def test_run(self):
+        data = pdfcli_api.run(self.pdf_bytes, ['delete=0', {'rotate': 'clockwise'}])
+        self.assertEqual(self.num_pages(data), 2)
+
+    def test_info(self):
+        record = pdfcli_api.info('test_files/MultiPagePDF.pdf')
+        self.assertEqual(record['file'], 'test_files/MultiPagePDF.pdf')
+        self.assertEqual(record['pages'], 3)
+        self.assertNotIn('error', record)
+
+    def test_errors(self):
+        with self.assertRaises(pdfcli_api.PdfcliError):
+            pdfcli_api.delete(self.pdf_bytes, [3])
+        with self.assertRaises(pdfcli_api.PdfcliError):
+            pdfcli_api.rotate(b'not a pdf')
+        with self.assertRaises(TypeError):
+            pdfcli_api.rotate(42)
+
+    def test_nothing_echoed(self):
+        with mock.patch('click.echo') as echo:
+            pdfcli_api.rotate(self.pdf_bytes)
+        echo.assert_not_called()
+
+    def test_async(self):
+        async def rotate_all(runner):
+            async with runner:
+                return await asyncio.gather(*(pdfcli_api.rotate_async(self.pdf_bytes, runner=runner)
+                                              for _ in range(4)))
+        loop = asyncio.new_event_loop()
+        try:
+            for executor in (None, concurrent.futures.ThreadPoolExecutor(max_workers=2)):
+                results = loop.run_until_complete(rotate_all(pdfcli_api.AsyncRunner(2, executor)))
+                self.assertEqual([self.num_pages(data) for data in results], [3] * 4)
+            with self.assertRaises(pdfcli_api.PdfcliError):
+                loop.run_until_complete(pdfcli_api.delete_async(self.pdf_bytes, [3],
+                                                                runner=pdfcli_api.AsyncRunner(1, executor)))
+        finally:
+            loop.close()
+            executor.shutdown()
 
 if __name__ == '__main__':
     unittest.main()